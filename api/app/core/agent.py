@@ -1,25 +1,34 @@
 import os
 import re
+import time
+import uuid
+import base64
 import asyncio
 import httpx
 from typing import Optional
 from google import genai
 from google.genai import types
 from app.core.key_manager import key_rotator
-from app.core.github_auth import get_installation_access_token
-from app.core.repomix import get_repomix_script
-from app.core.event_bus import emit, emit_thought, emit_code_diff, emit_screenshot, emit_visual_analysis, EventType
+from app.core.github_auth import get_installation_access_token, get_http_client
+from app.core.repomix import get_repomix_script, unpack_repo_context, SCRIPT_PATH, ARCHIVE_PATH, OUTPUT_PATH
+from app.core.event_bus import emit, emit_many, emit_thought, emit_code_diff, emit_screenshot, emit_visual_analysis, EventType, HealingEvent, get_event_bus
 from app.core.visual_cortex import (
     run_visual_regression_check,
     analyze_screenshot_with_gemini,
-    get_playwright_setup_script
+    write_capture_script,
+    is_playwright_ready,
+    load_capture_screenshot,
+    decode_capture_output,
+    prewarm_visual_worker,
+    ensure_visual_worker,
+    PLAYWRIGHT_VERSION,
+    VISUAL_WORKER_SOCKET,
+    CAPTURE_COMMAND
 )
 
 MODEL_NAME = "gemini-3-flash-preview"
 MODEL_NAME_PRO = "gemini-2.5-pro-exp-03-25"  
 
-RETRY_ALLOWED_REPOS: set[str] = set()
-
 def parse_fix_from_response(response: str) -> dict:
     """
     Parses the structured response from Gemini to extract:
@@ -105,9 +114,13 @@ async def check_existing_talos_pr(
     Cost: 1 API request (FREE - within rate limits)
     """
     # Check if user has allowed retry for this repo
-    if repo_full_name in RETRY_ALLOWED_REPOS:
+    try:
+        retry_allowed = await (await get_event_bus()).take_retry_allowance(repo_full_name)
+    except Exception as e:
+        print(f"   Could not check retry allowance: {e}")
+        retry_allowed = False
+    if retry_allowed:
         print(f"   Retry allowed for {repo_full_name} - skipping duplicate check")
-        RETRY_ALLOWED_REPOS.discard(repo_full_name)  # Clear the flag after use
         return None  # Proceed with new PR
     
     url = f"https://api.github.com/repos/{repo_full_name}/pulls"
@@ -126,33 +139,33 @@ async def check_existing_talos_pr(
     }
     
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(url, headers=headers, params=params)
+        client = get_http_client()
+        response = await client.get(url, headers=headers, params=params)
+        
+        if response.status_code == 200:
+            prs = response.json()
             
-            if response.status_code == 200:
-                prs = response.json()
-                
-                # Look for TALOS-created PRs (branch starts with fix/talos-)
-                for pr in prs:
-                    head_ref = pr.get("head", {}).get("ref", "")
-                    body = pr.get("body", "")
-                    
-                    # Check if this is a TALOS PR
-                    if head_ref.startswith("fix/talos-") or "TALOS" in body:
-                        print(f"   Found existing TALOS PR: #{pr['number']} - {pr['title']}")
-                        return {
-                            "number": pr["number"],
-                            "url": pr["html_url"],
-                            "title": pr["title"],
-                            "branch": head_ref,
-                            "created_at": pr["created_at"]
-                        }
-                
-                return None  # No existing TALOS PR
-            else:
-                print(f"   Could not check PRs: {response.status_code}")
-                return None  # Proceed anyway if check fails
+            # Look for TALOS-created PRs (branch starts with fix/talos-)
+            for pr in prs:
+                head_ref = pr.get("head", {}).get("ref", "")
+                body = pr.get("body", "")
                 
+                # Check if this is a TALOS PR
+                if head_ref.startswith("fix/talos-") or "TALOS" in body:
+                    print(f"   Found existing TALOS PR: #{pr['number']} - {pr['title']}")
+                    return {
+                        "number": pr["number"],
+                        "url": pr["html_url"],
+                        "title": pr["title"],
+                        "branch": head_ref,
+                        "created_at": pr["created_at"]
+                    }
+            
+            return None  # No existing TALOS PR
+        else:
+            print(f"   Could not check PRs: {response.status_code}")
+            return None  # Proceed anyway if check fails
+            
     except Exception as e:
         print(f"   PR check error: {type(e).__name__}: {e!r}")
         return None  # Proceed anyway if check fails
@@ -199,21 +212,24 @@ async def create_pull_request(
     for attempt in range(1, max_attempts + 1):
         try:
             print(f"   PR creation attempt {attempt}/{max_attempts}...")
-            async with httpx.AsyncClient(timeout=httpx.Timeout(60.0, connect=30.0)) as client:
-                response = await client.post(url, headers=headers, json=payload)
+            client = get_http_client()
+            response = await client.post(
+                url, headers=headers, json=payload,
+                timeout=httpx.Timeout(60.0, connect=30.0)
+            )
+            
+            if response.status_code == 201:
+                pr_data = response.json()
+                return pr_data.get("html_url")
+            elif response.status_code == 422:
+              
+                error_text = response.text[:500] if response.text else "No response body"
+                print(f"   GitHub API Validation Error (no retry): {error_text}")
+                return None
+            else:
+                error_text = response.text[:500] if response.text else "No response body"
+                print(f"   GitHub API Error (attempt {attempt}): {response.status_code} - {error_text}")
                 
-                if response.status_code == 201:
-                    pr_data = response.json()
-                    return pr_data.get("html_url")
-                elif response.status_code == 422:
-                  
-                    error_text = response.text[:500] if response.text else "No response body"
-                    print(f"   GitHub API Validation Error (no retry): {error_text}")
-                    return None
-                else:
-                    error_text = response.text[:500] if response.text else "No response body"
-                    print(f"   GitHub API Error (attempt {attempt}): {response.status_code} - {error_text}")
-                    
         except httpx.TimeoutException as e:
             print(f"   PR Creation Timeout (attempt {attempt}): {type(e).__name__} after 60s")
         except httpx.ConnectError as e:
@@ -225,7 +241,6 @@ async def create_pull_request(
         if attempt < max_attempts:
             wait_time = 3 ** attempt
             print(f"   Retrying in {wait_time}s...")
-            import asyncio
             await asyncio.sleep(wait_time)
     
     print(f"   PR creation failed after {max_attempts} attempts")
@@ -434,7 +449,6 @@ async def run_healing_mission(payload: dict, run_id: str | None = None):
     """
    
     if run_id is None:
-        import uuid
         run_id = str(uuid.uuid4())[:8]
     
     repo_full_name = payload.get("repository", {}).get("full_name")
@@ -483,7 +497,7 @@ async def run_healing_mission(payload: dict, run_id: str | None = None):
         await emit(run_id, EventType.FAILURE, "Authentication Failed", str(e))
         return
 
-    from app.core.sandbox import TaskSandbox
+    from app.core.sandbox import TaskSandbox, E2B_TEMPLATE
     
     try:
         
@@ -513,6 +527,9 @@ async def run_healing_mission(payload: dict, run_id: str | None = None):
                 file_path = has_package_json['stdout'].strip()
                 work_dir = os.path.dirname(file_path) or "."
                 
+                # Browser launch overlaps with npm install and the test run instead of the visual phase
+                prewarm_visual_worker(box)
+                
                 # ENHANCED: Multi-phase validation for Node.js
                 pkg_content = box.read_file(file_path)
                 has_build = '"build"' in pkg_content
@@ -564,9 +581,16 @@ async def run_healing_mission(payload: dict, run_id: str | None = None):
             print("👁️ TALOS: Reading codebase...")
             await emit(run_id, EventType.READING_CODE, "Reading Codebase", "Assembling repository context with Repomix...")
             
-            box.write_file("repomix_script.py", get_repomix_script())
-            repo_context_result = box.run_command("python3 repomix_script.py")
-            repo_context = repo_context_result['stdout']
+            box.write_file_abs(SCRIPT_PATH, get_repomix_script())
+            repo_context_result = box.run_command(f"python3 {SCRIPT_PATH} {ARCHIVE_PATH}")
+            try:
+                if repo_context_result['exit_code'] != 0:
+                    raise RuntimeError(f"packer exited {repo_context_result['exit_code']}: {repo_context_result['stderr'][:500]}")
+                repo_context = unpack_repo_context(bytes(box.read_file_bytes(ARCHIVE_PATH)))
+            except Exception as e:
+                print(f"Repomix archive unavailable ({e}), falling back to plain XML")
+                box.run_command(f"python3 {SCRIPT_PATH} > {OUTPUT_PATH}")
+                repo_context = bytes(box.read_file_bytes(OUTPUT_PATH)).decode("utf-8", errors="replace")
             
             # --- PHASE B: THE PAIN SIGNAL ---
             print(f"TALOS: Reproducing error...")
@@ -1259,7 +1283,6 @@ npm run lint
                         use_build_fallback = False
                         needs_upgrade = False
                         try:
-                            import re
                             version_match = re.match(r'v?(\d+)\.(\d+)\.(\d+)', node_version)
                             if version_match:
                                 major, minor = int(version_match.group(1)), int(version_match.group(2))
@@ -1306,45 +1329,51 @@ npm run lint
                                   "Installing Chromium browser for screenshots (30-60s)...")
                         
                        
-                        # Step 1: Install the Python package
-                        pip_result = box.run_command("python3 -m pip install playwright", timeout=60)
-                        print(f"   pip install playwright: exit {pip_result['exit_code']}")
-                        pip_out = pip_result.get('stdout', '') + pip_result.get('stderr', '')
-                        print(f"   pip output: {pip_out[:200]}")
-                        if pip_result['exit_code'] != 0:
-                            await emit(run_id, EventType.ANALYZING, "Skipping Visual Capture", 
-                                      "pip install playwright failed")
-                            raise Exception(f"pip install playwright failed: {pip_out[:100]}")
+                        # Warm sandboxes already have the package and browser; skip the 30-60s install
+                        if is_playwright_ready(box):
+                            print("   Playwright already installed, skipping install")
+                        else:
+                            if E2B_TEMPLATE != "base":
+                                print(f"   WARNING: Playwright missing from template {E2B_TEMPLATE}, image is stale - installing")
+                            # Step 1: Install the Python package
+                            pip_result = box.run_command(f"python3 -m pip install playwright=={PLAYWRIGHT_VERSION}", timeout=60)
+                            print(f"   pip install playwright: exit {pip_result['exit_code']}")
+                            pip_out = pip_result.get('stdout', '') + pip_result.get('stderr', '')
+                            print(f"   pip output: {pip_out[:200]}")
+                            if pip_result['exit_code'] != 0:
+                                await emit(run_id, EventType.ANALYZING, "Skipping Visual Capture", 
+                                          "pip install playwright failed")
+                                raise Exception(f"pip install playwright failed: {pip_out[:100]}")
                         
-                        # Step 2: Install Chromium + system deps (apt packages)
-                        browser_result = box.run_command(
-                            "python3 -m playwright install --with-deps chromium",
-                            timeout=120
-                        )
-                        browser_out = browser_result.get('stdout', '') + browser_result.get('stderr', '')
-                        print(f"   playwright install chromium: exit {browser_result['exit_code']}")
-                        print(f"   browser output: {browser_out[:300]}")
-                        if browser_result['exit_code'] != 0:
-                            await emit(run_id, EventType.ANALYZING, "Skipping Visual Capture", 
-                                      f"Chromium install failed: {browser_out[:80]}")
-                            raise Exception(f"playwright install chromium failed: {browser_out[:100]}")
+                            # Step 2: Install Chromium + system deps (apt packages)
+                            browser_result = box.run_command(
+                                "python3 -m playwright install --with-deps chromium",
+                                timeout=120
+                            )
+                            browser_out = browser_result.get('stdout', '') + browser_result.get('stderr', '')
+                            print(f"   playwright install chromium: exit {browser_result['exit_code']}")
+                            print(f"   browser output: {browser_out[:300]}")
+                            if browser_result['exit_code'] != 0:
+                                await emit(run_id, EventType.ANALYZING, "Skipping Visual Capture", 
+                                          f"Chromium install failed: {browser_out[:80]}")
+                                raise Exception(f"playwright install chromium failed: {browser_out[:100]}")
                         
-                        # Step 3: Verify chromium is actually usable
-                        chrome_check = box.run_command(
-                            "find /root/.cache/ms-playwright /home/*/.cache/ms-playwright -name 'chrome' -type f 2>/dev/null | head -1 || echo 'NO_BROWSER_FOUND'",
-                            timeout=10
-                        )
-                        chrome_path = chrome_check.get('stdout', '').strip()
-                        print(f"   Chromium binary: {chrome_path[:200]}")
-                        if 'NO_BROWSER_FOUND' in chrome_path or not chrome_path:
-                            print("   Chromium binary not found after install!")
-                            # Don't fail here — Playwright might find it via its own path resolution
+                            # Step 3: Verify chromium is actually usable
+                            chrome_check = box.run_command(
+                                "find /root/.cache/ms-playwright /home/*/.cache/ms-playwright -name 'chrome' -type f 2>/dev/null | head -1 || echo 'NO_BROWSER_FOUND'",
+                                timeout=10
+                            )
+                            chrome_path = chrome_check.get('stdout', '').strip()
+                            print(f"   Chromium binary: {chrome_path[:200]}")
+                            if 'NO_BROWSER_FOUND' in chrome_path or not chrome_path:
+                                print("   Chromium binary not found after install!")
+                                # Don't fail here — Playwright might find it via its own path resolution
                         
                         await emit(run_id, EventType.ANALYZING, "Playwright Installed", 
                                   "Browser ready. Starting application server...")
                         
                         # Write the capture script
-                        box.write_file("visual_capture.py", get_playwright_setup_script())
+                        write_capture_script(box)
                         
                       
                         shm_fix = box.run_command(
@@ -1354,7 +1383,9 @@ npm run lint
                         shm_status = shm_fix.get('stdout', '').strip()
                         print(f"   /dev/shm resize: {shm_status}")
                        
-                        box.run_command("pkill -9 -f 'chrome' 2>/dev/null; pkill -9 -f 'chromium' 2>/dev/null; true", timeout=5)
+                        worker_up = ensure_visual_worker(box, start=False)
+                        if not worker_up:
+                            box.run_command("pkill -9 -f 'chrome' 2>/dev/null; pkill -9 -f 'chromium' 2>/dev/null; true", timeout=5)
                         
                         dev_server_url = None
                         
@@ -1462,8 +1493,10 @@ npm run lint
                             await emit(run_id, EventType.ANALYZING, "Capturing Screenshot", 
                                       f"Taking screenshot of {dev_server_url}...")
                            
-                            capture_result = box.run_command(
-                                f"ulimit -c 0 && python3 -u visual_capture.py --url '{dev_server_url}' --width 1280 --height 720",
+                            capture_result = await asyncio.to_thread(
+                                box.run_command,
+                                f"ulimit -c 0 && {CAPTURE_COMMAND} "
+                                f"{f'--socket {VISUAL_WORKER_SOCKET} ' if worker_up else ''}--url '{dev_server_url}' --width 1280 --height 720",
                                 timeout=180  
                             )
                            
@@ -1504,11 +1537,10 @@ npm run lint
                                     pass
                             
                             try:
-                                import json
-                                capture_data = json.loads(capture_result['stdout'])
+                                capture_data = decode_capture_output(capture_result['stdout'])
                                 
-                                if capture_data.get("success") and capture_data.get("screenshot_base64"):
-                                    screenshot_b64 = capture_data["screenshot_base64"]
+                                screenshot_b64 = load_capture_screenshot(box, capture_data) if capture_data.get("success") else None
+                                if screenshot_b64:
                                     print(f"   Screenshot captured! ({len(screenshot_b64)} bytes)")
                                     
                                     # Store success in metadata
@@ -1535,9 +1567,10 @@ npm run lint
                                               "Gemini Vision is checking for UI issues...")
                                     
                                     visual_report = await analyze_screenshot_with_gemini(
-                                        screenshot_base64=screenshot_b64,
+                                        screenshot=screenshot_b64,
                                         context="This is the UI after applying a code fix",
-                                        error_description="Checking if the fix resolved the visual issue"
+                                        error_description="Checking if the fix resolved the visual issue",
+                                        cache_scope=run_id
                                     )
                                     
                                     await emit_visual_analysis(run_id, {
@@ -1563,7 +1596,6 @@ npm run lint
                                     
                                     fallback_bytes = box.capture_screenshot_simple(dev_server_url)
                                     if fallback_bytes:
-                                        import base64
                                         screenshot_b64 = base64.b64encode(fallback_bytes).decode('utf-8')
                                         print(f"   ✅ Fallback screenshot captured! ({len(screenshot_b64)} bytes)")
                                         
@@ -1574,9 +1606,10 @@ npm run lint
                                         
                                         # Analyze with Gemini Vision
                                         visual_report = await analyze_screenshot_with_gemini(
-                                            screenshot_base64=screenshot_b64,
+                                            screenshot=fallback_bytes,
                                             context="This is the UI after applying a code fix",
-                                            error_description="Checking if the fix resolved the visual issue"
+                                            error_description="Checking if the fix resolved the visual issue",
+                                            cache_scope=run_id
                                         )
                                         
                                         await emit_visual_analysis(run_id, {
@@ -1591,7 +1624,7 @@ npm run lint
                                         await emit(run_id, EventType.ANALYZING, "Screenshot Failed", 
                                                   f"Both methods failed: {error[:80]}")
                                     
-                            except (json.JSONDecodeError, ValueError):
+                            except ValueError:
                                 
                                 error_output = capture_log_from_file or (capture_result.get('stdout', '') + capture_result.get('stderr', ''))
                                 print(f"   ⚠️ Capture script error: {error_output[:300]}")
@@ -1603,7 +1636,6 @@ npm run lint
                                 
                                 fallback_bytes = box.capture_screenshot_simple(dev_server_url)
                                 if fallback_bytes:
-                                    import base64
                                     screenshot_b64 = base64.b64encode(fallback_bytes).decode('utf-8')
                                     print(f"   ✅ Fallback screenshot captured! ({len(screenshot_b64)} bytes)")
                                     
@@ -1630,9 +1662,10 @@ npm run lint
                                               "Gemini Vision is checking for UI issues...")
                                     
                                     visual_report = await analyze_screenshot_with_gemini(
-                                        screenshot_base64=screenshot_b64,
+                                        screenshot=fallback_bytes,
                                         context="This is the UI after applying a code fix",
-                                        error_description="Checking if the fix resolved the visual issue"
+                                        error_description="Checking if the fix resolved the visual issue",
+                                        cache_scope=run_id
                                     )
                                     
                                     await emit_visual_analysis(run_id, {
@@ -1687,22 +1720,23 @@ npm run lint
                     
                     if existing_pr:
                         print(f"   Skipping PR creation - existing TALOS PR found: #{existing_pr['number']}")
-                        await emit(run_id, EventType.SUCCESS, "Fix Already Pending", 
-                                  f"An existing TALOS PR is waiting to be merged: #{existing_pr['number']}",
-                                  metadata={
-                                      "existing_pr_url": existing_pr['url'],
-                                      "existing_pr_number": existing_pr['number'],
-                                      "reason": "duplicate_prevention"
-                                  })
-                        await emit(run_id, EventType.MISSION_END, "No New PR Needed", 
-                                  f"Merge the existing PR first: {existing_pr['url']}",
-                                  metadata={"status": "skipped", "existing_pr": existing_pr['url']})
+                        await emit_many([
+                            HealingEvent(run_id, EventType.SUCCESS, "Fix Already Pending", 
+                                         f"An existing TALOS PR is waiting to be merged: #{existing_pr['number']}",
+                                         metadata={
+                                             "existing_pr_url": existing_pr['url'],
+                                             "existing_pr_number": existing_pr['number'],
+                                             "reason": "duplicate_prevention"
+                                         }),
+                            HealingEvent(run_id, EventType.MISSION_END, "No New PR Needed", 
+                                         f"Merge the existing PR first: {existing_pr['url']}",
+                                         metadata={"status": "skipped", "existing_pr": existing_pr['url']}),
+                        ])
                         await update_healing_run(run_id, status="success", pr_url=existing_pr['url'])
                         return  
                     
                     await emit(run_id, EventType.CREATING_PR, "Creating Pull Request", "Pushing verified fix to GitHub...")
                     
-                    import time
                     branch_name = f"fix/talos-{int(time.time())}"
                     
                     # Step 1: Create branch
@@ -1728,20 +1762,24 @@ npm run lint
                             if pr_result:
                                 print(f"   PR Created: {pr_result}")
                               
-                                await emit(run_id, EventType.SUCCESS, "Mission Complete!", 
-                                          f"Pull Request created successfully",
-                                          metadata={"pr_url": pr_result, "branch": branch_name})
-                                await emit(run_id, EventType.MISSION_END, "Healing Complete", 
-                                          f"PR: {pr_result}",
-                                          metadata={"pr_url": pr_result, "status": "success"})
+                                await emit_many([
+                                    HealingEvent(run_id, EventType.SUCCESS, "Mission Complete!", 
+                                                 f"Pull Request created successfully",
+                                                 metadata={"pr_url": pr_result, "branch": branch_name}),
+                                    HealingEvent(run_id, EventType.MISSION_END, "Healing Complete", 
+                                                 f"PR: {pr_result}",
+                                                 metadata={"pr_url": pr_result, "status": "success"}),
+                                ])
                                 await update_healing_run(run_id, status="success", pr_url=pr_result)
                             else:
                                 print("   PR creation failed (see logs)")
-                                await emit(run_id, EventType.FAILURE, "PR Creation Failed", 
-                                          "Fix was verified but PR could not be created")
-                                await emit(run_id, EventType.MISSION_END, "Healing Complete", 
-                                          "PR creation failed - check GitHub API permissions",
-                                          metadata={"status": "failure", "reason": "pr_creation_failed"})
+                                await emit_many([
+                                    HealingEvent(run_id, EventType.FAILURE, "PR Creation Failed", 
+                                                 "Fix was verified but PR could not be created"),
+                                    HealingEvent(run_id, EventType.MISSION_END, "Healing Complete", 
+                                                 "PR creation failed - check GitHub API permissions",
+                                                 metadata={"status": "failure", "reason": "pr_creation_failed"}),
+                                ])
                                 await update_healing_run(run_id, status="failure", error_type="pr_creation_failed")
                         else:
                             print("   Failed to push changes")
@@ -1752,28 +1790,34 @@ npm run lint
                 else:
                     print("   Verification failed after all retries. No PR created.")
                     print("   Human intervention required.")
-                    await emit(run_id, EventType.FAILURE, "Verification Failed", 
-                              "All retry attempts exhausted. Human intervention required.",
-                              metadata={"last_error": last_error[:500], "attempts": max_retries})
-                    await emit(run_id, EventType.MISSION_END, "Mission Incomplete", 
-                              "Could not verify fix after multiple attempts",
-                              metadata={"status": "failed", "reason": "verification_failed"})
+                    await emit_many([
+                        HealingEvent(run_id, EventType.FAILURE, "Verification Failed", 
+                                     "All retry attempts exhausted. Human intervention required.",
+                                     metadata={"last_error": last_error[:500], "attempts": max_retries}),
+                        HealingEvent(run_id, EventType.MISSION_END, "Mission Incomplete", 
+                                     "Could not verify fix after multiple attempts",
+                                     metadata={"status": "failed", "reason": "verification_failed"}),
+                    ])
                     await update_healing_run(run_id, status="failure", error_type="verification_failed")
             else:
                 print("   Could not parse fix from Gemini response")
-                await emit(run_id, EventType.FAILURE, "Parse Error", 
-                          "Could not extract fix from Gemini's response")
-                await emit(run_id, EventType.MISSION_END, "Mission Incomplete", 
-                          "Failed to parse fix from AI response",
-                          metadata={"status": "failed", "reason": "parse_error"})
+                await emit_many([
+                    HealingEvent(run_id, EventType.FAILURE, "Parse Error", 
+                                 "Could not extract fix from Gemini's response"),
+                    HealingEvent(run_id, EventType.MISSION_END, "Mission Incomplete", 
+                                 "Failed to parse fix from AI response",
+                                 metadata={"status": "failed", "reason": "parse_error"}),
+                ])
                 await update_healing_run(run_id, status="failure", error_type="parse_error")
 
     except Exception as e:
         print(f"TALOS DIED: {e}")
-        await emit(run_id, EventType.FAILURE, "Critical Error", str(e)[:500])
-        await emit(run_id, EventType.MISSION_END, "Mission Failed", 
-                  f"Unhandled exception: {str(e)[:200]}",
-                  metadata={"status": "error", "exception": str(e)[:500]})
+        await emit_many([
+            HealingEvent(run_id, EventType.FAILURE, "Critical Error", str(e)[:500]),
+            HealingEvent(run_id, EventType.MISSION_END, "Mission Failed", 
+                         f"Unhandled exception: {str(e)[:200]}",
+                         metadata={"status": "error", "exception": str(e)[:500]}),
+        ])
         await update_healing_run(run_id, status="failure", error_type="exception")
 
 async def generate_with_retry(prompt: str, context: str = "", thought_signature: str = None):
@@ -1833,7 +1877,7 @@ async def generate_with_retry(prompt: str, context: str = "", thought_signature:
             
             if "429" in error_msg or "403" in error_msg:
                 print(f"Rate limited - switching keys (cooling {backoff}s)...")
-                key_rotator.rotate()
+                key_rotator.rotate(current_key)
                 attempt += 1
                 await asyncio.sleep(backoff)
             elif "503" in error_msg or "UNAVAILABLE" in error_msg or "overloaded" in error_msg.lower():
@@ -9,22 +9,77 @@ TALOS shows its reasoning process live, building trust and engagement.
 
 Architecture:
   Agent (Publisher) → Redis Channel → SSE Endpoint → Frontend Timeline
+
+Events travel through Redis as MessagePack; they are only rendered as JSON
+at the SSE/HTTP edge.
 """
 
 import os
-import json
+import time
 import asyncio
-from datetime import datetime
+import logging
+import functools
+from collections import OrderedDict
 from typing import Optional, AsyncGenerator, Literal
-from dataclasses import dataclass, asdict
 from enum import Enum
+import msgspec
 import redis.asyncio as redis
 from dotenv import load_dotenv
 
+logger = logging.getLogger("talos.bus")
+
 load_dotenv()
 
 REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379")
 
+CHANNEL_PREFIX = "talos:healing:v2:"
+HISTORY_PREFIX = "talos:history:v2:"
+SEQ_PREFIX = "talos:seq:"
+ACTIVE_RUN_KEY = "talos:active_run"
+RETRY_PREFIX = "talos:retry:"
+
+HISTORY_MAX_EVENTS = 100
+HISTORY_TTL_SECONDS = 3600
+
+PERSIST_QUEUE_SIZE = 1000
+PERSIST_BATCH_SIZE = 50
+
+# Finished runs whose SSE replay is kept pre-encoded for late joiners
+REPLAY_CACHE_SIZE = 64
+
+# Most events one subscriber wakeup hands to its SSE stream
+SUBSCRIBE_BATCH_SIZE = 64
+
+# Set on MISSION_START and dropped on a terminal event; read-through fills
+# from the database expire quickly since nothing else invalidates them
+ACTIVE_RUN_TTL_SECONDS = 3600
+ACTIVE_RUN_FILL_TTL_SECONDS = 10
+
+# An unused "Allow Retry" click lapses after a day
+RETRY_ALLOWANCE_TTL_SECONDS = 86400
+
+# Numbers the event, appends it to the history ring buffer and broadcasts it
+# in a single atomic call. Entries are stored and published as b"<seq>:<payload>";
+# the per-run sequence is the SSE id, so resumes never skip or repeat an event.
+# KEYS[1] = history list, KEYS[2] = channel, KEYS[3] = sequence counter
+# ARGV[1] = payload, ARGV[2] = max history length, ARGV[3] = TTL seconds
+_PUBLISH_LUA = """
+local seq = redis.call('INCR', KEYS[3])
+redis.call('EXPIRE', KEYS[3], ARGV[3])
+local entry = seq .. ':' .. ARGV[1]
+redis.call('RPUSH', KEYS[1], entry)
+redis.call('LTRIM', KEYS[1], -tonumber(ARGV[2]), -1)
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+redis.call('PUBLISH', KEYS[2], entry)
+return seq
+"""
+
+@functools.lru_cache(maxsize=2048)
+def run_keys(run_id: str) -> tuple[str, str, str]:
+    """Redis (channel, history key, sequence key) for a healing run."""
+    return f"{CHANNEL_PREFIX}{run_id}", f"{HISTORY_PREFIX}{run_id}", f"{SEQ_PREFIX}{run_id}"
+
+
 class EventType(str, Enum):
   
     MISSION_START = "mission_start"      
@@ -58,30 +113,95 @@ class EventType(str, Enum):
     VISUAL_ANALYSIS = "visual_analysis"  
 
 
-@dataclass
-class HealingEvent:
-    """A single event in the healing timeline."""
+_ts_second = -1
+_ts_prefix = ""
+
+
+def _utc_timestamp() -> str:
+    """
+    ISO-8601 UTC timestamp with microseconds, e.g. 2026-01-29T01:38:59.123456Z.
+    The date/time prefix is formatted at most once per second; the frontend
+    dedupes events by this string, so sub-second precision is kept.
+    """
+    global _ts_second, _ts_prefix
+    second, remainder = divmod(time.time_ns(), 1_000_000_000)
+    if second != _ts_second:
+        _ts_prefix = time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(second))
+        _ts_second = second
+    return f"{_ts_prefix}.{remainder // 1000:06d}Z"
+
+
+class HealingEvent(msgspec.Struct, dict=True):
+    """
+    A single event in the healing timeline.
+    
+    Events are treated as immutable once created: the JSON encoding is
+    memoized so one event fanned out to many SSE clients is encoded once.
+    """
     run_id: str
     event_type: EventType
     title: str
     description: str
-    timestamp: str = None
+    timestamp: str = msgspec.field(default_factory=_utc_timestamp)
     metadata: Optional[dict] = None
     
-    def __post_init__(self):
-        if self.timestamp is None:
-            self.timestamp = datetime.utcnow().isoformat() + "Z"
+    def to_bytes(self) -> bytes:
+        cached = getattr(self, "_json_cache", None)
+        if cached is None:
+            cached = self._json_cache = _json_encoder.encode(self)
+        return cached
     
     def to_json(self) -> str:
-        data = asdict(self)
-        data['event_type'] = self.event_type.value
-        return json.dumps(data)
+        return self.to_bytes().decode("utf-8")
+    
+    @property
+    def seq(self) -> int:
+        """Per-run sequence number assigned on publish; 0 until read back from Redis."""
+        return getattr(self, "_seq", 0)
+    
+    def to_sse_bytes(self) -> bytes:
+        """
+        Complete SSE frame (`id:`, `event:`, `data:`, blank line), memoized
+        like the JSON. The sequence number is the event id so reconnecting
+        browsers report how far they got via Last-Event-ID.
+        """
+        cached = getattr(self, "_sse_cache", None)
+        if cached is None:
+            cached = self._sse_cache = (
+                b"id: %d\n" % self.seq
+                + _SSE_PREFIX[self.event_type] + self.to_bytes() + b"\n\n"
+            )
+        return cached
+    
+    @classmethod
+    def from_json(cls, json_str: str | bytes) -> "HealingEvent":
+        return _json_decoder.decode(json_str)
+    
+    def to_msgpack(self) -> bytes:
+        """Binary wire format used on the internal Redis hop."""
+        return _msgpack_encoder.encode(self)
+    
+    @classmethod
+    def from_msgpack(cls, data: bytes) -> "HealingEvent":
+        return _msgpack_decoder.decode(data)
     
     @classmethod
-    def from_json(cls, json_str: str) -> "HealingEvent":
-        data = json.loads(json_str)
-        data['event_type'] = EventType(data['event_type'])
-        return cls(**data)
+    def from_entry(cls, data: bytes) -> "HealingEvent":
+        """Decode a b"<seq>:<payload>" history entry or channel message."""
+        seq, _, payload = data.partition(b":")
+        event = _msgpack_decoder.decode(payload)
+        event._seq = int(seq)
+        return event
+
+
+_json_encoder = msgspec.json.Encoder()
+_json_decoder = msgspec.json.Decoder(HealingEvent)
+_msgpack_encoder = msgspec.msgpack.Encoder()
+_msgpack_decoder = msgspec.msgpack.Decoder(HealingEvent)
+
+_SSE_PREFIX = {et: b"event: %s\ndata: " % et.value.encode() for et in EventType}
+
+TERMINAL_EVENT_TYPES = (EventType.MISSION_END, EventType.SUCCESS, EventType.FAILURE)
 
 
 class EventBus:
@@ -99,115 +219,314 @@ class EventBus:
         ))
         
         # Subscribing (from SSE endpoint)
-        async for event in bus.subscribe("abc123"):
-            yield f"data: {event.to_json()}\n\n"
+        async for batch in bus.subscribe("abc123"):
+            yield b"".join(event.to_sse_bytes() for event in batch)
     """
     
     def __init__(self):
         self._redis: Optional[redis.Redis] = None
+        self._connected = False
         self._pubsub: Optional[redis.client.PubSub] = None
+        self._persist_queue: asyncio.Queue = asyncio.Queue(maxsize=PERSIST_QUEUE_SIZE)
+        self._persist_task: Optional[asyncio.Task] = None
+        self._publish_script = None
+        # run_id -> queues of the SSE clients watching that run
+        self._fanout: dict[str, set[asyncio.Queue]] = {}
+        self._listener_task: Optional[asyncio.Task] = None
+        self._listener_lock = asyncio.Lock()
+        # run_id -> (history, concatenated SSE frames) of a finished run
+        self._replay_cache: "OrderedDict[str, tuple[list[HealingEvent], bytes]]" = OrderedDict()
     
     async def connect(self):
-        """Establish Redis connection."""
-        if self._redis is None:
-            try:
-                self._redis = redis.from_url(REDIS_URL, decode_responses=True)
-                # Test connection
-                await self._redis.ping()
-                print(f"Redis connected: {REDIS_URL}")
-            except Exception as e:
-                print(f"Redis connection failed: {e}")
-                raise
+        """Establish Redis connection. Idempotent; called once via get_event_bus()."""
+        if self._connected:
+            return
+        try:
+            self._redis = redis.from_url(REDIS_URL, decode_responses=False)
+            # EVALSHA with automatic NOSCRIPT reload
+            self._publish_script = self._redis.register_script(_PUBLISH_LUA)
+            # Test connection
+            await self._redis.ping()
+            self._connected = True
+            logger.info("Redis connected: %s", REDIS_URL)
+        except Exception as e:
+            self._redis = None
+            logger.error("Redis connection failed: %s", e)
+            raise
+    
+    @property
+    def redis(self) -> redis.Redis:
+        """The bus's Redis client, shared with other short-lived keys (see app.db.cache)."""
+        return self._redis
+    
+    async def ping(self):
+        """Round-trip to Redis; raises if the connection is gone."""
+        await self._redis.ping()
     
     async def disconnect(self):
         """Clean up Redis connection."""
+        if self._listener_task:
+            self._listener_task.cancel()
+        if self._persist_task:
+            self._persist_task.cancel()
         if self._pubsub:
             await self._pubsub.close()
         if self._redis:
             await self._redis.close()
+        self._connected = False
     
-    def _channel_name(self, run_id: str) -> str:
-        """Generate channel name for a healing run."""
-        return f"talos:healing:{run_id}"
+    async def publish_raw(self, run_id: str, payload: bytes):
+        """
+        Broadcast an already-encoded (MessagePack) event and append it to the
+        run's history. Skips persistence; use publish() for regular events.
+        """
+        channel, history_key, seq_key = run_keys(run_id)
+        self._replay_cache.pop(run_id, None)
+        
+        # One round-trip for the numbering, broadcast and history ring buffer
+        await self._publish_script(
+            keys=[history_key, channel, seq_key],
+            args=[payload, HISTORY_MAX_EVENTS, HISTORY_TTL_SECONDS],
+        )
+    
+    async def publish_many(self, events: list[HealingEvent]):
+        """Publish several events in a single pipelined round-trip."""
+        if not events:
+            return
+        try:
+            async with self._redis.pipeline(transaction=False) as pipe:
+                for event in events:
+                    channel, history_key, seq_key = run_keys(event.run_id)
+                    self._replay_cache.pop(event.run_id, None)
+                    await self._publish_script(
+                        keys=[history_key, channel, seq_key],
+                        args=[event.to_msgpack(), HISTORY_MAX_EVENTS, HISTORY_TTL_SECONDS],
+                        client=pipe,
+                    )
+                await pipe.execute()
+            
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Published %d events in one batch", len(events))
+            for event in events:
+                await self._track_active_run(event)
+        except Exception as e:
+            logger.warning("Failed to publish event batch: %s", e)
+        
+        self._ensure_persist_worker()
+        for event in events:
+            try:
+                self._persist_queue.put_nowait(event)
+            except asyncio.QueueFull:
+                logger.warning("Persist queue full, dropping event: %s - %s", event.event_type.value, event.title)
     
     async def publish(self, event: HealingEvent):
         """Publish an event to the healing run's channel."""
         try:
-            await self.connect()
-            channel = self._channel_name(event.run_id)
-            await self._redis.publish(channel, event.to_json())
+            await self.publish_raw(event.run_id, event.to_msgpack())
+            await self._track_active_run(event)
             
-          
-            history_key = f"talos:history:{event.run_id}"
-            await self._redis.rpush(history_key, event.to_json())
-            await self._redis.ltrim(history_key, -100, -1) 
-            await self._redis.expire(history_key, 3600)  
-            
-            print(f"Event published: {event.event_type.value} - {event.title}")
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Event published: %s - %s", event.event_type.value, event.title)
         except Exception as e:
-            print(f"Failed to publish event: {e}")
+            logger.warning("Failed to publish event: %s", e)
         
+        # Persistence is best-effort and must not hold up the live stream
+        self._ensure_persist_worker()
         try:
-            persist_metadata = event.metadata
-            if persist_metadata and "screenshot_base64" in persist_metadata:
-                persist_metadata = {k: v for k, v in persist_metadata.items() if k != "screenshot_base64"}
-                persist_metadata["has_screenshot"] = True
+            self._persist_queue.put_nowait(event)
+        except asyncio.QueueFull:
+            logger.warning("Persist queue full, dropping event: %s - %s", event.event_type.value, event.title)
+    
+    async def _track_active_run(self, event: HealingEvent):
+        if event.event_type == EventType.MISSION_START:
+            await self._redis.set(ACTIVE_RUN_KEY, _json_encoder.encode({
+                "run_id": event.run_id,
+                "repo": (event.metadata or {}).get("repo"),
+                "started_at": event.timestamp,
+                "stream_url": f"/events/stream/{event.run_id}",
+            }), ex=ACTIVE_RUN_TTL_SECONDS)
+        elif event.event_type in TERMINAL_EVENT_TYPES:
+            await self._redis.delete(ACTIVE_RUN_KEY)
+    
+    async def get_active_run(self) -> Optional[dict]:
+        """The latest active run as served by /runs/latest/active, or None on a miss."""
+        cached = await self._redis.get(ACTIVE_RUN_KEY)
+        return msgspec.json.decode(cached) if cached else None
+    
+    async def cache_active_run(self, payload: dict):
+        """Store a database answer briefly; never overwrites a live MISSION_START entry."""
+        await self._redis.set(ACTIVE_RUN_KEY, _json_encoder.encode(payload), ex=ACTIVE_RUN_FILL_TTL_SECONDS, nx=True)
+    
+    async def allow_retry(self, repo_full_name: str):
+        """Let the next run for this repo skip the duplicate-PR check, from any worker."""
+        await self._redis.set(f"{RETRY_PREFIX}{repo_full_name}", 1, ex=RETRY_ALLOWANCE_TTL_SECONDS)
+    
+    async def take_retry_allowance(self, repo_full_name: str) -> bool:
+        """Consume a pending retry allowance; the DEL makes it single-use across workers."""
+        return await self._redis.delete(f"{RETRY_PREFIX}{repo_full_name}") > 0
+    
+    def _ensure_persist_worker(self):
+        if self._persist_task is None or self._persist_task.done():
+            self._persist_task = asyncio.create_task(self._drain_persist_queue())
+    
+    async def _drain_persist_queue(self):
+        """Batch queued events into bulk Supabase inserts for AI Chat retrieval."""
+        from app.db.supabase import persist_healing_events_bulk
+        
+        batch: list[HealingEvent] = []
+        while True:
+            batch.append(await self._persist_queue.get())
+            while len(batch) < PERSIST_BATCH_SIZE:
+                try:
+                    batch.append(self._persist_queue.get_nowait())
+                except asyncio.QueueEmpty:
+                    break
             
-            from app.db.supabase import persist_healing_event
-            await persist_healing_event(
-                run_id=event.run_id,
-                event_type=event.event_type.value,
-                title=event.title,
-                description=event.description,
-                metadata=persist_metadata,
-            )
-        except Exception as e:
-           
-            pass
+            rows = []
+            for event in batch:
+                persist_metadata = event.metadata
+                if persist_metadata and "screenshot_base64" in persist_metadata:
+                    persist_metadata = {k: v for k, v in persist_metadata.items() if k != "screenshot_base64"}
+                    persist_metadata["has_screenshot"] = True
+                rows.append({
+                    "run_id": event.run_id,
+                    "event_type": event.event_type.value,
+                    "title": event.title,
+                    "description": event.description,
+                    "metadata": persist_metadata,
+                })
+            batch.clear()
+            
+            try:
+                await persist_healing_events_bulk(rows)
+            except Exception:
+                pass
     
     async def get_history(self, run_id: str) -> list[HealingEvent]:
         """Get historical events for a run (for late-joining clients)."""
-        await self.connect()
-        history_key = f"talos:history:{run_id}"
-        events_json = await self._redis.lrange(history_key, 0, -1)
-        return [HealingEvent.from_json(e) for e in events_json]
+        _, history_key, _ = run_keys(run_id)
+        events_raw = await self._redis.lrange(history_key, 0, -1)
+        return [HealingEvent.from_entry(e) for e in events_raw]
+    
+    async def get_replay(self, run_id: str, after: Optional[int] = None) -> tuple[bytes, bool]:
+        """
+        The run's history as one blob of SSE frames, plus whether the run has
+        finished. Finished runs are memoized, so reopening a completed run's
+        dashboard skips the Redis read and re-encoding entirely.
+        
+        `after` is a Last-Event-ID (an event sequence number); only later
+        events are included, so a reconnect resends just what the client missed.
+        """
+        cached = self._replay_cache.get(run_id)
+        if cached is not None:
+            self._replay_cache.move_to_end(run_id)
+            history, frames = cached
+            complete = True
+        else:
+            history = await self.get_history(run_id)
+            frames = b"".join(e.to_sse_bytes() for e in history)
+            complete = any(e.event_type in TERMINAL_EVENT_TYPES for e in history)
+            if complete:
+                self._replay_cache[run_id] = (history, frames)
+                while len(self._replay_cache) > REPLAY_CACHE_SIZE:
+                    self._replay_cache.popitem(last=False)
+        
+        if after is not None:
+            frames = b"".join(e.to_sse_bytes() for e in history if e.seq > after)
+        return frames, complete
+    
+    async def _ensure_listener(self):
+        """Start the shared pattern subscription that feeds every subscriber."""
+        async with self._listener_lock:
+            if self._listener_task and not self._listener_task.done():
+                return
+            if self._pubsub:
+                await self._pubsub.close()
+            self._pubsub = self._redis.pubsub()
+            await self._pubsub.psubscribe(f"{CHANNEL_PREFIX}*")
+            self._listener_task = asyncio.create_task(self._listen())
+    
+    async def _listen(self):
+        """Route messages from the shared PubSub to per-run subscriber queues."""
+        prefix_len = len(CHANNEL_PREFIX)
+        try:
+            async for message in self._pubsub.listen():
+                if message["type"] != "pmessage":
+                    continue
+                run_id = message["channel"][prefix_len:].decode("utf-8")
+                queues = self._fanout.get(run_id)
+                if not queues:
+                    continue
+                event = HealingEvent.from_entry(message["data"])
+                for queue in queues:
+                    queue.put_nowait(event)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error("Event listener failed: %s", e)
+        
+        # Wake every subscriber so none of them waits on a dead connection
+        for queues in self._fanout.values():
+            for queue in queues:
+                queue.put_nowait(None)
     
-    async def subscribe(self, run_id: str) -> AsyncGenerator[HealingEvent, None]:
+    async def subscribe(self, run_id: str) -> AsyncGenerator[list[HealingEvent], None]:
         """
         Subscribe to events for a specific healing run.
-        Yields events as they arrive.
+        Yields batches: everything queued by the time the subscriber wakes,
+        so a burst costs one wakeup instead of one per event.
         """
-        await self.connect()
-        channel = self._channel_name(run_id)
+        await self._ensure_listener()
         
-        pubsub = self._redis.pubsub()
-        await pubsub.subscribe(channel)
+        queue: asyncio.Queue = asyncio.Queue()
+        self._fanout.setdefault(run_id, set()).add(queue)
         
         try:
-            async for message in pubsub.listen():
-                if message["type"] == "message":
-                    event = HealingEvent.from_json(message["data"])
-                    yield event
-                    
-                    
-                    if event.event_type in (EventType.MISSION_END, EventType.SUCCESS, EventType.FAILURE):
+            while True:
+                batch = [await queue.get()]
+                while len(batch) < SUBSCRIBE_BATCH_SIZE and not queue.empty():
+                    batch.append(queue.get_nowait())
+                
+                done = False
+                for i, event in enumerate(batch):
+                    if event is None or event.event_type in TERMINAL_EVENT_TYPES:
+                        done = True
+                        batch = batch[:i] if event is None else batch[:i + 1]
                         break
+                if batch:
+                    yield batch
+                if done:
+                    break
         finally:
-            await pubsub.unsubscribe(channel)
-            await pubsub.close()
-
+            queues = self._fanout.get(run_id)
+            if queues is not None:
+                queues.discard(queue)
+                if not queues:
+                    del self._fanout[run_id]
 
 
 _event_bus: Optional[EventBus] = None
+_event_bus_lock = asyncio.Lock()
 
 async def get_event_bus() -> EventBus:
-    """Get or create the global event bus instance."""
+    """Get or create the global event bus instance (connects once)."""
     global _event_bus
-    if _event_bus is None:
-        _event_bus = EventBus()
+    bus = _event_bus
+    if bus is not None and bus._connected:
+        return bus
+    
+    async with _event_bus_lock:
+        if _event_bus is None:
+            _event_bus = EventBus()
         await _event_bus.connect()
     return _event_bus
 
+async def close_event_bus():
+    global _event_bus
+    if _event_bus is not None:
+        await _event_bus.disconnect()
+        _event_bus = None
+
 async def emit(
     run_id: str,
     event_type: EventType,
@@ -232,6 +551,15 @@ async def emit(
     await bus.publish(event)
 
 
+async def emit_many(events: list[HealingEvent]):
+    """
+    Emit several related events (e.g. thought + code diff + applying fix)
+    with one Redis round-trip. Order is preserved.
+    """
+    bus = await get_event_bus()
+    await bus.publish_many(events)
+
+
 async def emit_thought(run_id: str, thought: str):
     """Emit a thought from the agent's reasoning process."""
     await emit(run_id, EventType.THOUGHT_STREAM, "Thinking", thought)
@@ -250,12 +578,14 @@ async def emit_code_diff(run_id: str, filepath: str, before: str, after: str):
 
 async def emit_screenshot(run_id: str, title: str, screenshot_base64: str, description: str = ""):
     """Emit a screenshot for the Visual Cortex display."""
+    # Captures are JPEG, fallback screenshots PNG; base64 of a JPEG always starts with /9j/
+    mime_type = "image/jpeg" if screenshot_base64.startswith("/9j/") else "image/png"
     await emit(
         run_id,
         EventType.SCREENSHOT,
         f"{title}",
         description,
-        metadata={"screenshot_base64": screenshot_base64}
+        metadata={"screenshot_base64": screenshot_base64, "screenshot_mime_type": mime_type}
     )
 
 
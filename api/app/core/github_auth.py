@@ -1,9 +1,14 @@
 import time
 import jwt
 import os
+import asyncio
 import logging
 import httpx
+import functools
+from typing import Optional
+from datetime import datetime
 from email.utils import parsedate_to_datetime
+from cryptography.hazmat.primitives.serialization import load_pem_private_key
 from dotenv import load_dotenv
 
 logger = logging.getLogger("autonode.auth")
@@ -16,40 +21,128 @@ GITHUB_PRIVATE_KEY_PATH = os.getenv("GITHUB_PRIVATE_KEY_PATH")
 
 _CLOCK_SKEW_OFFSET = None
 
-def get_clock_skew_offset() -> int:
-    """
-    Calculates the time difference between Local System (2026) and GitHub (2025).
-    """
+# Measured offsets are persisted so restarts don't pay the GitHub round-trip
+SKEW_CACHE_PATH = os.path.expanduser(os.getenv("TALOS_SKEW_CACHE_PATH", "~/.cache/talos/skew"))
+SKEW_CACHE_TTL = 24 * 3600
+# A failed sync is retried on a later token fetch, but not more than once a minute
+SKEW_RETRY_SECONDS = 60
+_CLOCK_SYNC_RETRY_AT = 0.0
+
+# JWTs are valid for 9 minutes; reuse one until it is within a minute of expiry
+JWT_REFRESH_MARGIN = 60
+_JWT_CACHE: Optional[tuple[str, int]] = None  # (token, exp in GitHub time)
+_PRIVATE_KEY_OBJ = None
+
+# Installation tokens live for an hour; refresh once fewer than 5 minutes remain
+TOKEN_REFRESH_MARGIN = 300
+_TOKEN_CACHE: dict[int, tuple[str, float]] = {}  # installation_id -> (token, expires_at epoch)
+_TOKEN_LOCKS: dict[int, asyncio.Lock] = {}
+
+_HTTPX: Optional[httpx.AsyncClient] = None
+
+def get_http_client() -> httpx.AsyncClient:
+    """Shared keep-alive client so GitHub calls reuse one TLS connection."""
+    global _HTTPX
+    if _HTTPX is None or _HTTPX.is_closed:
+        _HTTPX = httpx.AsyncClient(
+            timeout=30.0,
+            # retries only re-attempt failed connects, never a sent request
+            transport=httpx.AsyncHTTPTransport(
+                http2=True,
+                retries=2,
+                limits=httpx.Limits(max_keepalive_connections=64, max_connections=256),
+            ),
+        )
+    return _HTTPX
+
+async def close_http_client():
+    global _HTTPX
+    if _HTTPX is not None:
+        await _HTTPX.aclose()
+        _HTTPX = None
+
+def _load_cached_offset() -> Optional[int]:
+    """Return the in-memory offset, falling back to a fresh on-disk value."""
     global _CLOCK_SKEW_OFFSET
     if _CLOCK_SKEW_OFFSET is not None:
         return _CLOCK_SKEW_OFFSET
 
     try:
-      
-        with httpx.Client(timeout=5.0) as client:
-            resp = client.get("https://api.github.com")
-            
-        server_date_str = resp.headers.get("Date")
-        if not server_date_str:
-            return 0
+        with open(SKEW_CACHE_PATH, "r") as f:
+            offset_str, measured_at_str = f.read().split()
+        if time.time() - float(measured_at_str) < SKEW_CACHE_TTL:
+            _CLOCK_SKEW_OFFSET = int(offset_str)
+            logger.info(f"Using cached clock offset: {_CLOCK_SKEW_OFFSET} seconds")
+            return _CLOCK_SKEW_OFFSET
+    except (OSError, ValueError):
+        pass
+    return None
 
-       
-        server_dt = parsedate_to_datetime(server_date_str)
-        server_ts = server_dt.timestamp()
-        local_ts = time.time()
+def _store_cached_offset(offset: int):
+    try:
+        os.makedirs(os.path.dirname(SKEW_CACHE_PATH), exist_ok=True)
+        with open(SKEW_CACHE_PATH, "w") as f:
+            f.write(f"{offset} {time.time()}")
+    except OSError as e:
+        logger.debug(f"Could not persist clock offset: {e}")
 
-        _CLOCK_SKEW_OFFSET = int(server_ts - local_ts)
-        
+def _offset_from_response(resp: httpx.Response) -> Optional[int]:
+    global _CLOCK_SKEW_OFFSET
+    server_date_str = resp.headers.get("Date")
+    if not server_date_str:
+        return None
+
+   
+    server_dt = parsedate_to_datetime(server_date_str)
+    server_ts = server_dt.timestamp()
+    local_ts = time.time()
+
+    _CLOCK_SKEW_OFFSET = int(server_ts - local_ts)
     
-        logger.info(f"Time Sync: Local={int(local_ts)}, GitHub={int(server_ts)}")
-        logger.info(f"Applied Offset: {_CLOCK_SKEW_OFFSET} seconds")
-        
-        return _CLOCK_SKEW_OFFSET
+
+    logger.info(f"Time Sync: Local={int(local_ts)}, GitHub={int(server_ts)}")
+    logger.info(f"Applied Offset: {_CLOCK_SKEW_OFFSET} seconds")
+    _store_cached_offset(_CLOCK_SKEW_OFFSET)
+    
+    return _CLOCK_SKEW_OFFSET
+
+async def sync_clock_skew_offset() -> int:
+    """
+    Measures the offset against GitHub's Date header using the shared client
+    and records it for get_clock_skew_offset(). Scheduled at app startup so
+    the first JWT doesn't wait on GitHub. On failure 0 is returned but not
+    recorded, so a later call measures again once SKEW_RETRY_SECONDS pass.
+    """
+    global _CLOCK_SYNC_RETRY_AT
+    cached = _load_cached_offset()
+    if cached is not None:
+        return cached
+    if time.time() < _CLOCK_SYNC_RETRY_AT:
+        return 0
+
+    try:
+        resp = await get_http_client().get("https://api.github.com", timeout=5.0)
+        offset = _offset_from_response(resp)
     except Exception as e:
         logger.warning(f"Could not sync time with GitHub: {e}")
+        offset = None
+
+    if offset is None:
+        _CLOCK_SYNC_RETRY_AT = time.time() + SKEW_RETRY_SECONDS
         return 0
+    return offset
 
+def get_clock_skew_offset() -> int:
+    """
+    Returns the offset between local time and GitHub's clock, as recorded by
+    sync_clock_skew_offset(). Never touches the network.
+    """
+    cached = _load_cached_offset()
+    return cached if cached is not None else 0
+
+@functools.lru_cache(maxsize=1)
 def load_private_key() -> bytes:
+    """Read and validate the PEM once per process; failures are not cached."""
     if not GITHUB_PRIVATE_KEY_PATH:
         raise ValueError("GITHUB_PRIVATE_KEY_PATH is not set.")
 
@@ -82,19 +175,32 @@ def load_private_key() -> bytes:
 
     return key_data
 
+def get_private_key_obj():
+    """Parse the PEM once; PyJWT would otherwise re-parse it on every encode."""
+    global _PRIVATE_KEY_OBJ
+    if _PRIVATE_KEY_OBJ is None:
+        private_key = load_private_key()
+        logger.debug(f"Key starts with: {private_key[:50]}")
+        _PRIVATE_KEY_OBJ = load_pem_private_key(private_key, password=None)
+    return _PRIVATE_KEY_OBJ
+
 def generate_jwt() -> str:
+    global _JWT_CACHE
     if not GITHUB_APP_ID:
         raise ValueError("GITHUB_APP_ID is missing.")
 
-    private_key = load_private_key()
-
-    logger.debug(f"Key starts with: {private_key[:50]}")
-
     offset = get_clock_skew_offset()
     
     
     now_github_time = int(time.time() + offset)
 
+    if _JWT_CACHE is not None:
+        cached_token, cached_exp = _JWT_CACHE
+        if cached_exp - now_github_time > JWT_REFRESH_MARGIN:
+            return cached_token
+
+    private_key = get_private_key_obj()
+
     app_id_str = str(GITHUB_APP_ID).strip()
     
     payload = {
@@ -105,9 +211,39 @@ def generate_jwt() -> str:
     
     logger.info(f"JWT Payload: iat={payload['iat']}, exp={payload['exp']}, iss={payload['iss']}")
 
-    return jwt.encode(payload, private_key, algorithm="RS256")
+    token = jwt.encode(payload, private_key, algorithm="RS256")
+    _JWT_CACHE = (token, payload["exp"])
+    return token
+
+def _cached_installation_token(installation_id: int) -> Optional[str]:
+    cached = _TOKEN_CACHE.get(installation_id)
+    if cached is None:
+        return None
+    token, expires_at = cached
+    now_github_time = time.time() + (_CLOCK_SKEW_OFFSET or 0)
+    if expires_at - now_github_time > TOKEN_REFRESH_MARGIN:
+        return token
+    return None
 
 async def get_installation_access_token(installation_id: int) -> str:
+    """
+    Returns an installation access token, reusing a cached one until it is
+    close to expiry. Concurrent callers for the same installation share a
+    single GitHub request.
+    """
+    token = _cached_installation_token(installation_id)
+    if token:
+        return token
+
+    lock = _TOKEN_LOCKS.setdefault(installation_id, asyncio.Lock())
+    async with lock:
+        token = _cached_installation_token(installation_id)
+        if token:
+            return token
+        return await _fetch_installation_access_token(installation_id)
+
+async def _fetch_installation_access_token(installation_id: int) -> str:
+    await sync_clock_skew_offset()
     jwt_token = generate_jwt()
     
     headers = {
@@ -119,25 +255,30 @@ async def get_installation_access_token(installation_id: int) -> str:
     logger.info(f"Requesting access token for installation: {installation_id}")
     
     try:
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            resp = await client.post(
-                f"https://api.github.com/app/installations/{installation_id}/access_tokens", 
-                headers=headers
-            )
+        resp = await get_http_client().post(
+            f"https://api.github.com/app/installations/{installation_id}/access_tokens", 
+            headers=headers
+        )
+        
+        logger.info(f"GitHub Response: {resp.status_code}")
+        
+        if resp.status_code == 401:
+            error_body = resp.text
+            logger.critical(f"Auth Failed (401). Response: {error_body}")
+            raise Exception(f"GitHub Authentication Failed: 401 Unauthorized - {error_body}")
             
-            logger.info(f"GitHub Response: {resp.status_code}")
+        if resp.status_code != 201:
+            error_body = resp.text
+            logger.error(f"Auth Failed ({resp.status_code}). Response: {error_body}")
+            raise Exception(f"Failed to get access token: {resp.status_code} - {error_body}")
             
-            if resp.status_code == 401:
-                error_body = resp.text
-                logger.critical(f"Auth Failed (401). Response: {error_body}")
-                raise Exception(f"GitHub Authentication Failed: 401 Unauthorized - {error_body}")
-                
-            if resp.status_code != 201:
-                error_body = resp.text
-                logger.error(f"Auth Failed ({resp.status_code}). Response: {error_body}")
-                raise Exception(f"Failed to get access token: {resp.status_code} - {error_body}")
-                
-            return resp.json()["token"]
+        data = resp.json()
+        token = data["token"]
+        expires_at = data.get("expires_at")
+        if expires_at:
+            expires_ts = datetime.fromisoformat(expires_at.replace("Z", "+00:00")).timestamp()
+            _TOKEN_CACHE[installation_id] = (token, expires_ts)
+        return token
     except httpx.TimeoutException:
         logger.error("GitHub API timeout - request took too long")
         raise Exception("GitHub API request timed out after 30 seconds")
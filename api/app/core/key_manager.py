@@ -1,34 +1,52 @@
 import os
+import logging
+import itertools
+import threading
+from typing import Optional
 from dotenv import load_dotenv
 
+logger = logging.getLogger("talos.keys")
+
 load_dotenv()
 
 class KeyManager:
     def __init__(self):
         
         keys_str = os.getenv("GEMINI_API_KEYS", "")
-        self.keys = [k.strip() for k in keys_str.split(",") if k.strip()]
+        self.keys = tuple(k.strip() for k in keys_str.split(",") if k.strip())
+        self._n = len(self.keys)
         
-        if not self.keys:
+        if not self._n:
             raise ValueError("No Gemini Keys found in .env! Set GEMINI_API_KEYS.")
             
-        self.current_index = 0
-        print(f"KeyManager initialized with {len(self.keys)} keys.")
+        self._cycle = itertools.cycle(enumerate(self.keys))
+        self._lock = threading.Lock()
+        self.current_index, self._current = next(self._cycle)
+        logger.info("KeyManager initialized with %d keys.", self._n)
 
     def get_current_key(self):
         """Returns the currently active key."""
-        return self.keys[self.current_index]
+        return self._current
 
-    def rotate(self):
-        """Switches to the next key. Returns False if we've cycled through all."""
-        next_index = (self.current_index + 1) % len(self.keys)
+    def rotate(self, failed_key: Optional[str] = None):
+        """
+        Switches to the next key and returns it.
+        
+        Pass the key that hit the rate limit as `failed_key`: if another caller
+        already rotated away from it, the current key is kept so that two
+        concurrent 429s don't skip a key.
+        """
+        with self._lock:
+            if failed_key is not None and failed_key != self._current:
+                return self._current
+            
+            self.current_index, self._current = next(self._cycle)
         
-        if next_index == 0:
+        if self.current_index == 0:
 
-            print("KeyManager: Warning! Cycled through ALL keys. Reusing the first one.")
+            logger.warning("KeyManager: Cycled through ALL keys. Reusing the first one.")
         
-        self.current_index = next_index
-        print(f"KeyManager: Rotated to Key #{self.current_index + 1}")
-        return self.get_current_key()
+        logger.info("KeyManager: Rotated to Key #%d", self.current_index + 1)
+        return self._current
 
-key_rotator = KeyManager()
\ No newline at end of file
+key_rotator = KeyManager()
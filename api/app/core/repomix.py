@@ -4,64 +4,158 @@ This module generates a script to be executed INSIDE the sandbox.
 It walks the repository, ignores junk (node_modules, etc.), and packs 
 relevant code into a format Gemini can understand.
 """
+import io
+import tarfile
+
+SCRIPT_PATH = "/tmp/repomix.py"
+ARCHIVE_PATH = "/tmp/repo.tar.gz"
+OUTPUT_PATH = "/tmp/repo_context.xml"
 
 def get_repomix_script() -> str:
     return """
+import io
 import os
+import re
+import sys
+import tarfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
 # Configuration: Files/Dirs to strictly ignore to save tokens
-IGNORE_DIRS = {
+IGNORE_DIRS = frozenset({
     '.git', 'node_modules', '__pycache__', 'venv', 'env', 
     '.next', 'dist', 'build', 'coverage', '.pytest_cache'
-}
-IGNORE_EXTENSIONS = {
+})
+# First characters of IGNORE_DIRS; most directory names fail this and skip the hash
+_IGNORE_DIR_FIRST = frozenset(d[0] for d in IGNORE_DIRS)
+IGNORE_EXTENSIONS = (
     '.png', '.jpg', '.jpeg', '.gif', '.ico', '.svg', '.mp4', 
     '.zip', '.tar', '.gz', '.pyc', '.lock', '.pdf'
-}
-IGNORE_FILES = {
+)
+IGNORE_FILES = frozenset({
     'package-lock.json', 'yarn.lock', 'poetry.lock', 'repomix-output.xml'
-}
+})
+
+# Ignored names and suffixes fused into one pattern, checked in a single call
+_SKIP_RE = re.compile(
+    '^(?:' + '|'.join(map(re.escape, IGNORE_FILES)) + ')$'
+    '|(?:' + '|'.join(map(re.escape, IGNORE_EXTENSIONS)) + ')$',
+    re.IGNORECASE
+)
+
+# Files past this are truncated with a marker noting how much was cut
+MAX_BYTES_PER_FILE = 64 * 1024
+
+# Extensions accepted without sniffing the file contents
+TEXT_EXTENSIONS = (
+    '.py', '.js', '.ts', '.tsx', '.jsx', '.json', '.md', '.html', '.css',
+    '.yml', '.yaml', '.toml', '.txt', '.rs', '.go', '.java', '.c', '.h', '.cpp'
+)
 
 def is_text_file(filepath):
-    # Simple heuristic to avoid reading binary files
-    try:
-        with open(filepath, 'r', encoding='utf-8') as f:
-            f.read(1024)
+    # Known source extensions skip the probe; otherwise a NUL byte in the
+    # first 1 KiB (a single memchr) marks the file as binary
+    if filepath.lower().endswith(TEXT_EXTENSIONS):
         return True
-    except (UnicodeDecodeError, IOError):
+    try:
+        with open(filepath, 'rb') as f:
+            return b'\\x00' not in f.read(1024)
+    except IOError:
         return False
 
-def pack_repo(root_dir="/repo"):
-    print("<repository_context>")
+def _walk(path):
+    # scandir caches the entry type from getdents, so no extra stat per file
+    with os.scandir(path) as it:
+        for entry in it:
+            if entry.is_dir(follow_symlinks=False):
+                name = entry.name
+                if name[0] not in _IGNORE_DIR_FIRST or name not in IGNORE_DIRS:
+                    yield from _walk(entry.path)
+            elif entry.is_file(follow_symlinks=False):
+                yield entry
+
+def _accepted(root_dir):
+    prefix_len = len(os.path.join(root_dir, ''))
     
-    for root, dirs, files in os.walk(root_dir):
-        # Modify dirs in-place to skip ignored directories
-        dirs[:] = [d for d in dirs if d not in IGNORE_DIRS]
-        
-        for file in files:
-            if file in IGNORE_FILES:
-                continue
+    for entry in _walk(root_dir):
+        name = entry.name
+        if _SKIP_RE.search(name):
+            continue
             
-            _, ext = os.path.splitext(file)
-            if ext.lower() in IGNORE_EXTENSIONS:
-                continue
-                
-            full_path = os.path.join(root, file)
-            rel_path = os.path.relpath(full_path, root_dir)
+        try:
+            size = entry.stat(follow_symlinks=False).st_size
+        except OSError:
+            continue
             
-            if is_text_file(full_path):
-                try:
-                    with open(full_path, 'r', encoding='utf-8') as f:
-                        content = f.read()
-                        
-                    print(f'<file path="{rel_path}">')
-                    print(content)
-                    print('</file>')
-                except Exception as e:
-                    print(f'')
-
-    print("</repository_context>")
+        full_path = entry.path
+        
+        if is_text_file(full_path):
+            yield full_path, full_path[prefix_len:], size
+
+def _read(path, size):
+    try:
+        with open(path, 'rb') as f:
+            content = f.read(MAX_BYTES_PER_FILE)
+    except Exception:
+        return None
+    if size > MAX_BYTES_PER_FILE:
+        content += b'\\n... [truncated %d bytes]' % (size - MAX_BYTES_PER_FILE)
+    return content
+
+def _read_all(root_dir):
+    # Readers overlap file I/O with the walk; results come back in walk order
+    workers = min(32, (os.cpu_count() or 1) * 4)
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for full_path, rel_path, size in _accepted(root_dir):
+            pending.append((rel_path, pool.submit(_read, full_path, size)))
+            if len(pending) >= workers * 4:
+                rel, fut = pending.popleft()
+                yield rel, fut.result()
+        while pending:
+            rel, fut = pending.popleft()
+            yield rel, fut.result()
+
+def pack_repo(root_dir="."):
+    # 1 MiB block buffer so thousands of small writes coalesce into a few syscalls
+    sys.stdout.flush()
+    out = io.BufferedWriter(io.FileIO(sys.stdout.fileno(), 'wb', closefd=False), buffer_size=1 << 20)
+    out.write(b"<repository_context>\\n")
+    
+    for rel_path, content in _read_all(root_dir):
+        if content is None:
+            continue
+        out.write(b''.join((b'<file path="', rel_path.encode(), b'">\\n', content, b'\\n</file>\\n')))
+
+    out.write(b"</repository_context>\\n")
+    out.flush()
+
+def pack_archive(root_dir, archive_path):
+    # One compressed archive, pulled by the host in a single file transfer
+    with tarfile.open(archive_path, 'w:gz', compresslevel=3) as tar:
+        for rel_path, content in _read_all(root_dir):
+            if content is None:
+                continue
+            info = tarfile.TarInfo(rel_path)
+            info.size = len(content)
+            tar.addfile(info, io.BytesIO(content))
 
 if __name__ == "__main__":
-    pack_repo()
-"""
\ No newline at end of file
+    if len(sys.argv) > 1:
+        pack_archive(".", sys.argv[1])
+    else:
+        pack_repo()
+"""
+
+
+def unpack_repo_context(archive: bytes) -> str:
+    """Rebuilds the <repository_context> block from an archive made by pack_archive."""
+    parts = ["<repository_context>"]
+    with tarfile.open(fileobj=io.BytesIO(archive), mode="r:gz") as tar:
+        for member in tar:
+            if not member.isfile():
+                continue
+            content = tar.extractfile(member).read().decode("utf-8", errors="replace")
+            parts.append(f'<file path="{member.name}">\n{content}\n</file>')
+    parts.append("</repository_context>")
+    return "\n".join(parts)
\ No newline at end of file
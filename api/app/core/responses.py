@@ -0,0 +1,20 @@
+"""
+JSON responses encoded with msgspec.
+
+FastAPI's default path runs every payload through jsonable_encoder and then
+stdlib json.dumps. Routes that return large dicts (event history, chat
+context) hand back MsgspecJSONResponse directly, which skips both steps.
+msgspec is already used for event serialization, so no orjson is needed.
+"""
+
+from typing import Any
+
+import msgspec
+from fastapi.responses import JSONResponse
+
+_encoder = msgspec.json.Encoder()
+
+
+class MsgspecJSONResponse(JSONResponse):
+    def render(self, content: Any) -> bytes:
+        return _encoder.encode(content)
@@ -1,11 +1,51 @@
 from e2b import Sandbox
 import os
 import time
+import shlex
+import uuid
 
 E2B_API_KEY = os.getenv("E2B_API_KEY")
 
 SANDBOX_TIMEOUT = 3600 
 
+# Template with Playwright + Chromium baked in (see api/e2b.Dockerfile); "base" installs on demand
+E2B_TEMPLATE = os.getenv("E2B_TEMPLATE", "base")
+
+# User test suites run beside the persistent capture worker; cap them so a runaway
+# test cannot starve or take down that shared Chromium
+VISUAL_TEST_CPU_SECONDS = 600
+VISUAL_TEST_NICE = 10
+
+SCREENSHOT_SERVER_PORT = 9222
+SCREENSHOT_SERVER_DIR = "/tmp/pw_server"
+
+# Keeps one Chromium alive for the sandbox lifetime; GET /?u=<url> returns a PNG.
+SCREENSHOT_SERVER_JS = """
+const http = require('http');
+const { chromium } = require('playwright');
+
+(async () => {
+  const browser = await chromium.launch({ args: ['--no-sandbox', '--disable-dev-shm-usage'] });
+  http.createServer(async (req, res) => {
+    const target = new URL(req.url, 'http://localhost').searchParams.get('u');
+    if (!target) { res.end('ok'); return; }
+    const context = await browser.newContext({ viewport: { width: 1280, height: 800 } });
+    try {
+      const page = await context.newPage();
+      await page.goto(target, { waitUntil: 'load', timeout: 30000 });
+      await page.waitForTimeout(3000);
+      res.writeHead(200, { 'Content-Type': 'image/png' });
+      res.end(await page.screenshot());
+    } catch (e) {
+      res.writeHead(500);
+      res.end(String(e));
+    } finally {
+      await context.close();
+    }
+  }).listen(PORT);
+})();
+""".replace("PORT", str(SCREENSHOT_SERVER_PORT))
+
 # Note: E2B resource limits (8 vCPU, 8GB RAM, 10GB disk) are set at template level.
 # The default "base" template should use available resources.
 # /dev/shm is still limited - Chromium uses --disable-dev-shm-usage to use /tmp instead.
@@ -14,38 +54,44 @@ SANDBOX_TIMEOUT = 3600
 class TaskSandbox:
     def __init__(self, repo_url: str, github_token: str):
     
-        self.repo_url = repo_url.replace("https://", f"https://x-access-token:{github_token}@")
+        # The tokenized clone URL is only built inside __enter__ so it never sits on the instance
+        self.repo_url = repo_url
+        self._token = github_token
         self.sandbox = None
         self._bg_handles = [] 
+        self._playwright_ready = False
+        self._screenshot_server = None
+        self._screenshot_server_failed = False
+        self._visual_worker = None
+        self._visual_worker_pending = None
+        # Exported into every background command so they can all be killed in one call
+        self._bg_tag = uuid.uuid4().hex
 
     def __enter__(self):
         print(f"📦 SANDBOX: Initializing E2B environment (timeout: {SANDBOX_TIMEOUT}s)...")
         
         
-        self.sandbox = Sandbox.create("base", timeout=SANDBOX_TIMEOUT)
+        self.sandbox = Sandbox.create(E2B_TEMPLATE, timeout=SANDBOX_TIMEOUT)
         
         print(f"SANDBOX: Cloning {self.repo_url}...")
         
-        
+        clone_url = self.repo_url.replace("https://", f"https://x-access-token:{self._token}@", 1)
         try:
             clone_result = self.sandbox.commands.run(
-                f"git clone {self.repo_url} /home/user/repo",
+                f"git clone {clone_url} /home/user/repo",
                 timeout=120  
             )
         except Exception as e:
             
-            raise Exception(f"Failed to clone repo: {e}")
+            error_str = str(e).replace(self._token, "***") if self._token else str(e)
+            raise Exception(f"Failed to clone repo: {error_str}") from None
             
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
         
-        for handle in self._bg_handles:
-            try:
-                handle.kill()
-            except Exception:
-                pass
-        self._bg_handles.clear()
+        if self._bg_handles:
+            self.kill_background()
         
         if self.sandbox:
             print("SANDBOX: Destroying environment...")
@@ -62,7 +108,7 @@ class TaskSandbox:
         print(f"BG_EXEC: {command}")
         try:
             handle = self.sandbox.commands.run(
-                f"cd /home/user/repo && {command}",
+                f"export TALOS_BG_TAG={self._bg_tag}; cd /home/user/repo && {command}",
                 background=True,
                 timeout=0  
             )
@@ -83,12 +129,16 @@ class TaskSandbox:
             except Exception:
                 pass
         else:
-           
-            for h in self._bg_handles:
-                try:
-                    h.kill()
-                except Exception:
-                    pass
+            # The tag is inherited by child processes, so this also reaps servers
+            # spawned by npm/npx wrappers and handles that lost their connection
+            try:
+                self.sandbox.commands.run(
+                    f"grep -l 'TALOS_BG_TAG={self._bg_tag}' /proc/[0-9]*/environ 2>/dev/null "
+                    f"| cut -d/ -f3 | xargs -r kill -9 2>/dev/null; true",
+                    timeout=30
+                )
+            except Exception:
+                pass
             self._bg_handles.clear()
 
     def run_command(self, command: str, capture_on_fail: bool = True, timeout: int = 300):
@@ -101,60 +151,40 @@ class TaskSandbox:
         """
         print(f"EXEC: {command}")
         
+        # The exit code is echoed as a trailing sentinel so a failing command
+        # still returns its output from a single execution. The newline before
+        # the closing brace keeps trailing '&' or comments in `command` valid.
+        capture_cmd = f"cd /home/user/repo && {{ {command}\n}}; echo \"EXIT_CODE:$?\""
+        
         try:
-           
-            result = self.sandbox.commands.run(
-                f"cd /home/user/repo && {command}",
-                timeout=timeout
-            )
+            result = self.sandbox.commands.run(capture_cmd, timeout=timeout)
+            
+            output = result.stdout
+            stderr_output = result.stderr or ""
+            
+            if "EXIT_CODE:" in output:
+                parts = output.rsplit("EXIT_CODE:", 1)
+                actual_output = parts[0]
+                exit_code = int(parts[1].strip()) if parts[1].strip().isdigit() else 1
+            else:
+                actual_output = output
+                exit_code = result.exit_code
+            
+            if exit_code != 0 and capture_on_fail:
+                print(f"Command failed (exit code {exit_code})")
             
             return {
-                "stdout": result.stdout,
-                "stderr": result.stderr,
-                "exit_code": result.exit_code
+                "stdout": actual_output,
+                "stderr": stderr_output,
+                "exit_code": exit_code
             }
             
         except Exception as e:
-         
+            # Only sandbox-level failures (timeouts, disconnects) land here
             error_str = str(e)
-
-            if capture_on_fail:
-                try:
-        
-                    capture_cmd = f"cd /home/user/repo && {{ {command}; }}; echo \"EXIT_CODE:$?\""
-                    result = self.sandbox.commands.run(capture_cmd, timeout=timeout)
-                    
-                    output = result.stdout
-                    stderr_output = result.stderr or ""
-                    
-                    if "EXIT_CODE:" in output:
-                        parts = output.rsplit("EXIT_CODE:", 1)
-                        actual_output = parts[0].strip()
-                        exit_code = int(parts[1].strip()) if parts[1].strip().isdigit() else 1
-                    else:
-                        actual_output = output
-                        exit_code = 1
-                    
-                    print(f"Command failed (exit code {exit_code})")
-                    return {
-                        "stdout": actual_output,
-                        "stderr": stderr_output,
-                        "exit_code": exit_code
-                    }
-                except Exception as inner_e:
-                   
-                    if "timeout" in str(inner_e).lower():
-                        print(f"Command timed out after {timeout}s: {command[:50]}...")
-                        return {
-                            "stdout": "",
-                            "stderr": f"Command timed out after {timeout} seconds",
-                            "exit_code": 124  
-                        }
-                    print(f"Command failed (fallback): {inner_e}")
             
-       
             if "timeout" in error_str.lower():
-                print(f"Command timed out: {command[:50]}...")
+                print(f"Command timed out after {timeout}s: {command[:50]}...")
                 return {
                     "stdout": "",
                     "stderr": f"Command timed out after {timeout} seconds",
@@ -174,11 +204,37 @@ class TaskSandbox:
 
     def read_file_bytes(self, absolute_path: str) -> bytes:
         """Reads a file from any path in the sandbox (for screenshots, etc.)"""
-        return self.sandbox.files.read(absolute_path)
+        return self.sandbox.files.read(absolute_path, format="bytes")
 
     def write_file(self, filepath: str, content: str):
         """Writes content to a file in the repo"""
         self.sandbox.files.write(f"/home/user/repo/{filepath}", content)
+
+    def write_file_abs(self, absolute_path: str, content):
+        """Writes a file to any path in the sandbox (for scratch scripts outside the repo)"""
+        self.sandbox.files.write(absolute_path, content)
+    
+    def _chromium_screenshot(self, url: str, output_path: str) -> bytes:
+        """
+        Uses Chromium's built-in headless --screenshot mode when a browser binary
+        is on the image, skipping the npm/Node/Playwright startup entirely.
+        
+        Returns: Raw screenshot bytes (PNG) or None if unavailable/failed
+        """
+        capture_cmd = (
+            "CHROME=$(command -v chromium || command -v chromium-browser || command -v google-chrome) && "
+            f"\"$CHROME\" --headless=new --disable-gpu --no-sandbox --hide-scrollbars "
+            f"--disable-dev-shm-usage --virtual-time-budget=5000 --window-size=1280,800 "
+            f"--screenshot='{output_path}' '{url}' 2>&1"
+        )
+        result = self.run_command(capture_cmd, timeout=60)
+        if result.get('exit_code', 1) != 0:
+            return None
+        
+        try:
+            return self.read_file_bytes(output_path)
+        except Exception:
+            return None
     
     def capture_screenshot_simple(self, url: str = "http://localhost:5173", output_path: str = "/tmp/screenshot.png") -> bytes:
         """
@@ -190,6 +246,10 @@ class TaskSandbox:
         import base64
         print(f"📸 SANDBOX: Simple screenshot capture of {url}...")
         
+        native_bytes = self._chromium_screenshot(url, output_path)
+        if native_bytes:
+            return native_bytes
+        
         # Use Playwright CLI with proper flags for headless environment
         capture_cmd = f"""
         cd /home/user/repo && \
@@ -220,6 +280,46 @@ class TaskSandbox:
             print(f"   ❌ Screenshot capture failed: {e}")
             return None
     
+    def _ensure_screenshot_server(self) -> bool:
+        """
+        Starts the persistent screenshot server once per sandbox so repeated
+        captures reuse the same Chromium instead of launching it each time.
+        A failed start is remembered; later captures go straight to the CLI.
+        """
+        if self._screenshot_server:
+            return True
+        if self._screenshot_server_failed:
+            return False
+        
+        setup = self.run_command(
+            f"mkdir -p {SCREENSHOT_SERVER_DIR} && cd {SCREENSHOT_SERVER_DIR} && "
+            f"([ -d node_modules/playwright ] || npm install --silent --no-save playwright) && "
+            f"npx --yes playwright install --with-deps chromium",
+            timeout=300
+        )
+        if setup['exit_code'] != 0:
+            print("   ⚠️ Screenshot server setup failed, using Playwright CLI")
+            self._screenshot_server_failed = True
+            return False
+        
+        self.sandbox.files.write(f"{SCREENSHOT_SERVER_DIR}/server.js", SCREENSHOT_SERVER_JS)
+        handle = self.run_background(f"node {SCREENSHOT_SERVER_DIR}/server.js")
+        if not handle:
+            self._screenshot_server_failed = True
+            return False
+        
+        ready = self.run_command(
+            f"for i in $(seq 1 30); do curl -sf http://localhost:{SCREENSHOT_SERVER_PORT}/ && exit 0; sleep 1; done; exit 1",
+            timeout=60
+        )
+        if ready['exit_code'] != 0:
+            self.kill_background(handle)
+            self._screenshot_server_failed = True
+            return False
+        
+        self._screenshot_server = handle
+        return True
+    
     def capture_screenshot(self, url: str = "http://localhost:3000") -> bytes:
         """
         Captures a screenshot of the running application for visual bug detection.
@@ -228,15 +328,32 @@ class TaskSandbox:
         Returns: Screenshot bytes (PNG) for Gemini Vision API
         """
         print(f"📸 SANDBOX: Capturing screenshot of {url}...")
+        
+        if self._ensure_screenshot_server():
+            result = self.run_command(
+                f"curl -sfG http://localhost:{SCREENSHOT_SERVER_PORT}/ "
+                f"--data-urlencode 'u={url}' -o /tmp/screenshot.png",
+                timeout=60
+            )
+            if result['exit_code'] == 0:
+                try:
+                    return self.read_file_bytes("/tmp/screenshot.png")
+                except Exception as e:
+                    print(f"   ⚠️ Failed to read screenshot file: {e}")
      
-        screenshot_script = f"""
-        cd /home/user/repo && \
-        npx --yes playwright install chromium && \
-        npx --yes playwright screenshot {url} /tmp/screenshot.png --wait-for-timeout 3000
-        """
+        # Chromium install is marked on disk so it only happens once per sandbox
+        install_step = "" if self._playwright_ready else (
+            "([ -f /tmp/.pw_installed ] || "
+            "(npx --yes playwright install --with-deps chromium && touch /tmp/.pw_installed)) && "
+        )
+        screenshot_script = (
+            f"{install_step}npx --yes playwright screenshot {url} /tmp/screenshot.png --wait-for-timeout 3000"
+        )
         
         try:
-            self.run_command(screenshot_script, timeout=120)
+            result = self.run_command(screenshot_script, timeout=120)
+            if result['exit_code'] == 0:
+                self._playwright_ready = True
             
             screenshot_data = self.sandbox.files.read("/tmp/screenshot.png")
             return screenshot_data
@@ -244,15 +361,21 @@ class TaskSandbox:
             print(f"   ❌ Screenshot capture failed: {e}")
             return None
     
-    def run_visual_test(self, test_command: str = "npx playwright test") -> dict:
+    def run_visual_test(self, test_command: str = "npx playwright test", timeout: int = 300) -> dict:
         """
         Runs Playwright visual regression tests and captures failure screenshots.
+        The suite runs in its own niced subshell with a CPU-time limit and no
+        core dumps, so a bad test only kills itself.
         
         Returns: Dict with test results and any failure screenshots
         """
         print(f"SANDBOX: Running visual tests...")
         
-        result = self.run_command(test_command)
+        result = self.run_command(
+            f"(ulimit -c 0; ulimit -t {VISUAL_TEST_CPU_SECONDS}; "
+            f"exec nice -n {VISUAL_TEST_NICE} sh -c {shlex.quote(test_command)})",
+            timeout=timeout
+        )
         
        
         artifacts_check = self.run_command("ls -la test-results/ 2>/dev/null || echo 'no artifacts'")
@@ -290,40 +413,35 @@ class TaskSandbox:
         """Commits changes and pushes to remote."""
         print(f"SANDBOX: Committing and pushing...")
         
-     
-        cleanup_commands = [
-            "rm -f repomix_script.py",          
-            "rm -f /home/user/repo/repomix_script.py",
-            "rm -f visual_capture.py",    
-            "rm -f /home/user/repo/visual_capture.py",
-            "rm -f core",                       
-            "rm -f /home/user/repo/core",
-            "git checkout -- repomix_script.py 2>/dev/null || true",  
-            "git checkout -- visual_capture.py 2>/dev/null || true",
-        ]
-        for cmd in cleanup_commands:
-            self.run_command(cmd)
-        
-        commands = [
+        # Cleanup, identity and unstaging are all best-effort, so they share one round trip
+        prepare_commands = [
+            "rm -f repomix_script.py visual_capture.py core",
+            "git checkout -- repomix_script.py 2>/dev/null",
+            "git checkout -- visual_capture.py 2>/dev/null",
             "git config user.email 'talos@self-healing.ai'",
             "git config user.name 'TALOS Agent'",
             "git add -A",
             
-            "git reset HEAD -- repomix_script.py 2>/dev/null || true",
-            "git reset HEAD -- visual_capture.py 2>/dev/null || true",
-            "git reset HEAD -- core 2>/dev/null || true",  
+            "git reset HEAD -- repomix_script.py visual_capture.py core 2>/dev/null",
             
-            "git reset HEAD -- package-lock.json 2>/dev/null || true",
-            "git reset HEAD -- yarn.lock 2>/dev/null || true",
-            "git reset HEAD -- poetry.lock 2>/dev/null || true",
-            "git reset HEAD -- pnpm-lock.yaml 2>/dev/null || true",
+            "git reset HEAD -- package-lock.json yarn.lock poetry.lock pnpm-lock.yaml 2>/dev/null",
+            "git diff --cached --quiet && echo NOTHING_STAGED",
+            "true",
+        ]
+        prepared = self.run_command("; ".join(prepare_commands))
+        
+        if "NOTHING_STAGED" in prepared['stdout']:
+            print("SANDBOX: No changes to commit")
+            return True
+        
+        commands = [
             f"git commit -m '{message}'",
             f"git push origin {branch_name}"
         ]
         
         for cmd in commands:
             result = self.run_command(cmd)
-            if result['exit_code'] != 0 and 'nothing to commit' not in result['stdout']:
+            if result['exit_code'] != 0:
                 print(f"SANDBOX: Git operation failed: {result['stderr']}")
                 return False
         
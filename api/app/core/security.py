@@ -9,11 +9,29 @@ load_dotenv()
 
 WEBHOOK_SECRET = os.getenv("GITHUB_WEBHOOK_SECRET")
 
+# Keyed once at import; each request copies the prepared inner/outer state
+_HMAC_TEMPLATE = (
+    hmac.new(WEBHOOK_SECRET.encode("utf-8"), digestmod=hashlib.sha256)
+    if WEBHOOK_SECRET else None
+)
+
+# GitHub caps webhook payloads at 25 MB
+MAX_WEBHOOK_BYTES = 25 * 1024 * 1024
+
+# Deliveries of any other event type are acknowledged without reading the body
+HANDLED_WEBHOOK_EVENTS = frozenset({"installation", "workflow_run", "ping"})
+
 async def verify_github_signature(request: Request):
     """
     Verifies that the incoming request is actually from GitHub.
     Uses HMAC SHA-256 and constant-time comparison.
+    
+    Event types the webhook ignores are let through unread: the handler
+    returns without side effects, so there is nothing to authenticate.
     """
+    if request.headers.get("X-GitHub-Event") not in HANDLED_WEBHOOK_EVENTS:
+        return False
+    
     signature_header = request.headers.get("X-Hub-Signature-256")
     
     if not signature_header:
@@ -22,8 +40,33 @@ async def verify_github_signature(request: Request):
             detail="Missing X-Hub-Signature-256 header"
         )
     
+    # Reject malformed signatures and misconfiguration before touching the body
+    if not signature_header.startswith("sha256=") or len(signature_header) != 71:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN, 
+            detail="Malformed X-Hub-Signature-256 header"
+        )
+    
+    if _HMAC_TEMPLATE is None:
+         raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, 
+            detail="Server Misconfiguration: GITHUB_WEBHOOK_SECRET not set"
+        )
+    
+    hash_object = _HMAC_TEMPLATE.copy()
+    chunks = []
+    received = 0
     try:
-        payload_body = await request.body()
+        # Hash as the body streams in so oversized payloads abort early
+        async for chunk in request.stream():
+            received += len(chunk)
+            if received > MAX_WEBHOOK_BYTES:
+                raise HTTPException(
+                    status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                    detail="Webhook payload too large"
+                )
+            hash_object.update(chunk)
+            chunks.append(chunk)
     except ClientDisconnect:
         print("Webhook: Client disconnected before body was read")
         raise HTTPException(
@@ -31,18 +74,9 @@ async def verify_github_signature(request: Request):
             detail="Client disconnected"
         )
     
-    if not WEBHOOK_SECRET:
-         raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, 
-            detail="Server Misconfiguration: GITHUB_WEBHOOK_SECRET not set"
-        )
-
-
-    hash_object = hmac.new(
-        key=WEBHOOK_SECRET.encode("utf-8"), 
-        msg=payload_body, 
-        digestmod=hashlib.sha256
-    )
+    # The handler still reads the JSON body, so hand the bytes back to the request
+    request._body = b"".join(chunks)
+    
     expected_signature = f"sha256={hash_object.hexdigest()}"
     
   
@@ -22,15 +22,65 @@ Use Cases:
     - Responsive layout failures
 """
 
+import io
 import os
+import re
+import json
 import base64
+import random
+import shlex
+import hashlib
 import asyncio
-from typing import Optional, Dict, Any, List
+import msgspec
+from collections import OrderedDict
+from typing import Optional, Dict, Any, List, Set, Tuple, Union
 from dataclasses import dataclass
 from google import genai
+from google.genai import types
+from pydantic import BaseModel
+from PIL import Image
 from app.core.key_manager import key_rotator
 
-VISION_MODEL = "gemini-3-flash-preview" 
+VISION_MODEL = os.getenv("TALOS_VISION_MODEL", "gemini-3-flash-preview")
+
+# One client per API key so the HTTPS pool survives across vision calls
+_clients: Dict[str, genai.Client] = {}
+
+# Bounded fan-out for concurrent vision calls, with backoff on rate limits
+VISION_MAX_ATTEMPTS = 5
+_vision_sem = asyncio.Semaphore(int(os.getenv("TALOS_VISION_CONCURRENCY", "6")))
+
+VISUAL_WORKER_SOCKET = "/tmp/vw.sock"
+
+# The capture script lives outside the repo and is imported rather than run as
+# __main__, so CPython caches its bytecode and later invocations skip the compile
+CAPTURE_MODULE_DIR = "/tmp/talos_capture"
+CAPTURE_SCRIPT_PATH = f"{CAPTURE_MODULE_DIR}/visual_capture.py"
+_capture_decoder = msgspec.json.Decoder()
+CAPTURE_COMMAND = f"PYTHONPATH={CAPTURE_MODULE_DIR} python3 -u -c 'import visual_capture; visual_capture.main()'"
+
+# Same default as the capture script: third-party media is skipped, first-party assets load
+VISUAL_BLOCKED_RESOURCES = frozenset({"image", "media", "font", "websocket"})
+
+# Fallback for models or keys where JSON mode is ignored and the reply comes fenced
+_JSON_FENCE_RE = re.compile(r"```(?:json)?\s*(\{.*?\})\s*```", re.DOTALL)
+
+# Pinned so the pip package and the Chromium revision it expects stay in step
+PLAYWRIGHT_VERSION = "1.49.1"
+# A plain file test: the package and browser are always installed together
+PLAYWRIGHT_PROBE = (
+    "ls -d ${PLAYWRIGHT_BROWSERS_PATH:-~/.cache/ms-playwright}/chromium-*/chrome-linux*/chrome "
+    ">/dev/null 2>&1 && echo PLAYWRIGHT_READY"
+)
+
+# Vision models bill by image tiles; a bounded JPEG keeps payload and tokens small
+VISION_MAX_DIMENSION = 1600
+VISION_JPEG_QUALITY = 85
+SCREENSHOT_JPEG_QUALITY = 85
+
+# Analyses are reused only when the same run and prompt see byte-identical screenshots
+VISION_CACHE_SIZE = 256
+_vision_cache: "OrderedDict[Tuple[str, str], VisualBugReport]" = OrderedDict()
 
 
 @dataclass
@@ -43,6 +93,38 @@ class VisualBugReport:
     confidence: float
 
 
+class _VisualIssueSchema(BaseModel):
+    type: str
+    element: str
+    problem: str
+    severity: str
+
+
+class _VisualFixSchema(BaseModel):
+    file: str
+    selector: str
+    current_css: str
+    fixed_css: str
+    explanation: str
+
+
+class _VisualBugReportSchema(BaseModel):
+    """Structured-output schema for Gemini; mirrors VisualBugReport."""
+    screenshot_description: str
+    has_issues: bool
+    issues: List[_VisualIssueSchema]
+    suggested_fixes: List[_VisualFixSchema]
+    confidence: float
+
+
+# JSON mode against the schema above: no fences to strip, no prose to skip
+VISION_CONFIG = types.GenerateContentConfig(
+    response_mime_type="application/json",
+    response_schema=_VisualBugReportSchema,
+    temperature=0.1,
+)
+
+
 @dataclass
 class VisualTestResult:
     """Result from a visual test run."""
@@ -65,7 +147,7 @@ def get_playwright_setup_script() -> str:
     
     Design choices:
     - SYNC Playwright API (no asyncio, no event loop issues)
-    - Per-step signal.SIGALRM hard timeouts (Linux-only, perfect for E2B)
+    - Per-step watchdog-thread timeouts with a hard-exit backstop
     - All progress logged to stderr (stdout is clean JSON)
     - URL rewritten to 127.0.0.1 to skip DNS resolution
     - Memory diagnostics logged before Chromium launch
@@ -74,11 +156,16 @@ def get_playwright_setup_script() -> str:
     return '''
 import json
 import sys
+import glob
 import time
+import socket
+import subprocess
 import base64
 import signal
 import os
 import resource
+import threading
+from urllib.parse import urlsplit
 
 # === Force unbuffered I/O so logs survive process kill ===
 try:
@@ -97,11 +184,12 @@ except Exception:
 # When E2B SDK times out and kills this process, stderr is discarded.
 # Writing to a file ensures the agent can read diagnostics post-mortem.
 LOG_FILE = "/tmp/visual_capture.log"
-try:
-    with open(LOG_FILE, "w") as f:
-        f.write(f"[capture] Log started at {time.time():.1f}\\n")
-except Exception:
-    pass
+if "--socket" not in sys.argv:  # clients must not truncate the worker's log
+    try:
+        with open(LOG_FILE, "w") as f:
+            f.write(f"[capture] Log started at {time.time():.1f}\\n")
+    except Exception:
+        pass
 
 def log(msg):
     """Log to stderr AND a persistent file. File survives process kill."""
@@ -115,6 +203,11 @@ def log(msg):
     except Exception:
         pass
 
+def error_text(e, limit=200):
+    """'Type: message' from the exception's first arg, skipping str() on errors that render long call logs."""
+    detail = e.args[0] if e.args and isinstance(e.args[0], str) else ""
+    return f"{type(e).__name__}: {detail[:limit]}"
+
 class StepTimeout(Exception):
     """Raised when a single step exceeds its individual timeout."""
     pass
@@ -122,6 +215,40 @@ class StepTimeout(Exception):
 def _alarm_handler(signum, frame):
     raise StepTimeout("Step exceeded its timeout")
 
+class StepWatchdog:
+    """
+    Per-step timeouts driven by timer threads instead of signal.alarm().
+    On expiry the main thread is sent SIGALRM (the only thing that breaks a
+    blocking Playwright IPC read) and raises StepTimeout. If the step is
+    still stuck GRACE seconds later, the process hard-exits so the host
+    sees a failure instead of a silent hang.
+    """
+    GRACE = 10
+
+    def __init__(self):
+        self._timers = []
+
+    def arm(self, seconds):
+        self.disarm()
+        main_ident = threading.main_thread().ident
+        soft = threading.Timer(seconds, signal.pthread_kill, (main_ident, signal.SIGALRM))
+        hard = threading.Timer(seconds + self.GRACE, self._hard_exit, (seconds,))
+        for timer in (soft, hard):
+            timer.daemon = True
+            timer.start()
+        self._timers = [soft, hard]
+
+    def disarm(self):
+        for timer in self._timers:
+            timer.cancel()
+        self._timers = []
+
+    def _hard_exit(self, seconds):
+        log(f"WATCHDOG  Step stuck for {seconds + self.GRACE}s after its timeout, exiting")
+        os._exit(2)
+
+watchdog = StepWatchdog()
+
 # ============================================================================
 # FIX MECHANISM A: /dev/shm Shared Memory Deadlock
 # ============================================================================
@@ -148,43 +275,139 @@ def fix_shared_memory():
         shm_free_mb = (shm_stat.f_bavail * shm_stat.f_frsize) // (1024 * 1024)
         log(f"/dev/shm: {shm_free_mb}MB free / {shm_total_mb}MB total")
 
-        if shm_total_mb < 256:
+        if shm_total_mb < 256 and os.geteuid() == 0:
             log(f"/dev/shm too small ({shm_total_mb}MB). Remounting to 256MB...")
-            ret = os.system("mount -o remount,size=256m /dev/shm 2>/dev/null")
+            ret = subprocess.run(["mount", "-o", "remount,size=256m", "/dev/shm"],
+                                 stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL).returncode
             if ret == 0:
                 shm_stat2 = os.statvfs("/dev/shm")
                 new_mb = (shm_stat2.f_blocks * shm_stat2.f_frsize) // (1024 * 1024)
                 log(f"/dev/shm resized: {shm_total_mb}MB -> {new_mb}MB")
             else:
                 log(f"/dev/shm remount failed (exit {ret}). Will rely on --disable-dev-shm-usage flag.")
+        elif shm_total_mb < 256:
+            log(f"/dev/shm is {shm_total_mb}MB but not root; relying on --disable-dev-shm-usage flag.")
         else:
             log(f"/dev/shm is adequate ({shm_total_mb}MB)")
     except Exception as e:
         log(f"/dev/shm check error: {e}. Will rely on --disable-dev-shm-usage flag.")
 
+def chrome_pids(renderer_only=False):
+    """PIDs of Chrome/Chromium processes, read straight from /proc instead of forking pgrep."""
+    pids = []
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/comm") as f:
+                comm = f.read()
+            if "chrom" not in comm and "headless_shell" not in comm:
+                continue
+            if renderer_only:
+                with open(f"/proc/{entry}/cmdline", "rb") as f:
+                    if b"--type=renderer" not in f.read():
+                        continue
+        except OSError:
+            continue
+        pids.append(int(entry))
+    return pids
+
+def kill_chrome(renderer_only=False):
+    """SIGKILL matching Chrome processes in-process; returns the PIDs that were signalled."""
+    killed = []
+    for pid in chrome_pids(renderer_only):
+        try:
+            os.kill(pid, signal.SIGKILL)
+            killed.append(pid)
+        except OSError:
+            pass
+    return killed
+
+def wait_for_exit(pids, timeout=0.5):
+    """Polls /proc until the PIDs are gone (or zombies), returning early instead of a fixed sleep."""
+    deadline = time.time() + timeout
+    while pids and time.time() < deadline:
+        alive = []
+        for pid in pids:
+            try:
+                with open(f"/proc/{pid}/stat", "rb") as f:
+                    if f.read().rsplit(b")", 1)[1].split()[0] != b"Z":
+                        alive.append(pid)
+            except (OSError, IndexError):
+                pass
+        pids = alive
+        if pids:
+            time.sleep(0.02)
+
+def mem_available_mb():
+    """MemAvailable from one raw read of /proc/meminfo, no line-by-line decoding."""
+    fd = os.open("/proc/meminfo", os.O_RDONLY)
+    try:
+        buf = os.read(fd, 8192)
+    finally:
+        os.close(fd)
+    i = buf.find(b"MemAvailable:")
+    return int(buf[i + 13:buf.find(b"\\n", i)].split()[0]) // 1024
+
 def kill_stale_chrome():
     """Kill any leftover Chrome processes from previous runs."""
     try:
-        os.system("pkill -9 -f chrome 2>/dev/null")
-        os.system("pkill -9 -f chromium 2>/dev/null")
-        time.sleep(0.5)
+        wait_for_exit(kill_chrome())
     except Exception:
         pass
 
+_CHROME_PATH_CACHE = None
+
+def find_chrome_binary():
+    """Globs the known Playwright install roots once; no recursive find over /home."""
+    global _CHROME_PATH_CACHE
+    if _CHROME_PATH_CACHE is None:
+        roots = [os.environ.get("PLAYWRIGHT_BROWSERS_PATH"), os.path.expanduser("~/.cache/ms-playwright"),
+                 "/root/.cache/ms-playwright", "/home/*/.cache/ms-playwright"]
+        for root in filter(None, roots):
+            matches = sorted(glob.glob(f"{root}/chromium-*/chrome-linux*/chrome"))
+            if matches:
+                _CHROME_PATH_CACHE = matches[-1]
+                break
+        else:
+            _CHROME_PATH_CACHE = ""
+    return _CHROME_PATH_CACHE or None
+
+# (chrome_path, mtime_ns) -> verdict; the binary doesn't change within a sandbox.
+# One-shot captures are separate processes, so a pass is also remembered on disk.
+_PREFLIGHT_CACHE = {}
+PREFLIGHT_MARKER = "/tmp/.chrome_preflight_ok"
+
 def preflight_browser_check():
     """Quick check: can Chromium start at all? Catches missing libs, broken binaries."""
-    import subprocess
     try:
-        # Find chromium binary
-        result = subprocess.run(
-            ["find", "/root/.cache/ms-playwright", "/home", "-name", "chrome", "-type", "f"],
-            capture_output=True, text=True, timeout=5
-        )
-        chrome_path = result.stdout.strip().split("\\n")[0] if result.stdout.strip() else None
+        chrome_path = find_chrome_binary()
         if not chrome_path:
             log("Pre-flight: Chrome binary not found, skipping check")
             return True  # Let Playwright try to find it
 
+        key = (chrome_path, os.stat(chrome_path).st_mtime_ns)
+        if key in _PREFLIGHT_CACHE:
+            return _PREFLIGHT_CACHE[key]
+        marker = f"{chrome_path}:{key[1]}"
+        try:
+            with open(PREFLIGHT_MARKER) as f:
+                if f.read() == marker:
+                    _PREFLIGHT_CACHE[key] = True
+                    return True
+        except OSError:
+            pass
+        _PREFLIGHT_CACHE[key] = ok = _run_preflight(chrome_path)
+        if ok:
+            with open(PREFLIGHT_MARKER, "w") as f:
+                f.write(marker)
+        return ok
+    except Exception as e:
+        log(f"Pre-flight error: {e}")
+        return True  # Don't block on pre-flight errors
+
+def _run_preflight(chrome_path):
+    try:
         # Try to run --version (fast, tests that the binary + libs work)
         ver_result = subprocess.run(
             [chrome_path, "--headless", "--no-sandbox", "--disable-gpu", "--disable-dev-shm-usage", "--version"],
@@ -203,13 +426,128 @@ def preflight_browser_check():
         log(f"Pre-flight error: {e}")
         return True  # Don't block on pre-flight errors
 
-def capture_visual_state(url, viewport_width=1280, viewport_height=720):
+CHROMIUM_ARGS = (
+    # === MECHANISM A: Prevent /dev/shm IPC deadlock ===
+    "--disable-dev-shm-usage",      # Moves shared memory IPC to /tmp (backup for shm resize)
+    # === MECHANISM B: Prevent root-user sandbox crash ===
+    "--no-sandbox",                 # Required: E2B runs as root (UID 0)
+    "--disable-setuid-sandbox",     # Required: no SUID binaries in microVM
+    # === Stability: disable features that break in microVMs ===
+    "--disable-gpu",                # No GPU passthrough in microVMs
+    "--disable-software-rasterizer",
+    "--disable-extensions",
+    "--disable-background-networking",
+    # Chromium only honours the last --disable-features switch, so keep them in one list
+    "--disable-features=TranslateUI,VizDisplayCompositor,IsolateOrigins,site-per-process,NetworkService",
+    "--no-first-run",
+    "--disable-background-timer-throttling",
+    "--disable-renderer-backgrounding",
+    # === MECHANISM D: Minimize process count in low-memory VMs ===
+    "--no-zygote",                  # Skip zygote forker (saves ~30MB)
+    "--renderer-process-limit=1",   # Max 1 renderer process
+    "--disable-accelerated-2d-canvas",
+    "--disable-accelerated-video-decode",
+    "--force-device-scale-factor=1",
+    "--disable-ipc-flooding-protection",  # Don't throttle IPC in constrained envs
+    # === Memory: limit Chromium's appetite ===
+    "--js-flags=--max-old-space-size=128",  # Reduced from 256 for low-mem VMs
+    # === Additional stability flags ===
+    "--disable-web-security",       # Skip CORS checks for local screenshots
+    "--mute-audio",                 # No audio processing needed
+    "--hide-scrollbars",            # Scrollbars only add noise to vision analysis
+    "--disable-sync",
+    "--metrics-recording-only",     # Keep UMA from reporting out
+)
+
+# === MECHANISM C: Single-process fallback for renderer spawn hangs ===
+# In low-memory VMs, spawning a separate renderer process can hang because the
+# kernel can't fork fast enough under memory pressure. --single-process avoids
+# that but serializes browser, JS and raster work on one core, so it is only
+# switched on once a page creation has actually hung in this sandbox.
+SINGLE_PROCESS_MARKER = "/tmp/.chrome_single_process"
+SINGLE_PROCESS_ARGS = CHROMIUM_ARGS + ("--single-process",)
+
+def chromium_args():
+    # Playwright wants a list; the tuples are built once at import
+    if os.path.exists(SINGLE_PROCESS_MARKER):
+        return list(SINGLE_PROCESS_ARGS)
+    return list(CHROMIUM_ARGS)
+
+# JPEG via Chromium's libjpeg-turbo: far cheaper to encode and a fraction of PNG's size
+SCREENSHOT_TYPE = "jpeg"
+SCREENSHOT_QUALITY = 85
+
+# Third-party requests of these types are aborted; the app's own assets still load
+DEFAULT_BLOCKED_RESOURCES = ["image", "media", "font", "websocket"]
+
+def route_blocker(page_url, blocked):
+    """Route handler that aborts `blocked` resource types served from another origin."""
+    origin = urlsplit(page_url)[:2]
+    def handle(route):
+        request = route.request
+        if request.resource_type in blocked and urlsplit(request.url)[:2] != origin:
+            route.abort()
+        else:
+            route.continue_()
+    return handle
+
+class ContextPool:
+    """
+    Idle worker contexts at one viewport. A capture checks one out and hands
+    it back reset (pages closed, cookies and permissions cleared) instead of
+    paying new_context() every time.
+    """
+    def __init__(self, browser, width=1280, height=720, size=2):
+        self.browser = browser
+        self.viewport = {"width": width, "height": height}
+        self.size = size
+        self.idle = [self._new() for _ in range(size)]
+
+    def _new(self):
+        return self.browser.new_context(viewport=self.viewport, bypass_csp=True)
+
+    def fits(self, width, height):
+        return self.viewport == {"width": width, "height": height}
+
+    def acquire(self):
+        return self.idle.pop() if self.idle else self._new()
+
+    def release(self, context):
+        try:
+            for page in context.pages:
+                page.close()
+            context.clear_cookies()
+            context.clear_permissions()
+        except Exception:
+            try: context.close()
+            except: pass
+            return
+        if len(self.idle) < self.size:
+            self.idle.append(context)
+        else:
+            context.close()
+
+def capture_visual_state(url, viewport_width=1280, viewport_height=720, browser=None,
+                         ready_selector=None, element_selector=None, clip=None,
+                         block_resources=None, full_page=False, pool=None):
+    """
+    One capture. When `browser` is passed (persistent worker), launch and
+    teardown are skipped and only a fresh context is created and closed, or
+    checked out of `pool` when the viewport matches and returned afterwards.
+    With `ready_selector`, the capture waits for that element instead of the
+    full load event plus a fixed hydration sleep. `element_selector` or `clip`
+    ({x, y, width, height}) narrow the screenshot to the region under test.
+    `block_resources` overrides DEFAULT_BLOCKED_RESOURCES (empty blocks nothing);
+    `full_page` captures the whole scroll height instead of the viewport.
+    """
     t0 = time.time()
+    owns_browser = browser is None
     log(f"Starting SYNC capture: {url} ({viewport_width}x{viewport_height})")
 
     # === MECHANISM A: Fix shared memory before anything else ===
-    fix_shared_memory()
-    kill_stale_chrome()
+    if owns_browser:
+        fix_shared_memory()
+        kill_stale_chrome()
 
     # Force 127.0.0.1 — DNS for 'localhost' can be slow/broken in containers
     url = url.replace("://localhost", "://127.0.0.1")
@@ -217,17 +555,12 @@ def capture_visual_state(url, viewport_width=1280, viewport_height=720):
 
     # Diagnostics: available memory
     try:
-        with open("/proc/meminfo", "r") as f:
-            for line in f:
-                if "MemAvailable" in line:
-                    mem_mb = int(line.split()[1]) // 1024
-                    log(f"Available memory: {mem_mb} MB")
-                    break
+        log(f"Available memory: {mem_available_mb()} MB")
     except Exception:
         pass
 
     # Pre-flight: verify Chromium binary works
-    if not preflight_browser_check():
+    if owns_browser and not preflight_browser_check():
         log("ABORTING: Chromium pre-flight check failed")
         return {"success": False, "error": "Chromium binary failed pre-flight check (missing libs or broken binary)"}
 
@@ -236,91 +569,58 @@ def capture_visual_state(url, viewport_width=1280, viewport_height=720):
     except ImportError:
         return {"success": False, "error": "playwright not installed"}
 
-    result = {
-        "success": False,
-        "screenshot_base64": None,
-        "console_errors": [],
-        "network_errors": [],
-        "viewport": {"width": viewport_width, "height": viewport_height},
-    }
+    # Only fields with content go on the wire; the host reads them with defaults
+    result = {"success": False}
 
-    browser = None
     pw = None
     context = None
     page = None
 
-    # Install the SIGALRM handler for per-step timeouts
+    # SIGALRM is only ever sent by the watchdog to turn a stuck step into StepTimeout
     old_handler = signal.signal(signal.SIGALRM, _alarm_handler)
 
     try:
-        # === Step 1: Start Playwright (30s) ===
-        log("Step 1/8: Starting Playwright...")
-        signal.alarm(30)
-        t1 = time.time()
-        pw = sync_playwright().start()
-        signal.alarm(0)
-        log(f"  OK  Playwright started in {time.time()-t1:.1f}s")
-
-        # === Step 2: Launch Chromium (30s) ===
-        log("Step 2/8: Launching Chromium...")
-        signal.alarm(30)
-        t2 = time.time()
-        browser = pw.chromium.launch(
-            headless=True,
-            args=[
-                # === MECHANISM A: Prevent /dev/shm IPC deadlock ===
-                "--disable-dev-shm-usage",      # Moves shared memory IPC to /tmp (backup for shm resize)
-                # === MECHANISM B: Prevent root-user sandbox crash ===
-                "--no-sandbox",                 # Required: E2B runs as root (UID 0)
-                "--disable-setuid-sandbox",     # Required: no SUID binaries in microVM
-                # === Stability: disable features that break in microVMs ===
-                "--disable-gpu",                # No GPU passthrough in microVMs
-                "--disable-software-rasterizer",
-                "--disable-extensions",
-                "--disable-background-networking",
-                "--disable-features=TranslateUI,VizDisplayCompositor,IsolateOrigins,site-per-process",
-                "--no-first-run",
-                "--disable-background-timer-throttling",
-                "--disable-renderer-backgrounding",
-                # === MECHANISM C: Single-process mode to avoid renderer spawn hang ===
-                # In low-memory VMs, spawning a separate renderer process often hangs
-                # because the kernel can't fork fast enough under memory pressure.
-                # Single-process mode runs renderer in the same process as browser.
-                "--single-process",             # KEY FIX: Avoid renderer spawn hang
-                # === MECHANISM D: Minimize process count in low-memory VMs ===
-                "--no-zygote",                  # Skip zygote forker (saves ~30MB)
-                "--renderer-process-limit=1",   # Max 1 renderer process (backup if not single-process)
-                "--disable-accelerated-2d-canvas",
-                "--disable-accelerated-video-decode",
-                "--force-device-scale-factor=1",
-                "--disable-ipc-flooding-protection",  # Don't throttle IPC in constrained envs
-                # === Memory: limit Chromium's appetite ===
-                "--js-flags=--max-old-space-size=128",  # Reduced from 256 for low-mem VMs
-                # === Additional stability flags ===
-                "--disable-web-security",       # Skip CORS checks for local screenshots
-                "--disable-features=NetworkService",
-                "--mute-audio",                 # No audio processing needed
-            ],
-        )
-        signal.alarm(0)
-        log(f"  OK  Chromium launched in {time.time()-t2:.1f}s")
-
-        # Verify Chrome process is alive
-        try:
-            pids = os.popen("pgrep -c chrome 2>/dev/null").read().strip()
-            log(f"  Chrome process count: {pids}")
-        except Exception:
-            pass
+        if owns_browser:
+            # === Step 1: Start Playwright (30s) ===
+            log("Step 1/8: Starting Playwright...")
+            watchdog.arm(30)
+            t1 = time.time()
+            pw = sync_playwright().start()
+            watchdog.disarm()
+            log(f"  OK  Playwright started in {time.time()-t1:.1f}s")
+
+            # === Step 2: Launch Chromium (30s) ===
+            log("Step 2/8: Launching Chromium...")
+            watchdog.arm(30)
+            t2 = time.time()
+            browser = pw.chromium.launch(
+                headless=True,
+                args=chromium_args(),
+            )
+            watchdog.disarm()
+            log(f"  OK  Chromium launched in {time.time()-t2:.1f}s")
+
+            # Verify Chrome process is alive
+            try:
+                log(f"  Chrome process count: {len(chrome_pids())}")
+            except Exception:
+                pass
+        else:
+            log("Steps 1-2/8: Reusing worker browser")
 
         # === Step 3a: Create context (15s) ===
         log("Step 3a/8: Creating browser context...")
-        signal.alarm(15)
+        watchdog.arm(15)
         t3 = time.time()
-        context = browser.new_context(
-            viewport={"width": viewport_width, "height": viewport_height},
-            bypass_csp=True,
-        )
-        signal.alarm(0)
+        pooled = pool is not None and pool.fits(viewport_width, viewport_height)
+        if pooled:
+            context = pool.acquire()
+        else:
+            context = browser.new_context(
+                viewport={"width": viewport_width, "height": viewport_height},
+                bypass_csp=True,
+            )
+        watchdog.disarm()
         log(f"  OK  Context created in {time.time()-t3:.1f}s")
         
         # === Step 3b: Create page with retry (30s total, 3 attempts) ===
@@ -332,22 +632,23 @@ def capture_visual_state(url, viewport_width=1280, viewport_height=720):
         browser_crashed = False
         for page_attempt in range(page_attempts):
             try:
-                signal.alarm(15)  # 15s per attempt
+                watchdog.arm(15)  # 15s per attempt
                 t3b = time.time()
                 page = context.new_page()
-                signal.alarm(0)
+                watchdog.disarm()
                 log(f"  OK  Page created in {time.time()-t3b:.1f}s (attempt {page_attempt + 1})")
                 break
             except StepTimeout:
-                signal.alarm(0)
+                watchdog.disarm()
                 log(f"  RETRY  Page creation timed out (attempt {page_attempt + 1}/{page_attempts})")
                 # Kill renderer processes that may be hung
-                os.system("pkill -9 -f 'type=renderer' 2>/dev/null")
-                time.sleep(1)
+                wait_for_exit(kill_chrome(renderer_only=True), timeout=1)
                 if page_attempt == page_attempts - 1:
+                    log("  Renderer spawn hung; later launches will use --single-process")
+                    open(SINGLE_PROCESS_MARKER, "w").close()
                     raise StepTimeout("Page creation failed after all retries")
             except Exception as e:
-                signal.alarm(0)
+                watchdog.disarm()
                 err_str = str(e).lower()
                 log(f"  ERROR  Page creation error: {e} (attempt {page_attempt + 1})")
                 # Detect browser crash - need full restart
@@ -367,8 +668,7 @@ def capture_visual_state(url, viewport_width=1280, viewport_height=720):
             try:
                 if pw: pw.stop()
             except: pass
-            os.system("pkill -9 -f 'chrome' 2>/dev/null")
-            os.system("pkill -9 -f 'chromium' 2>/dev/null")
+            kill_chrome()
             result["error"] = "Browser crashed during page creation"
             signal.signal(signal.SIGALRM, old_handler)
             return result
@@ -376,115 +676,384 @@ def capture_visual_state(url, viewport_width=1280, viewport_height=720):
         if not page:
             raise Exception("Failed to create page after all retries")
 
+        # Routed per page so pooled contexts come back without stale handlers
+        blocked = DEFAULT_BLOCKED_RESOURCES if block_resources is None else block_resources
+        if blocked:
+            page.route("**/*", route_blocker(url, set(blocked)))
+
         # === Step 4: Navigate (30s) ===
         log(f"Step 4/8: Navigating to {url}...")
-        signal.alarm(30)
+        watchdog.arm(20)
         t4 = time.time()
         try:
-            page.goto(url, wait_until="domcontentloaded", timeout=25000)
-            signal.alarm(0)
+            page.goto(url, wait_until="domcontentloaded", timeout=15000)
+            watchdog.disarm()
             log(f"  OK  Navigation done in {time.time()-t4:.1f}s")
         except StepTimeout:
             raise
         except Exception as nav_err:
-            signal.alarm(0)
+            watchdog.disarm()
             log(f"  FAIL  Navigation error: {nav_err}")
-            result["error"] = f"Navigation failed: {str(nav_err)[:150]}"
-            browser.close()
-            pw.stop()
+            result["error"] = f"Navigation failed: {error_text(nav_err, 150)}"
             return result
 
-        # === Step 5: Wait for full load (15s) ===
-        log("Step 5/8: Waiting for load state...")
+        # === Step 5: Wait for the element under test, or full load (10-15s) ===
         t5 = time.time()
+        if ready_selector:
+            log(f"Step 5/8: Waiting for {ready_selector}...")
+            try:
+                page.wait_for_selector(ready_selector, state="visible", timeout=10000)
+                log(f"  OK  Selector visible in {time.time()-t5:.1f}s")
+            except Exception:
+                log(f"  WARN  Selector not visible after {time.time()-t5:.1f}s, proceeding")
+        else:
+            log("Step 5/8: Waiting for load state...")
+            try:
+                page.wait_for_load_state("load", timeout=15000)
+                log(f"  OK  Fully loaded in {time.time()-t5:.1f}s")
+            except Exception:
+                log(f"  WARN  Load timeout after {time.time()-t5:.1f}s, proceeding")
+
+        # === Step 6: JS hydration wait (network idle, up to 5s; skipped with a selector), then fonts ===
+        if not ready_selector:
+            log("Step 6/8: Waiting for JS hydration...")
+            t6 = time.time()
+            try:
+                page.wait_for_load_state("networkidle", timeout=3000)
+            except Exception:
+                try:
+                    page.wait_for_function(
+                        "document.readyState === 'complete' && !document.querySelector('[data-hydrating]')",
+                        timeout=2000,
+                    )
+                except Exception:
+                    time.sleep(0.5)
+            log(f"  OK  Hydration wait: {time.time()-t6:.1f}s")
+        # The fonts round trip also brings back the title, saving a separate page.title() call
+        title = None
         try:
-            page.wait_for_load_state("load", timeout=15000)
-            log(f"  OK  Fully loaded in {time.time()-t5:.1f}s")
+            title = page.evaluate("document.fonts.ready.then(() => document.title)")
         except Exception:
-            log(f"  WARN  Load timeout after {time.time()-t5:.1f}s, proceeding")
-
-        # === Step 6: JS hydration wait (5s fixed) ===
-        log("Step 6/8: Waiting 5s for JS hydration...")
-        time.sleep(5)
+            pass
         log(f"  OK  Ready at {time.time()-t0:.1f}s total")
 
         # === Step 7: Screenshot (15s) ===
         log("Step 7/8: Taking screenshot...")
-        signal.alarm(15)
+        watchdog.arm(15)
         t7 = time.time()
-        screenshot_bytes = page.screenshot(full_page=False, timeout=10000)
-        signal.alarm(0)
-
-        result["screenshot_base64"] = base64.b64encode(screenshot_bytes).decode("utf-8")
+        if element_selector:
+            screenshot_bytes = page.locator(element_selector).first.screenshot(
+                type=SCREENSHOT_TYPE, quality=SCREENSHOT_QUALITY, timeout=10000)
+        elif clip:
+            screenshot_bytes = page.screenshot(
+                clip=clip, type=SCREENSHOT_TYPE, quality=SCREENSHOT_QUALITY, timeout=10000)
+        else:
+            screenshot_bytes = page.screenshot(
+                full_page=full_page, type=SCREENSHOT_TYPE, quality=SCREENSHOT_QUALITY, timeout=10000)
+        watchdog.disarm()
+        if element_selector:
+            result["element_selector"] = element_selector
+
+        # Image goes to disk and is pulled by the host out of band; stdout carries only metadata
+        screenshot_path = f"/tmp/visual_shot_{time.time_ns()}.jpg"
+        with open(screenshot_path, "wb") as f:
+            f.write(screenshot_bytes)
+        result["screenshot_path"] = screenshot_path
         result["success"] = True
-        log(f"  OK  Screenshot: {time.time()-t7:.1f}s, {len(result['screenshot_base64'])} bytes b64")
+        log(f"  OK  Screenshot: {time.time()-t7:.1f}s, {len(screenshot_bytes)} bytes -> {screenshot_path}")
 
-        result["title"] = page.title()
-        result["final_url"] = page.url
+        result["title"] = title
+        result["final_url"] = page.url  # Cached on the Python side, no CDP call
 
-        context.close()
-        browser.close()
+        if pooled:
+            pool.release(context)
+        else:
+            context.close()
         context = None
-        browser = None
-        pw = None
+        if owns_browser:
+            browser.close()
+            browser = None
+            pw.stop()
+            pw = None
         log(f"DONE  Total capture time: {time.time()-t0:.1f}s")
         # Note: finally block will handle signal restore
         return result
 
     except StepTimeout:
-        signal.alarm(0)
+        watchdog.disarm()
         elapsed = time.time() - t0
         log(f"STEP TIMEOUT at {elapsed:.1f}s — a step exceeded its individual timeout limit")
         result["error"] = f"Step timed out at {elapsed:.1f}s"
     except Exception as e:
-        signal.alarm(0)
+        watchdog.disarm()
         log(f"ERROR: {type(e).__name__}: {e}")
-        result["error"] = f"{type(e).__name__}: {str(e)[:200]}"
+        result["error"] = error_text(e)
     finally:
-        signal.alarm(0)
+        watchdog.disarm()
         signal.signal(signal.SIGALRM, old_handler)
         # Cleanup resources
         try:
             if context: context.close()
         except: pass
+        if owns_browser:
+            try:
+                if browser: browser.close()
+            except: pass
+            try:
+                if pw: pw.stop()
+            except: pass
+
+    return result
+
+
+# ============================================================================
+# PERSISTENT WORKER: one Chromium for the whole sandbox session
+# ============================================================================
+# Cold Chromium launch costs seconds; a screenshot costs a fraction of that.
+# `--serve SOCKET` keeps a single browser alive and answers one JSON request
+# per Unix-socket connection; `--socket SOCKET` is the thin client.
+# ============================================================================
+class BrowserManager:
+    """
+    One Playwright driver and one Chromium shared by many captures. get()
+    health-checks the browser and relaunches it (with a fresh context pool)
+    after a crash or CDP disconnect.
+    """
+    def __init__(self):
+        self.pw = None
+        self.browser = None
+        self.pool = None
+
+    def get(self):
+        if self.browser is not None:
+            try:
+                if self.browser.is_connected():
+                    self.browser.contexts
+                    return self.browser
+            except Exception:
+                pass
+            log("Shared browser died, relaunching")
+        if self.pw is None:
+            from playwright.sync_api import sync_playwright
+            self.pw = sync_playwright().start()
+        self.browser = self.pw.chromium.launch(headless=True, args=chromium_args())
+        self.pool = ContextPool(self.browser)
+        return self.browser
+
+    def close(self):
         try:
-            if browser: browser.close()
+            if self.browser: self.browser.close()
         except: pass
         try:
-            if pw: pw.stop()
+            if self.pw: self.pw.stop()
         except: pass
+        self.browser = self.pw = self.pool = None
 
-    return result
+def capture_many(urls, width, height, manager, **options):
+    """Captures each URL through the manager's browser, one pooled context each."""
+    return [
+        capture_visual_state(u, width, height, browser=manager.get(), pool=manager.pool, **options)
+        for u in urls
+    ]
 
+def serve(socket_path):
+    fix_shared_memory()
+    kill_stale_chrome()
+    manager = BrowserManager()
+    manager.get()
+
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(socket_path)
+    server.listen(8)
+    log(f"Worker ready on {socket_path}")
+
+    while True:
+        conn, _ = server.accept()
+        with conn:
+            try:
+                request = json.loads(conn.makefile("r").readline())
+                width, height = request.get("width", 1280), request.get("height", 720)
+                options = {
+                    "ready_selector": request.get("ready_selector"),
+                    "element_selector": request.get("element_selector"),
+                    "clip": request.get("clip"),
+                    "block_resources": request.get("block_resources"),
+                    "full_page": request.get("full_page", False),
+                }
+                if "urls" in request:
+                    response = {"results": capture_many(request["urls"], width, height, manager, **options)}
+                else:
+                    response = capture_many([request["url"]], width, height, manager, **options)[0]
+            except Exception as e:
+                response = {"success": False, "error": error_text(e)}
+            conn.sendall((json.dumps(response) + "\\n").encode())
 
-if __name__ == "__main__":
+def request_worker(socket_path, payload, timeout=170):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+        s.settimeout(timeout)
+        s.connect(socket_path)
+        s.sendall((json.dumps(payload) + "\\n").encode())
+        return json.loads(s.makefile("r").readline())
+
+
+def main():
     import argparse
     parser = argparse.ArgumentParser()
-    parser.add_argument("--url", required=True)
+    parser.add_argument("--url")
+    parser.add_argument("--urls", nargs="+", help="Batch capture through the worker")
     parser.add_argument("--width", type=int, default=1280)
     parser.add_argument("--height", type=int, default=720)
+    parser.add_argument("--serve", help="Run as a persistent worker on this Unix socket")
+    parser.add_argument("--socket", help="Send the capture to a running worker")
+    parser.add_argument("--ready-selector", help="Wait for this element instead of the load event")
+    parser.add_argument("--element-selector", help="Screenshot only this element")
+    parser.add_argument("--clip", help="Screenshot only this region: x,y,width,height")
+    parser.add_argument("--block-resources", help="Comma-separated third-party resource types to abort; empty blocks nothing")
+    parser.add_argument("--full-page", action="store_true", help="Capture the full scroll height")
     args = parser.parse_args()
 
-    result = capture_visual_state(args.url, args.width, args.height)
+    clip = None
+    if args.clip:
+        x, y, w, h = (float(v) for v in args.clip.split(","))
+        clip = {"x": x, "y": y, "width": w, "height": h}
+    block_resources = None
+    if args.block_resources is not None:
+        block_resources = [t for t in args.block_resources.split(",") if t]
+    options = {
+        "ready_selector": args.ready_selector, "element_selector": args.element_selector, "clip": clip,
+        "block_resources": block_resources, "full_page": args.full_page,
+    }
+
+    if args.serve:
+        serve(args.serve)
+        sys.exit(0)
+
+    if args.socket:
+        try:
+            payload = {"width": args.width, "height": args.height, **options}
+            if args.urls:
+                payload["urls"] = args.urls
+            else:
+                payload["url"] = args.url
+            result = request_worker(args.socket, payload, timeout=170 * len(args.urls or [1]))
+        except Exception as e:
+            result = {"success": False, "error": f"Worker unavailable: {e}"}
+    elif args.urls:
+        # No worker running: still launch Chromium once for the whole batch
+        fix_shared_memory()
+        kill_stale_chrome()
+        manager = BrowserManager()
+        try:
+            result = {"results": capture_many(args.urls, args.width, args.height, manager, **options)}
+        except Exception as e:
+            result = {"results": [{"success": False, "error": error_text(e)} for _ in args.urls]}
+        finally:
+            manager.close()
+    else:
+        result = capture_visual_state(args.url, args.width, args.height, **options)
     # Print JSON to stdout (this is what the agent parses)
     print(json.dumps(result))
+
+
+if __name__ == "__main__":
+    main()
 '''
 
 
+def _get_client() -> genai.Client:
+    current_key = key_rotator.get_current_key()
+    client = _clients.get(current_key)
+    if client is None:
+        client = _clients[current_key] = genai.Client(api_key=current_key)
+    return client
+
+
+async def _generate_vision(contents, config: Optional[types.GenerateContentConfig] = None):
+    """Non-blocking Gemini call; rotates keys and backs off on 429s."""
+    async with _vision_sem:
+        for attempt in range(VISION_MAX_ATTEMPTS):
+            current_key = key_rotator.get_current_key()
+            try:
+                return await _get_client().aio.models.generate_content(
+                    model=VISION_MODEL,
+                    contents=contents,
+                    config=config
+                )
+            except Exception as e:
+                error_msg = str(e)
+                if attempt == VISION_MAX_ATTEMPTS - 1 or not ("429" in error_msg or "RESOURCE_EXHAUSTED" in error_msg):
+                    raise
+                delay = min(60, 2 ** attempt + random.random())
+                print(f"Vision rate limited - rotating key, retrying in {delay:.1f}s...")
+                key_rotator.rotate(current_key)
+                await asyncio.sleep(delay)
+
+
+def _screenshot_bytes(screenshot: Union[bytes, str]) -> bytes:
+    """Raw image bytes; base64 strings from JSON transport are decoded once here."""
+    return base64.b64decode(screenshot) if isinstance(screenshot, str) else screenshot
+
+
+def _decode_screenshot(screenshot: bytes) -> Optional[Image.Image]:
+    try:
+        img = Image.open(io.BytesIO(screenshot))
+        img.load()
+        return img
+    except Exception:
+        return None
+
+
+def _cached_analysis(image_hash: str, ctx_key: str) -> Optional[VisualBugReport]:
+    return _vision_cache.get((image_hash, ctx_key))
+
+
+def _store_analysis(image_hash: str, ctx_key: str, report: VisualBugReport) -> None:
+    _vision_cache[(image_hash, ctx_key)] = report
+    _vision_cache.move_to_end((image_hash, ctx_key))
+    while len(_vision_cache) > VISION_CACHE_SIZE:
+        _vision_cache.popitem(last=False)
+
+
+def _prepare_vision_payload(screenshot: bytes, img: Optional[Image.Image] = None) -> Tuple[bytes, str]:
+    """
+    Downscales the screenshot and re-encodes it as JPEG before it goes to Gemini.
+    JPEG captures already within bounds are sent untouched. Falls back to the
+    original bytes if the image can't be decoded.
+    
+    Returns: (image bytes, mime type)
+    """
+    try:
+        img = img or _decode_screenshot(screenshot)
+        if img.format == "JPEG" and max(img.size) <= VISION_MAX_DIMENSION:
+            return screenshot, "image/jpeg"
+        img = img.copy()
+        img.thumbnail((VISION_MAX_DIMENSION, VISION_MAX_DIMENSION), Image.LANCZOS)
+        buf = io.BytesIO()
+        img.convert("RGB").save(buf, format="JPEG", quality=VISION_JPEG_QUALITY, optimize=True)
+        return buf.getvalue(), "image/jpeg"
+    except Exception as e:
+        print(f"Vision payload prep failed, sending original: {e}")
+        return screenshot, "image/jpeg" if screenshot[:2] == b"\xff\xd8" else "image/png"
+
+
 async def analyze_screenshot_with_gemini(
-    screenshot_base64: str,
+    screenshot: Union[bytes, str],
     context: str = "",
     css_content: str = "",
-    error_description: str = ""
+    error_description: str = "",
+    cache_scope: str = ""
 ) -> VisualBugReport:
     """
     Uses Gemini's multimodal capabilities to analyze a screenshot for visual bugs.
     
     Args:
-        screenshot_base64: Base64 encoded screenshot
+        screenshot: Raw image bytes, or a base64 string as carried in events
         context: Description of what the page should look like
         css_content: Relevant CSS code
         error_description: What the user reported as broken
+        cache_scope: Run or repo the analysis belongs to; results are only cached within a scope
     
     Returns:
         VisualBugReport with identified issues and suggested fixes
@@ -517,75 +1086,56 @@ Analyze this screenshot for visual issues.
    - Text overflow/truncation
 3. For each issue, suggest a CSS fix
 
-## RESPONSE FORMAT (JSON)
-```json
-{{
-    "screenshot_description": "Brief description of what's visible",
-    "has_issues": true/false,
-    "issues": [
-        {{
-            "type": "overlap|z-index|layout|spacing|contrast|broken-image|other",
-            "element": "description of affected element",
-            "problem": "what's wrong",
-            "severity": "high|medium|low"
-        }}
-    ],
-    "suggested_fixes": [
-        {{
-            "file": "path/to/file.css or component.tsx",
-            "selector": ".class-name or element",
-            "current_css": "current problematic CSS if known",
-            "fixed_css": "the corrected CSS",
-            "explanation": "why this fixes the issue"
-        }}
-    ],
-    "confidence": 0.0-1.0
-}}
-```
+## RESPONSE FIELDS
+- issues[].type: overlap|z-index|layout|spacing|contrast|broken-image|other
+- issues[].severity: high|medium|low
+- suggested_fixes[].file: path/to/file.css or component.tsx
+- suggested_fixes[].current_css: current problematic CSS if known, else ""
+- confidence: 0.0-1.0
 """
     
+    screenshot = _screenshot_bytes(screenshot)
+    image = _decode_screenshot(screenshot)
+    image_hash = hashlib.sha256(screenshot).hexdigest()
+    ctx_key = hashlib.sha256(f"{cache_scope}\0{prompt}".encode("utf-8")).hexdigest()[:16]
+    cached = _cached_analysis(image_hash, ctx_key) if cache_scope else None
+    if cached:
+        print("Visual analysis: cache hit")
+        return cached
+    
     try:
-        current_key = key_rotator.get_current_key()
-        client = genai.Client(api_key=current_key)
-        
-        image_data = base64.b64decode(screenshot_base64)
+        image_data, mime_type = _prepare_vision_payload(screenshot, image)
         
-        response = client.models.generate_content(
-            model=VISION_MODEL,
+        response = await _generate_vision(
             contents=[
-                {
-                    "role": "user",
-                    "parts": [
-                        {"text": prompt},
-                        {
-                            "inline_data": {
-                                "mime_type": "image/png",
-                                "data": screenshot_base64
-                            }
-                        }
+                types.Content(
+                    role="user",
+                    parts=[
+                        types.Part.from_text(text=prompt),
+                        types.Part.from_bytes(data=image_data, mime_type=mime_type)
                     ]
-                }
-            ]
+                )
+            ],
+            config=VISION_CONFIG
         )
         
-       
         response_text = response.text
-    
-        import re
-        json_match = re.search(r'```json\s*(.*?)\s*```', response_text, re.DOTALL)
-        if json_match:
-            response_text = json_match.group(1)
-        
-        import json
-        result = json.loads(response_text)
+        try:
+            result = json.loads(response_text)
+        except json.JSONDecodeError:
+            fence = _JSON_FENCE_RE.search(response_text)
+            result = json.loads(fence.group(1)) if fence else {}
         
-        return VisualBugReport(
+        report = VisualBugReport(
             has_issues=result.get("has_issues", False),
             issues=result.get("issues", []),
             screenshot_description=result.get("screenshot_description", ""),
             suggested_fixes=result.get("suggested_fixes", []),
             confidence=result.get("confidence", 0.5)
         )
+        if cache_scope:
+            _store_analysis(image_hash, ctx_key, report)
+        return report
         
     except Exception as e:
         print(f"Visual analysis error: {e}")
@@ -617,15 +1167,122 @@ def get_visual_test_commands(project_type: str) -> Dict[str, str]:
     return commands.get(project_type, commands["nodejs"])
 
 
+def decode_capture_output(stdout: str) -> Dict[str, Any]:
+    """Parses the capture script's stdout JSON; raises msgspec.DecodeError (a ValueError) if malformed."""
+    return _capture_decoder.decode(stdout)
+
+
+def write_capture_script(box) -> None:
+    """Installs the capture module at CAPTURE_SCRIPT_PATH, outside the user's repo."""
+    box.write_file_abs(CAPTURE_SCRIPT_PATH, get_playwright_setup_script())
+
+
+def is_playwright_ready(box) -> bool:
+    """Cheap probe: a Chromium binary is already on disk (baked into the template or installed earlier)."""
+    probe = box.run_command(PLAYWRIGHT_PROBE, timeout=10)
+    return "PLAYWRIGHT_READY" in probe.get('stdout', '')
+
+
+def _capture_options(
+    ready_selector: Optional[str],
+    element_selector: Optional[str],
+    clip: Optional[Dict[str, float]],
+    block_resources: Optional[Set[str]] = None,
+    full_page: bool = False
+) -> str:
+    """Renders the optional capture flags for the CAPTURE_COMMAND command line."""
+    args = ""
+    if block_resources is not None:
+        args += f" --block-resources {shlex.quote(','.join(sorted(block_resources)))}"
+    if full_page:
+        args += " --full-page"
+    if ready_selector:
+        args += f" --ready-selector {shlex.quote(ready_selector)}"
+    if element_selector:
+        args += f" --element-selector {shlex.quote(element_selector)}"
+    if clip:
+        args += f" --clip {clip['x']},{clip['y']},{clip['width']},{clip['height']}"
+    return args
+
+
+def prewarm_visual_worker(box) -> bool:
+    """
+    Launches the capture worker in the background without waiting for it, so
+    its Chromium start overlaps with dependency installs and test runs. Only
+    sandboxes that already have Playwright qualify; installing it here would
+    put minutes on the critical path instead of taking seconds off.
+    """
+    if box._visual_worker or box._visual_worker_pending or not is_playwright_ready(box):
+        return False
+    
+    write_capture_script(box)
+    handle = box.run_background(f"{CAPTURE_COMMAND} --serve {VISUAL_WORKER_SOCKET}")
+    if not handle:
+        return False
+    
+    print("Visual worker pre-warming in background")
+    box._visual_worker_pending = handle
+    return True
+
+
+def ensure_visual_worker(box, start: bool = True) -> bool:
+    """
+    Returns True once the persistent capture worker is accepting requests.
+    Later checks reuse its Chromium instead of paying a cold browser launch on
+    every URL. With `start=False`, only a worker already launched by
+    `prewarm_visual_worker` is waited for.
+    """
+    if box._visual_worker:
+        return True
+    
+    handle = box._visual_worker_pending
+    if not handle:
+        if not start:
+            return False
+        
+        write_capture_script(box)
+        
+        if not is_playwright_ready(box):
+            print("Installing Playwright...")
+            box.run_command(
+                f"pip install playwright=={PLAYWRIGHT_VERSION} && python3 -m playwright install --with-deps chromium",
+                timeout=300
+            )
+        
+        handle = box.run_background(f"{CAPTURE_COMMAND} --serve {VISUAL_WORKER_SOCKET}")
+        if not handle:
+            return False
+    
+    # The socket is only bound after Chromium has launched, so it doubles as the readiness marker
+    box._visual_worker_pending = None
+    ready = box.run_command(
+        f"for i in $(seq 1 600); do test -S {VISUAL_WORKER_SOCKET} && exit 0; sleep 0.1; done; exit 1",
+        timeout=90
+    )
+    if ready['exit_code'] != 0:
+        print("Visual worker did not come up, falling back to one-shot capture")
+        box.kill_background(handle)
+        return False
+    
+    box._visual_worker = handle
+    return True
+
+
 async def run_visual_regression_check(
     box, 
     url: str,
     baseline_screenshot_path: Optional[str] = None,
     viewport_width: int = 1280,
-    viewport_height: int = 720
+    viewport_height: int = 720,
+    ready_selector: Optional[str] = None,
+    element_selector: Optional[str] = None,
+    clip: Optional[Dict[str, float]] = None,
+    block_resources: Optional[Set[str]] = None,
+    full_page: bool = False
 ) -> Dict[str, Any]:
     """
-    Runs a visual regression check in the sandbox.
+    Runs a visual regression check. The page is captured inside the sandbox,
+    through the persistent visual worker when it is up.
     
     Args:
         box: TaskSandbox instance
@@ -633,6 +1290,12 @@ async def run_visual_regression_check(
         baseline_screenshot_path: Path to baseline screenshot for comparison
         viewport_width: Browser viewport width
         viewport_height: Browser viewport height
+        ready_selector: Element to wait for instead of the load event + hydration sleep
+        element_selector: Screenshot only this element (smaller payload, sharper analysis)
+        clip: Screenshot only this region, {"x", "y", "width", "height"}
+        block_resources: Third-party resource types to abort; defaults to
+            VISUAL_BLOCKED_RESOURCES, pass an empty set to load everything
+        full_page: Capture the full scroll height instead of the viewport
     
     Returns:
         Dict with test results, screenshot, and analysis
@@ -644,49 +1307,131 @@ async def run_visual_regression_check(
         "error": None
     }
     
+    # Sandbox calls are blocking HTTP round trips; keep them off the event loop
+    if await asyncio.to_thread(ensure_visual_worker, box):
+        target = f"--socket {VISUAL_WORKER_SOCKET}"
+    else:
+        target = ""
     
-    box.write_file("visual_capture.py", get_playwright_setup_script())
+    capture_result = await asyncio.to_thread(
+        box.run_command,
+        f"{CAPTURE_COMMAND} {target} --url '{url}' --width {viewport_width} --height {viewport_height}"
+        f"{_capture_options(ready_selector, element_selector, clip, block_resources, full_page)}",
+        timeout=180
+    )
     
+    try:
+        capture_data = decode_capture_output(capture_result['stdout'])
+    except msgspec.DecodeError as e:
+        result["error"] = f"Failed to parse capture result: {e}"
+        return result
     
-    install_check = box.run_command("python3 -c 'from playwright.async_api import async_playwright' 2>&1 || echo 'NOT_INSTALLED'")
+    return await _analyze_capture(box, capture_data)
+
+
+async def run_visual_regression_batch(
+    box,
+    urls: List[str],
+    viewport_width: int = 1280,
+    viewport_height: int = 720,
+    ready_selector: Optional[str] = None,
+    element_selector: Optional[str] = None,
+    clip: Optional[Dict[str, float]] = None,
+    block_resources: Optional[Set[str]] = None,
+    full_page: bool = False
+) -> List[Dict[str, Any]]:
+    """
+    Captures several URLs through one browser in one sandbox round trip (the
+    worker's if it is up, otherwise a single one-shot launch), then runs the
+    Gemini analyses concurrently.
     
-    if "NOT_INSTALLED" in install_check['stdout'] or install_check['exit_code'] != 0:
-        print("Installing Playwright...")
-        box.run_command("pip install playwright && playwright install chromium")
+    Returns:
+        One result dict per URL, in the same order as `urls`
+    """
+    if not urls:
+        return []
     
+    target = f"--socket {VISUAL_WORKER_SOCKET} " if await asyncio.to_thread(ensure_visual_worker, box) else ""
     
-    capture_result = box.run_command(
-        f"python3 visual_capture.py --url '{url}' --width {viewport_width} --height {viewport_height}"
+    quoted = " ".join(f"'{url}'" for url in urls)
+    capture_result = await asyncio.to_thread(
+        box.run_command,
+        f"{CAPTURE_COMMAND} {target}--urls {quoted} "
+        f"--width {viewport_width} --height {viewport_height}"
+        f"{_capture_options(ready_selector, element_selector, clip, block_resources, full_page)}",
+        timeout=180 * len(urls)
     )
     
     try:
-        import json
-        capture_data = json.loads(capture_result['stdout'])
+        captures = decode_capture_output(capture_result['stdout']).get("results")
+    except msgspec.DecodeError as e:
+        captures = None
+        error = f"Failed to parse capture result: {e}"
+    else:
+        error = "Capture returned no batch results"
+    
+    if not captures:
+        return [
+            {"passed": False, "screenshot_base64": None, "analysis": None, "error": error}
+            for _ in urls
+        ]
+    
+    return list(await asyncio.gather(*[_analyze_capture(box, c) for c in captures]))
+
+
+def load_capture_bytes(box, capture_data: Dict[str, Any]) -> Optional[bytes]:
+    """Returns the raw image of a capture, reading it out of the sandbox if it was written there."""
+    if capture_data.get("screenshot_bytes"):
+        return capture_data["screenshot_bytes"]
+    path = capture_data.get("screenshot_path")
+    if not path:
+        encoded = capture_data.get("screenshot_base64")
+        return base64.b64decode(encoded) if encoded else None
+    try:
+        return bytes(box.read_file_bytes(path))
+    except Exception as e:
+        print(f"Failed to read screenshot {path}: {e}")
+        return None
+
+
+def load_capture_screenshot(box, capture_data: Dict[str, Any]) -> Optional[str]:
+    """Like load_capture_bytes, base64-encoded for event transport."""
+    png = load_capture_bytes(box, capture_data)
+    return base64.b64encode(png).decode("utf-8") if png else None
+
+
+async def _analyze_capture(box, capture_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Turns one capture script result into a regression result, running vision analysis on success."""
+    result = {
+        "passed": False,
+        "screenshot_base64": None,
+        "analysis": None,
+        "error": None
+    }
+    
+    if capture_data.get("success"):
+        png = await asyncio.to_thread(load_capture_bytes, box, capture_data)
+        result["screenshot_base64"] = base64.b64encode(png).decode("utf-8") if png else None
+        result["element_selector"] = capture_data.get("element_selector")
+        result["console_errors"] = capture_data.get("console_errors", [])
+        result["network_errors"] = capture_data.get("network_errors", [])
         
-        if capture_data.get("success"):
-            result["screenshot_base64"] = capture_data.get("screenshot_base64")
-            result["console_errors"] = capture_data.get("console_errors", [])
-            result["network_errors"] = capture_data.get("network_errors", [])
-            
-          
-            if result["screenshot_base64"]:
-                analysis = await analyze_screenshot_with_gemini(
-                    screenshot_base64=result["screenshot_base64"],
-                    error_description="Visual regression test - checking for UI issues"
-                )
-                result["analysis"] = {
-                    "has_issues": analysis.has_issues,
-                    "issues": analysis.issues,
-                    "description": analysis.screenshot_description,
-                    "suggested_fixes": analysis.suggested_fixes,
-                    "confidence": analysis.confidence
-                }
-                result["passed"] = not analysis.has_issues
-        else:
-            result["error"] = capture_data.get("error", "Unknown capture error")
-            
-    except json.JSONDecodeError as e:
-        result["error"] = f"Failed to parse capture result: {e}"
+      
+        if png:
+            analysis = await analyze_screenshot_with_gemini(
+                screenshot=png,
+                error_description="Visual regression test - checking for UI issues"
+            )
+            result["analysis"] = {
+                "has_issues": analysis.has_issues,
+                "issues": analysis.issues,
+                "description": analysis.screenshot_description,
+                "suggested_fixes": analysis.suggested_fixes,
+                "confidence": analysis.confidence
+            }
+            result["passed"] = not analysis.has_issues
+    else:
+        result["error"] = capture_data.get("error", "Unknown capture error")
     
     return result
 
@@ -0,0 +1,115 @@
+"""
+RESPONSE CACHE
+==============
+Short-lived Redis copies of dashboard read endpoints. Every open dashboard
+polls /stats; with a few seconds of caching the database sees one query
+per TTL instead of one per poll, however many tabs are open.
+
+Uses the event bus's Redis connection. If Redis is down, callers simply
+compute the value every time.
+
+Entries derived from healing_runs are dropped whenever a run is created,
+changes status or is deleted (see app.db.supabase), so their TTL is only
+a backstop for edits made outside the app.
+"""
+
+import asyncio
+from collections import Counter
+from typing import Any, Awaitable, Callable, Dict, Tuple
+
+import msgspec
+
+from app.core.event_bus import get_event_bus
+
+CACHE_PREFIX = "talos:cache:"
+
+STATS_KEY = "stats:v1"
+RECENT_KEY = "recent:v2"
+RUNS_CACHE_KEYS = (STATS_KEY, RECENT_KEY)
+
+# Per-process (key, "hits" | "misses") tallies for tuning TTLs; see cache_stats()
+_lookups: Counter = Counter()
+
+
+async def cached(key: str, ttl: int, produce: Callable[[], Awaitable[Any]]) -> Any:
+    """Return the cached JSON value for key, or produce() it and cache it for ttl seconds."""
+    redis_key = f"{CACHE_PREFIX}{key}"
+    client = None
+    try:
+        client = (await get_event_bus()).redis
+        hit = await client.get(redis_key)
+        if hit is not None:
+            _lookups[key, "hits"] += 1
+            return msgspec.json.decode(hit)
+    except Exception as e:
+        print(f"Cache read failed for {key}: {e}")
+    
+    _lookups[key, "misses"] += 1
+    value = await produce()
+    
+    if client is not None:
+        try:
+            await client.set(redis_key, msgspec.json.encode(value), ex=ttl)
+        except Exception as e:
+            print(f"Cache write failed for {key}: {e}")
+    return value
+
+
+async def cached_many(entries: Dict[str, Tuple[int, Callable[[], Awaitable[Any]]]]) -> Dict[str, Any]:
+    """
+    cached() for several keys at once: one MGET for the reads and one
+    pipeline for the writes. entries maps key -> (ttl, produce). A failed
+    produce() comes back as its exception (and is not cached).
+    """
+    keys = list(entries)
+    raw = [None] * len(keys)
+    client = None
+    try:
+        client = (await get_event_bus()).redis
+        raw = await client.mget([f"{CACHE_PREFIX}{k}" for k in keys])
+    except Exception as e:
+        print(f"Cache read failed for {keys}: {e}")
+    
+    results, missing = {}, []
+    for key, hit in zip(keys, raw):
+        if hit is not None:
+            _lookups[key, "hits"] += 1
+            results[key] = msgspec.json.decode(hit)
+        else:
+            _lookups[key, "misses"] += 1
+            missing.append(key)
+    
+    produced = await asyncio.gather(*(entries[k][1]() for k in missing), return_exceptions=True)
+    results.update(zip(missing, produced))
+    
+    fresh = [(k, v) for k, v in zip(missing, produced) if not isinstance(v, BaseException)]
+    if client is not None and fresh:
+        try:
+            async with client.pipeline(transaction=False) as pipe:
+                for key, value in fresh:
+                    pipe.set(f"{CACHE_PREFIX}{key}", msgspec.json.encode(value), ex=entries[key][0])
+                await pipe.execute()
+        except Exception as e:
+            print(f"Cache write failed for {[k for k, _ in fresh]}: {e}")
+    return results
+
+
+def cache_stats() -> Dict[str, Dict[str, Any]]:
+    """Hit/miss counts and hit rate per cache key since this process started."""
+    stats = {}
+    for key in sorted({k for k, _ in _lookups}):
+        hits, misses = _lookups[key, "hits"], _lookups[key, "misses"]
+        stats[key] = {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": round(hits / (hits + misses) * 100, 1),
+        }
+    return stats
+
+
+async def invalidate(*keys: str):
+    """Drop cached values so the next read recomputes them."""
+    try:
+        await (await get_event_bus()).redis.delete(*(f"{CACHE_PREFIX}{k}" for k in keys))
+    except Exception as e:
+        print(f"Cache invalidation failed for {keys}: {e}")
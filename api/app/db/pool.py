@@ -0,0 +1,82 @@
+"""
+POSTGRES CONNECTION POOL
+========================
+Direct asyncpg access for the hot read paths (run history, stats, chat
+context). PostgREST costs an HTTP round trip plus JSON re-encoding per call
+through a blocking client; these queries go straight to Postgres over a few
+long-lived connections instead.
+
+Set SUPABASE_DB_URL to the project's connection string. The transaction
+pooler on :6543 works because prepared statements are disabled. Without it
+get_pool() returns None and callers stay on the Supabase REST client.
+"""
+
+import os
+import json
+import asyncio
+from datetime import datetime
+from typing import Optional, Dict, Any
+from uuid import UUID
+
+import asyncpg
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DATABASE_URL = os.getenv("SUPABASE_DB_URL")
+
+POOL_MIN_SIZE = 10
+POOL_MAX_SIZE = 50
+POOL_MAX_INACTIVE_LIFETIME = 300
+
+_pool: Optional[asyncpg.Pool] = None
+_pool_failed = False
+_pool_lock = asyncio.Lock()
+
+
+async def _init_connection(conn: asyncpg.Connection) -> None:
+    # Hand back jsonb as dicts, the same shape PostgREST returns
+    for pg_type in ("json", "jsonb"):
+        await conn.set_type_codec(pg_type, encoder=json.dumps, decoder=json.loads, schema="pg_catalog")
+
+
+async def get_pool() -> Optional[asyncpg.Pool]:
+    """Get or create the shared pool; None when no DSN is configured or Postgres is unreachable."""
+    global _pool, _pool_failed
+    if _pool is not None or _pool_failed or not DATABASE_URL:
+        return _pool
+
+    async with _pool_lock:
+        if _pool is None and not _pool_failed:
+            try:
+                _pool = await asyncpg.create_pool(
+                    DATABASE_URL,
+                    min_size=POOL_MIN_SIZE,
+                    max_size=POOL_MAX_SIZE,
+                    max_inactive_connection_lifetime=POOL_MAX_INACTIVE_LIFETIME,
+                    statement_cache_size=0,
+                    init=_init_connection,
+                )
+                print(f"DB: Postgres pool ready ({POOL_MIN_SIZE}-{POOL_MAX_SIZE} connections)")
+            except Exception as e:
+                _pool_failed = True
+                print(f"DB: Postgres pool unavailable, falling back to REST: {e}")
+    return _pool
+
+
+async def close_pool() -> None:
+    global _pool
+    if _pool is not None:
+        await _pool.close()
+        _pool = None
+
+
+def record_to_dict(record: asyncpg.Record) -> Dict[str, Any]:
+    """Shapes a record like a PostgREST row: ISO timestamps and string UUIDs."""
+    row = dict(record)
+    for key, value in row.items():
+        if isinstance(value, datetime):
+            row[key] = value.isoformat()
+        elif isinstance(value, UUID):
+            row[key] = str(value)
+    return row
@@ -16,6 +16,9 @@ CREATE TABLE installations (
     updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
 );
 
+-- updated_at is maintained server-side by the update_installations_updated_at
+-- trigger (update_updated_at_column()) in api/db/schema.sql, so upserts don't send it
+
 -- Watched repos table  
 CREATE TABLE watched_repos (
     id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
@@ -45,15 +48,23 @@ CREATE TABLE healing_runs (
 -- Indexes for performance
 CREATE INDEX idx_runs_status ON healing_runs(status);
 CREATE INDEX idx_runs_repo ON healing_runs(repo_full_name);
-CREATE INDEX idx_runs_started ON healing_runs(started_at DESC);
+CREATE INDEX idx_runs_started_recent ON healing_runs(started_at DESC)
+    INCLUDE (id, run_id, repo_full_name, status, error_type, completed_at);
+CREATE INDEX idx_runs_installation_started ON healing_runs(installation_id, started_at DESC);
+CREATE INDEX idx_events_run_created ON healing_events(run_id, created_at) INCLUDE (event_type, title);
 """
 
 import os
+import asyncio
 from datetime import datetime
-from typing import Optional, List, Dict, Any
-from dataclasses import dataclass, asdict
-from supabase import create_client, Client
+from typing import Optional, List, Dict, Any, Tuple
+from dataclasses import dataclass
+from uuid import UUID
+import httpx
+from supabase import create_client, Client, ClientOptions
 from dotenv import load_dotenv
+from app.db.pool import get_pool, record_to_dict
+from app.db.cache import invalidate, RUNS_CACHE_KEYS
 
 load_dotenv()
 
@@ -63,6 +74,12 @@ SUPABASE_KEY = os.getenv("SUPABASE_ANON_KEY")
 
 _supabase: Optional[Client] = None
 
+# Concurrent upserts to the same table are coalesced for up to this long
+UPSERT_BATCH_WINDOW = 0.1
+UPSERT_BATCH_SIZE = 50
+
+MAX_RUNS_PAGE = 100
+
 
 def get_supabase() -> Client:
     """Get or create Supabase client."""
@@ -70,12 +87,93 @@ def get_supabase() -> Client:
     if _supabase is None:
         if not SUPABASE_URL or not SUPABASE_KEY:
             raise ValueError("SUPABASE_URL and SUPABASE_ANON_KEY must be set")
-        _supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
+        # One pooled HTTP/2 client shared by postgrest/storage, so concurrent
+        # writes multiplex over a warm connection instead of re-handshaking
+        http_client = httpx.Client(
+            http2=True,
+            timeout=10,
+            limits=httpx.Limits(max_keepalive_connections=32, max_connections=64),
+        )
+        options = ClientOptions(
+            postgrest_client_timeout=10,
+            storage_client_timeout=10,
+            httpx_client=http_client,
+        )
+        _supabase = create_client(SUPABASE_URL, SUPABASE_KEY, options=options)
     return _supabase
 
 
+async def run_query(query):
+    """Execute a built PostgREST query in a worker thread; supabase-py blocks on the HTTP call."""
+    return await asyncio.to_thread(query.execute)
+
 
-@dataclass
+
+class _BatchWriter:
+    """
+    Coalesces concurrent upserts per (table, on_conflict) into one PostgREST
+    array upsert. Each caller awaits its own row back, so a burst of N writes
+    (e.g. every installation posted at login) costs one round trip, not N.
+    """
+    
+    def __init__(self):
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+    
+    async def upsert(self, table: str, row: Dict[str, Any], on_conflict: str) -> Optional[Dict[str, Any]]:
+        if self._task is None or self._task.done():
+            self._queue = asyncio.Queue()
+            self._task = asyncio.create_task(self._run())
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((table, on_conflict, row, future))
+        return await future
+    
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + UPSERT_BATCH_WINDOW
+            while len(batch) < UPSERT_BATCH_SIZE:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            
+            groups: Dict[tuple, list] = {}
+            for table, on_conflict, row, future in batch:
+                groups.setdefault((table, on_conflict), []).append((row, future))
+            for (table, on_conflict), items in groups.items():
+                await self._flush(table, on_conflict, items)
+    
+    async def _flush(self, table: str, on_conflict: str, items: list):
+        columns = on_conflict.split(",")
+        key = lambda row: tuple(str(row.get(c)) for c in columns)
+        
+        # Postgres rejects one statement touching the same conflict key twice; last write wins
+        latest = {key(row): row for row, _ in items}
+        try:
+            result = await run_query(get_supabase().table(table).upsert(
+                list(latest.values()),
+                on_conflict=on_conflict
+            ))
+            by_key = {key(r): r for r in (result.data or [])}
+            for row, future in items:
+                if not future.done():
+                    future.set_result(by_key.get(key(row)))
+        except Exception as e:
+            print(f"DB: Batched upsert of {len(latest)} rows into {table} failed: {e}")
+            for _, future in items:
+                if not future.done():
+                    future.set_exception(e)
+
+
+_batch_writer = _BatchWriter()
+
+
+@dataclass(slots=True)
 class Installation:
     github_installation_id: int
     account_login: str
@@ -85,7 +183,7 @@ class Installation:
     updated_at: Optional[str] = None
 
 
-@dataclass
+@dataclass(slots=True)
 class WatchedRepo:
     installation_id: str
     repo_full_name: str
@@ -96,7 +194,7 @@ class WatchedRepo:
     updated_at: Optional[str] = None
 
 
-@dataclass 
+@dataclass(slots=True)
 class HealingRun:
     run_id: str
     repo_full_name: str
@@ -117,22 +215,16 @@ class HealingRun:
 
 async def upsert_installation(installation: Installation) -> Installation:
     """Create or update a GitHub App installation."""
-    supabase = get_supabase()
-    
     data = {
         "github_installation_id": installation.github_installation_id,
         "account_login": installation.account_login,
         "account_type": installation.account_type,
-        "updated_at": datetime.utcnow().isoformat(),
     }
     
-    result = supabase.table("installations").upsert(
-        data, 
-        on_conflict="github_installation_id"
-    ).execute()
+    row = await _batch_writer.upsert("installations", data, on_conflict="github_installation_id")
     
-    if result.data:
-        return Installation(**result.data[0])
+    if row:
+        return Installation(**row)
     return installation
 
 
@@ -141,9 +233,9 @@ async def get_installation(github_installation_id: int) -> Optional[Installation
     supabase = get_supabase()
     
     try:
-        result = supabase.table("installations").select("*").eq(
+        result = await run_query(supabase.table("installations").select("*").eq(
             "github_installation_id", github_installation_id
-        ).limit(1).execute()
+        ).limit(1))
         
         if result.data and len(result.data) > 0:
             return Installation(**result.data[0])
@@ -157,27 +249,26 @@ async def delete_installation(github_installation_id: int) -> bool:
     """Delete an installation (cascade deletes watched repos)."""
     supabase = get_supabase()
     
-    result = supabase.table("installations").delete().eq(
+    result = await run_query(supabase.table("installations").delete().eq(
         "github_installation_id", github_installation_id
-    ).execute()
+    ))
     
     return len(result.data) > 0
 
 
 async def add_watched_repo(repo: WatchedRepo) -> WatchedRepo:
     """Add a repo to watch list."""
-    supabase = get_supabase()
-    
-    data = asdict(repo)
-    data.pop("id", None)  
+    data = {
+        "installation_id": repo.installation_id,
+        "repo_full_name": repo.repo_full_name,
+        "auto_heal_enabled": repo.auto_heal_enabled,
+        "safe_mode": repo.safe_mode,
+    }
     
-    result = supabase.table("watched_repos").upsert(
-        data,
-        on_conflict="installation_id,repo_full_name"
-    ).execute()
+    row = await _batch_writer.upsert("watched_repos", data, on_conflict="installation_id,repo_full_name")
     
-    if result.data:
-        return WatchedRepo(**result.data[0])
+    if row:
+        return WatchedRepo(**row)
     return repo
 
 
@@ -185,9 +276,9 @@ async def get_watched_repos(installation_id: str) -> List[WatchedRepo]:
     """Get all watched repos for an installation."""
     supabase = get_supabase()
     
-    result = supabase.table("watched_repos").select("*").eq(
+    result = await run_query(supabase.table("watched_repos").select("*").eq(
         "installation_id", installation_id
-    ).execute()
+    ))
     
     return [WatchedRepo(**r) for r in result.data]
 
@@ -209,7 +300,7 @@ async def update_repo_settings(
     if not data:
         return False
     
-    result = supabase.table("watched_repos").update(data).eq("id", repo_id).execute()
+    result = await run_query(supabase.table("watched_repos").update(data).eq("id", repo_id))
     return len(result.data) > 0
 
 
@@ -217,9 +308,9 @@ async def remove_watched_repo(installation_id: str, repo_full_name: str) -> bool
     """Remove a repo from watch list."""
     supabase = get_supabase()
     
-    result = supabase.table("watched_repos").delete().eq(
+    result = await run_query(supabase.table("watched_repos").delete().eq(
         "installation_id", installation_id
-    ).eq("repo_full_name", repo_full_name).execute()
+    ).eq("repo_full_name", repo_full_name))
     
     return len(result.data) > 0
 
@@ -244,7 +335,8 @@ async def create_healing_run(run: HealingRun) -> HealingRun:
         data["patient_zero"] = run.patient_zero
     
     try:
-        result = supabase.table("healing_runs").insert(data).execute()
+        result = await run_query(supabase.table("healing_runs").insert(data))
+        await invalidate(*RUNS_CACHE_KEYS)
         
         if result.data:
             print(f"DB: Created healing run {run.run_id}")
@@ -285,16 +377,22 @@ async def update_healing_run(
     if not data:
         return False
     
-    result = supabase.table("healing_runs").update(data).eq("run_id", run_id).execute()
+    result = await run_query(supabase.table("healing_runs").update(data).eq("run_id", run_id))
+    if status or error_type:
+        await invalidate(*RUNS_CACHE_KEYS)
     return len(result.data) > 0
 
 
 async def get_healing_run(run_id: str) -> Optional[HealingRun]:
     """Get a healing run by run_id."""
-    supabase = get_supabase()
+    pool = await get_pool()
     
     try:
-        result = supabase.table("healing_runs").select("*").eq("run_id", run_id).limit(1).execute()
+        if pool:
+            row = await pool.fetchrow("SELECT * FROM healing_runs WHERE run_id = $1 LIMIT 1", run_id)
+            return HealingRun(**record_to_dict(row)) if row else None
+        
+        result = await run_query(get_supabase().table("healing_runs").select("*").eq("run_id", run_id).limit(1))
         
         if result.data and len(result.data) > 0:
             return HealingRun(**result.data[0])
@@ -308,12 +406,37 @@ async def get_recent_runs(
     repo_full_name: Optional[str] = None,
     installation_id: Optional[str] = None,
     status: Optional[str] = None,
-    limit: int = 20
+    limit: int = 20,
+    after: Optional[Tuple[datetime, UUID]] = None
 ) -> List[HealingRun]:
-    """Get recent healing runs with optional filters."""
-    supabase = get_supabase()
+    """
+    Get recent healing runs with optional filters, newest first.
     
-    query = supabase.table("healing_runs").select("*")
+    Pages by keyset: pass the (started_at, id) of the last run seen as
+    `after` to continue from there. limit is capped at MAX_RUNS_PAGE.
+    """
+    limit = max(1, min(limit, MAX_RUNS_PAGE))
+    pool = await get_pool()
+    
+    if pool:
+        filters = {"repo_full_name": repo_full_name, "installation_id": installation_id, "status": status}
+        clauses, args = [], []
+        for column, value in filters.items():
+            if value:
+                args.append(value)
+                clauses.append(f"{column} = ${len(args)}")
+        if after:
+            args.extend(after)
+            clauses.append(f"(started_at, id) < (${len(args) - 1}::timestamptz, ${len(args)}::uuid)")
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        args.append(limit)
+        rows = await pool.fetch(
+            f"SELECT * FROM healing_runs {where} ORDER BY started_at DESC, id DESC LIMIT ${len(args)}",
+            *args
+        )
+        return [HealingRun(**record_to_dict(r)) for r in rows]
+    
+    query = get_supabase().table("healing_runs").select("*")
     
     if repo_full_name:
         query = query.eq("repo_full_name", repo_full_name)
@@ -321,27 +444,60 @@ async def get_recent_runs(
         query = query.eq("installation_id", installation_id)
     if status:
         query = query.eq("status", status)
-    
-    result = query.order("started_at", desc=True).limit(limit).execute()
+    if after:
+        started_at, run_pk = after[0].isoformat(), str(after[1])
+        query = query.or_(
+            f'started_at.lt."{started_at}",and(started_at.eq."{started_at}",id.lt.{run_pk})'
+        )
+    
+    result = await run_query(
+        query.order("started_at", desc=True).order("id", desc=True).limit(limit)
+    )
     
     return [HealingRun(**r) for r in result.data]
 
 
 async def get_run_stats(installation_id: Optional[str] = None) -> Dict[str, Any]:
     """Get aggregate statistics for healing runs."""
-    supabase = get_supabase()
-    
-    query = supabase.table("healing_runs").select("status")
-    if installation_id:
-        query = query.eq("installation_id", installation_id)
-    
-    result = query.execute()
+    pool = await get_pool()
+    
+    if pool:
+        rows = await pool.fetch(
+            "SELECT status, COUNT(*) AS n FROM healing_runs "
+            "WHERE ($1::uuid IS NULL OR installation_id = $1::uuid) GROUP BY status",
+            installation_id
+        )
+        counts = {r["status"]: r["n"] for r in rows}
+        total = sum(counts.values())
+    else:
+        try:
+            result = await run_query(get_supabase().rpc(
+                "get_healing_stats", {"p_installation_id": installation_id}
+            ))
+            counts = result.data[0]
+            total = counts["total"]
+        except Exception as e:
+            # Databases created before get_healing_stats existed: head-only exact counts
+            print(f"get_healing_stats unavailable, counting separately: {e}")
+            
+            async def count(status: Optional[str] = None) -> int:
+                query = get_supabase().table("healing_runs").select("id", count="exact", head=True)
+                if installation_id:
+                    query = query.eq("installation_id", installation_id)
+                if status:
+                    query = query.eq("status", status)
+                return (await run_query(query)).count or 0
+            
+            success, failure, running, total = await asyncio.gather(
+                count("success"), count("failure"), count("running"), count()
+            )
+            counts = {"success": success, "failure": failure, "running": running}
     
     stats = {
-        "total": len(result.data),
-        "success": sum(1 for r in result.data if r["status"] == "success"),
-        "failure": sum(1 for r in result.data if r["status"] == "failure"),
-        "running": sum(1 for r in result.data if r["status"] == "running"),
+        "total": total,
+        "success": counts.get("success", 0),
+        "failure": counts.get("failure", 0),
+        "running": counts.get("running", 0),
     }
     
     stats["success_rate"] = (
@@ -370,7 +526,7 @@ async def persist_healing_event(
             "description": (description or "")[:5000], 
             "metadata": metadata or {},
         }
-        supabase.table("healing_events").insert(data).execute()
+        await run_query(supabase.table("healing_events").insert(data))
         return True
     except Exception as e:
        
@@ -379,35 +535,96 @@ async def persist_healing_event(
 
 
 
+async def persist_healing_events_bulk(events: List[Dict[str, Any]]) -> bool:
+    """Persist a batch of healing events in a single insert."""
+    if not events:
+        return True
+    
+    supabase = get_supabase()
+    
+    try:
+        rows = [
+            {
+                "run_id": e["run_id"],
+                "event_type": e["event_type"],
+                "title": e["title"],
+                "description": (e.get("description") or "")[:5000],
+                "metadata": e.get("metadata") or {},
+            }
+            for e in events
+        ]
+        await run_query(supabase.table("healing_events").insert(rows))
+        return True
+    except Exception as e:
+        print(f"DB: Failed to persist {len(events)} events: {e}")
+        return False
+
+
+
 async def is_repo_watched(repo_full_name: str) -> bool:
     """Check if a repo is being watched by any installation."""
-    supabase = get_supabase()
+    pool = await get_pool()
+    
+    if pool:
+        return await pool.fetchval(
+            "SELECT EXISTS(SELECT 1 FROM watched_repos WHERE repo_full_name = $1 AND auto_heal_enabled)",
+            repo_full_name
+        )
     
-    result = supabase.table("watched_repos").select("id").eq(
+    # Head-only count: PostgREST answers in Content-Range, no row body
+    result = await run_query(get_supabase().table("watched_repos").select("id", count="exact", head=True).eq(
         "repo_full_name", repo_full_name
-    ).eq("auto_heal_enabled", True).limit(1).execute()
+    ).eq("auto_heal_enabled", True).limit(1))
     
-    return len(result.data) > 0
+    return (result.count or 0) > 0
 
 
 async def get_repo_config(repo_full_name: str) -> Optional[WatchedRepo]:
     """Get the configuration for a specific repo."""
-    supabase = get_supabase()
+    pool = await get_pool()
     
-    result = supabase.table("watched_repos").select("*").eq(
+    if pool:
+        row = await pool.fetchrow("SELECT * FROM watched_repos WHERE repo_full_name = $1 LIMIT 1", repo_full_name)
+        return WatchedRepo(**record_to_dict(row)) if row else None
+    
+    result = await run_query(get_supabase().table("watched_repos").select("*").eq(
         "repo_full_name", repo_full_name
-    ).single().execute()
+    ).single())
     
     if result.data:
         return WatchedRepo(**result.data)
     return None
 
+
+async def get_repo_config_if_watched(repo_full_name: str) -> Optional[WatchedRepo]:
+    """
+    The repo's config if auto-heal is enabled for it, else None. Answers both
+    is_repo_watched and get_repo_config in one round trip for the webhook path.
+    """
+    pool = await get_pool()
+    
+    if pool:
+        row = await pool.fetchrow(
+            "SELECT * FROM watched_repos WHERE repo_full_name = $1 AND auto_heal_enabled LIMIT 1",
+            repo_full_name
+        )
+        return WatchedRepo(**record_to_dict(row)) if row else None
+    
+    result = await run_query(get_supabase().table("watched_repos").select("*").eq(
+        "repo_full_name", repo_full_name
+    ).eq("auto_heal_enabled", True).limit(1))
+    
+    if result.data:
+        return WatchedRepo(**result.data[0])
+    return None
+
 async def delete_healing_run(run_id: str) -> bool:
     """Delete a healing run by run_id."""
     supabase = get_supabase()
     
     try:
-        result = supabase.table("healing_runs").delete().eq("run_id", run_id).execute()
+        result = await run_query(supabase.table("healing_runs").delete().eq("run_id", run_id))
+        await invalidate(*RUNS_CACHE_KEYS)
         return len(result.data) > 0
     except Exception as e:
         print(f"Error deleting healing run: {e}")
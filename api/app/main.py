@@ -1,6 +1,6 @@
 from fastapi import FastAPI, Request, BackgroundTasks, Depends
 from fastapi.middleware.cors import CORSMiddleware
-from app.core.security import verify_github_signature
+from app.core.security import verify_github_signature, HANDLED_WEBHOOK_EVENTS
 from app.db.supabase import save_installation
 from app.core.agent import run_healing_mission
 from app.routes.events import router as events_router
@@ -8,8 +8,10 @@ from app.routes.runs import router as runs_router
 from app.routes.installations import router as installations_router
 from app.routes.stats import router as stats_router
 from app.routes.chat import router as chat_router
+from app.core.responses import MsgspecJSONResponse
 from dotenv import load_dotenv
 import uuid
+import asyncio
 import logging
 
 load_dotenv()
@@ -22,7 +24,8 @@ logging.getLogger("e2b").setLevel(logging.WARNING)
 app = FastAPI(
     title="TALOS Neural System",
     description="The Self-Healing DevOps Species - Autonomous CI/CD Repair",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=MsgspecJSONResponse
 )
 
 
@@ -41,6 +44,29 @@ app.include_router(installations_router)
 app.include_router(stats_router)
 app.include_router(chat_router)
 
+@app.on_event("startup")
+async def startup():
+    from app.core.github_auth import sync_clock_skew_offset
+    from app.db.pool import get_pool
+    from app.core.event_bus import get_event_bus
+    # Warm the clock offset in the background instead of on the first JWT
+    app.state.clock_sync_task = asyncio.create_task(sync_clock_skew_offset())
+    await get_pool()
+    # Connect the event bus now so the first SSE client doesn't pay for it
+    try:
+        await get_event_bus()
+    except Exception as e:
+        print(f"Event bus not ready at startup, will retry on first use: {e}")
+
+@app.on_event("shutdown")
+async def shutdown():
+    from app.core.github_auth import close_http_client
+    from app.db.pool import close_pool
+    from app.core.event_bus import close_event_bus
+    await close_http_client()
+    await close_pool()
+    await close_event_bus()
+
 @app.get("/")
 def health_check():
     return {
@@ -56,9 +82,14 @@ async def github_webhook(request: Request, background_tasks: BackgroundTasks):
     Receives the webhook and dispatches the Agent in the background.
     Returns immediately with a run_id for SSE subscription.
     """
-    payload = await request.json()
     event_type = request.headers.get("X-GitHub-Event")
     
+    # Pushes and other unused events can be megabytes; don't parse what we'd discard
+    if event_type not in HANDLED_WEBHOOK_EVENTS:
+        return {"status": "ignored"}
+    
+    payload = await request.json()
+    
     print(f"Signal Received: {event_type}")
 
  
@@ -117,14 +148,15 @@ async def debug_auth():
     """
     Debug endpoint to test GitHub App authentication.
     """
-    from app.core.github_auth import generate_jwt, load_private_key
-    import httpx
+    from app.core.github_auth import generate_jwt, load_private_key, sync_clock_skew_offset, get_http_client
     
     try:
       
         key = load_private_key()
         key_info = f"Key loaded: {len(key)} bytes, starts with {key[:30].decode('utf-8', errors='ignore')}..."
 
+        # generate_jwt only reads the recorded offset; the JWT itself is cached in github_auth
+        await sync_clock_skew_offset()
         token = generate_jwt()
         jwt_info = f"JWT generated: {len(token)} chars"
    
@@ -134,30 +166,29 @@ async def debug_auth():
             "X-GitHub-Api-Version": "2022-11-28"
         }
         
-        async with httpx.AsyncClient() as client:
-            resp = await client.get("https://api.github.com/app", headers=headers)
+        resp = await get_http_client().get("https://api.github.com/app", headers=headers)
+        
+        if resp.status_code == 200:
+            app_info = resp.json()
+            return {
+                "status": "success",
+                "key_info": key_info,
+                "jwt_info": jwt_info,
+                "app_name": app_info.get("name"),
+                "app_id": app_info.get("id"),
+                "app_url": app_info.get("html_url"),
+                "message": "GitHub App authentication is working!"
+            }
+        else:
+            return {
+                "status": "auth_failed",
+                "key_info": key_info,
+                "jwt_info": jwt_info,
+                "github_status": resp.status_code,
+                "github_response": resp.text,
+                "message": "GitHub rejected the JWT - private key likely doesn't match the registered public key"
+            }
             
-            if resp.status_code == 200:
-                app_info = resp.json()
-                return {
-                    "status": "success",
-                    "key_info": key_info,
-                    "jwt_info": jwt_info,
-                    "app_name": app_info.get("name"),
-                    "app_id": app_info.get("id"),
-                    "app_url": app_info.get("html_url"),
-                    "message": "GitHub App authentication is working!"
-                }
-            else:
-                return {
-                    "status": "auth_failed",
-                    "key_info": key_info,
-                    "jwt_info": jwt_info,
-                    "github_status": resp.status_code,
-                    "github_response": resp.text,
-                    "message": "GitHub rejected the JWT - private key likely doesn't match the registered public key"
-                }
-                
     except Exception as e:
         return {
             "status": "error",
@@ -3,18 +3,32 @@ TALOS AI Chat - Conversational interface for discussing healing runs.
 Users can ask questions about any fix, understand the diagnosis, and learn more.
 """
 
+import time
+import asyncio
+from collections import OrderedDict
+import msgspec
 from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from typing import Optional
+from typing import Optional, Tuple, AsyncGenerator
 from google import genai
 from google.genai import types
 from app.core.key_manager import key_rotator
-from app.db.supabase import get_supabase
+from app.db.supabase import get_supabase, run_query
+from app.db.pool import get_pool, record_to_dict
+from app.core.responses import MsgspecJSONResponse
 
 router = APIRouter(prefix="/chat", tags=["chat"])
 
 MODEL_NAME = "gemini-3-flash-preview"  
 
+# Chat turns on the same run reuse its context; finished runs no longer change
+RUN_CACHE_SIZE = 1024
+RUN_CACHE_TTL = 30
+RUN_CACHE_TTL_FINISHED = 3600
+FINISHED_STATUSES = ("success", "failure", "cancelled")
+_run_cache: "OrderedDict[str, Tuple[float, dict, list]]" = OrderedDict()
+
 
 class ChatMessage(BaseModel):
     role: str  
@@ -32,18 +46,114 @@ class ChatResponse(BaseModel):
     run_context: Optional[dict] = None  
 
 
-async def get_run_context(run_id: str) -> dict | None:
-    """Fetch healing run details from database for context."""
+SYSTEM_PROMPT = """You are TALOS AI, an intelligent assistant that helps developers understand and learn from automated code fixes.
+
+Your personality:
+- Friendly and helpful, like a senior developer mentoring juniors
+- Technical but accessible - explain complex concepts simply
+- Proactive - suggest related improvements or learning opportunities
+- Humble - acknowledge limitations and suggest when human review is needed
+- Professional - avoid using emojis in responses
+
+Your capabilities:
+- Explain what went wrong in the code and why
+- Break down the fix that was applied
+- Teach debugging techniques and best practices
+- Answer questions about error types, patterns, and prevention
+- Discuss the healing process (cloning, analysis, fix, verification, PR)
+
+The next message describes the healing run attached to this conversation, if any.
+
+IMPORTANT RULES:
+1. If asked about a specific fix but no run is attached, ask the user to attach one
+2. Be concise but thorough - developers appreciate efficiency
+3. Use code examples when helpful (use markdown code blocks)
+4. If you don't know something, say so honestly
+5. Always encourage the user to review fixes before merging
+6. Do not use emojis in your responses - keep it professional
+
+Respond in a conversational, helpful manner. You are TALOS, the autonomous healing agent."""
+
+NO_RUN_CONTEXT = "No specific healing run is attached to this conversation. You can discuss TALOS in general or ask the user to attach a specific run."
+
+_PRIMER = (
+    types.Content(
+        role="user",
+        parts=[types.Part.from_text(text=SYSTEM_PROMPT)]
+    ),
+    types.Content(
+        role="model", 
+        parts=[types.Part.from_text(text="I understand. I'm TALOS AI, ready to help you understand code fixes and debugging. How can I assist you today?")]
+    ),
+)
+GENERATION_CONFIG = types.GenerateContentConfig(
+    temperature=0.7,  
+    top_p=0.9,
+    max_output_tokens=1024,
+)
+
+_CONTEXT_ACK = types.Content(
+    role="model",
+    parts=[types.Part.from_text(text="Got it. I'll use this context when answering.")]
+)
+
+
+# Run row plus its ordered event timeline in one round trip. Event metadata
+# (logs, diffs, screenshot flags) is never shown in the prompt, so it isn't fetched.
+RUN_WITH_EVENTS_SQL = """
+SELECT r.*,
+       COALESCE(
+           json_agg(
+               json_build_object(
+                   'event_type', e.event_type,
+                   'title', e.title,
+                   'description', e.description
+               ) ORDER BY e.created_at
+           ) FILTER (WHERE e.run_id IS NOT NULL),
+           '[]'
+       ) AS events
+FROM healing_runs r
+LEFT JOIN healing_events e ON e.run_id = r.run_id
+WHERE r.run_id = $1
+GROUP BY r.id
+"""
+
+
+async def get_run_with_events(run_id: str) -> tuple[dict | None, list]:
+    """Cached run context and events, refetched after RUN_CACHE_TTL while the run is live."""
+    cached = _run_cache.get(run_id)
+    if cached and cached[0] > time.monotonic():
+        _run_cache.move_to_end(run_id)
+        return cached[1], cached[2]
+    
+    run_context, events = await _fetch_run_with_events(run_id)
+    if run_context:
+        ttl = RUN_CACHE_TTL_FINISHED if run_context.get("status") in FINISHED_STATUSES else RUN_CACHE_TTL
+        _run_cache[run_id] = (time.monotonic() + ttl, run_context, events)
+        _run_cache.move_to_end(run_id)
+        while len(_run_cache) > RUN_CACHE_SIZE:
+            _run_cache.popitem(last=False)
+    return run_context, events
+
+
+async def _fetch_run_with_events(run_id: str) -> tuple[dict | None, list]:
+    """Fetch a healing run and its events for context in a single query."""
     try:
-        supabase = get_supabase()
-        result = supabase.table("healing_runs")\
-            .select("*")\
-            .eq("run_id", run_id)\
-            .single()\
-            .execute()
-        
-        if result.data and isinstance(result.data, dict):
+        pool = await get_pool()
+        if pool:
+            row = await pool.fetchrow(RUN_WITH_EVENTS_SQL, run_id)
+            data = record_to_dict(row) if row else None
+        else:
+            # PostgREST embeds the events through the run_id foreign key; embedded
+            # modifiers take the alias, so this sends events.order=created_at.asc
+            result = await run_query(get_supabase().table("healing_runs")
+                .select("*, events:healing_events(event_type, title, description)")
+                .eq("run_id", run_id)
+                .order("created_at", foreign_table="events")
+                .single())
             data = result.data
+        
+        if data and isinstance(data, dict):
             return {
                 "run_id": data.get("run_id"),
                 "repo": data.get("repo_full_name"),
@@ -55,50 +165,26 @@ async def get_run_context(run_id: str) -> dict | None:
                 "pr_url": data.get("pr_url"),
                 "started_at": data.get("started_at"),
                 "metadata": data.get("metadata", {}),
-            }
-        return None
-    except Exception: 
-        return None
+            }, data.get("events") or []
+        return None, []
+    except Exception as e:
+        print(f"Failed to load run {run_id} for chat context: {e}")
+        return None, []
 
 
-async def get_run_events(run_id: str) -> list:
-    """Fetch events from a healing run for detailed context."""
-    try:
-        supabase = get_supabase()
-        result = supabase.table("healing_events")\
-            .select("event_type, title, description, metadata")\
-            .eq("run_id", run_id)\
-            .order("created_at")\
-            .execute()
-        
-        return result.data or []
-    except Exception:  
-        return []
-
-
-@router.post("/", response_model=ChatResponse)
-async def chat_with_talos(request: ChatRequest):
-    """
-    Chat with TALOS AI about healing runs and fixes.
-    
-    - Provide a message to ask questions
-    - Optionally attach a run_id to discuss a specific fix
-    - Conversation history is maintained for context
-    """
-    
-    
+async def _build_conversation(request: ChatRequest) -> tuple[list, Optional[dict]]:
+    """Gemini contents for a chat turn, plus the attached run's context if any."""
     run_context = None
     context_block = ""
     
     if request.run_id:
-        run_context = await get_run_context(request.run_id)
-        events = await get_run_events(request.run_id)
+        run_context, events = await get_run_with_events(request.run_id)
         
         if run_context:
            
             meta = run_context.get('metadata') or {}
             
-            context_block = f"""
+            parts = [f"""
 ═══════════════════════════════════════════════════════════════
 ATTACHED HEALING RUN: {request.run_id}
 ═══════════════════════════════════════════════════════════════
@@ -134,55 +220,25 @@ GEMINI'S FIX PLAN:
 ═══════════════════════════════════════════════════════════════
 HEALING TIMELINE (What TALOS did):
 ═══════════════════════════════════════════════════════════════
-"""
+"""]
             for event in events:
-                context_block += f"• [{event.get('event_type', 'event')}] {event.get('title', '')}\n"
-                if event.get('description'):
-                    context_block += f"  {event.get('description')[:200]}...\n" if len(event.get('description', '')) > 200 else f"  {event.get('description')}\n"
+                parts.append(f"• [{event.get('event_type', 'event')}] {event.get('title', '')}\n")
+                description = event.get('description')
+                if description:
+                    ellipsis = "..." if len(description) > 200 else ""
+                    parts.append(f"  {description[:200]}{ellipsis}\n")
             
-            context_block += "═══════════════════════════════════════════════════════════════\n"
+            parts.append("═══════════════════════════════════════════════════════════════\n")
+            context_block = "".join(parts)
     
    
-    system_prompt = f"""You are TALOS AI, an intelligent assistant that helps developers understand and learn from automated code fixes.
-
-Your personality:
-- Friendly and helpful, like a senior developer mentoring juniors
-- Technical but accessible - explain complex concepts simply
-- Proactive - suggest related improvements or learning opportunities
-- Humble - acknowledge limitations and suggest when human review is needed
-- Professional - avoid using emojis in responses
-
-Your capabilities:
-- Explain what went wrong in the code and why
-- Break down the fix that was applied
-- Teach debugging techniques and best practices
-- Answer questions about error types, patterns, and prevention
-- Discuss the healing process (cloning, analysis, fix, verification, PR)
-
-{context_block if context_block else "No specific healing run is attached to this conversation. You can discuss TALOS in general or ask the user to attach a specific run."}
-
-IMPORTANT RULES:
-1. If asked about a specific fix but no run is attached, ask the user to attach one
-2. Be concise but thorough - developers appreciate efficiency
-3. Use code examples when helpful (use markdown code blocks)
-4. If you don't know something, say so honestly
-5. Always encourage the user to review fixes before merging
-6. Do not use emojis in your responses - keep it professional
-
-Respond in a conversational, helpful manner. You are TALOS, the autonomous healing agent."""
-
-    
-    conversation = []
-    
-    
+    # Static primer is shared; only the run context turn is built per request
+    conversation = list(_PRIMER)
     conversation.append(types.Content(
         role="user",
-        parts=[types.Part.from_text(text=system_prompt)]
-    ))
-    conversation.append(types.Content(
-        role="model", 
-        parts=[types.Part.from_text(text="I understand. I'm TALOS AI, ready to help you understand code fixes and debugging. How can I assist you today?")]
+        parts=[types.Part.from_text(text=context_block or NO_RUN_CONTEXT)]
     ))
+    conversation.append(_CONTEXT_ACK)
     
    
     for msg in request.history[-10:]: 
@@ -197,6 +253,20 @@ Respond in a conversational, helpful manner. You are TALOS, the autonomous heali
         role="user",
         parts=[types.Part.from_text(text=request.message)]
     ))
+    
+    return conversation, run_context
+
+
+@router.post("/", response_model=ChatResponse)
+async def chat_with_talos(request: ChatRequest):
+    """
+    Chat with TALOS AI about healing runs and fixes.
+    
+    - Provide a message to ask questions
+    - Optionally attach a run_id to discuss a specific fix
+    - Conversation history is maintained for context
+    """
+    conversation, run_context = await _build_conversation(request)
 
     try:
         
@@ -204,18 +274,13 @@ Respond in a conversational, helpful manner. You are TALOS, the autonomous heali
         client = genai.Client(api_key=current_key)
         
        
-        import asyncio
         try:
             response = await asyncio.wait_for(
                 asyncio.to_thread(
                     client.models.generate_content,
                     model=MODEL_NAME,
                     contents=conversation,
-                    config=types.GenerateContentConfig(
-                        temperature=0.7,  
-                        top_p=0.9,
-                        max_output_tokens=1024,
-                    )
+                    config=GENERATION_CONFIG
                 ),
                 timeout=60.0  
             )
@@ -225,17 +290,18 @@ Respond in a conversational, helpful manner. You are TALOS, the autonomous heali
                 detail="The AI model took too long to respond. Please try again."
             )
         
-        return ChatResponse(
-            response=response.text,
-            run_context=run_context
-        )
+        # Returned as-is: no response_model re-validation or jsonable_encoder pass
+        return MsgspecJSONResponse({
+            "response": response.text,
+            "run_context": run_context,
+        })
         
     except Exception as e: 
         error_msg = str(e)
         
         
         if "429" in error_msg or "quota" in error_msg.lower():
-            key_rotator.rotate()
+            key_rotator.rotate(current_key)
             raise HTTPException(
                 status_code=429, 
                 detail="I'm a bit overwhelmed right now. Please try again in a moment!"
@@ -247,6 +313,56 @@ Respond in a conversational, helpful manner. You are TALOS, the autonomous heali
         ) from e
 
 
+@router.post("/stream")
+async def chat_with_talos_stream(request: ChatRequest):
+    """
+    Streaming variant of POST /chat/ over Server-Sent Events.
+    
+    SSE Format:
+        event: token     data: {"text": "<chunk>"}   (repeated)
+        event: done      data: {"run_context": {...}}
+        event: error     data: {"status": 429|500|504, "detail": "..."}
+    """
+    conversation, run_context = await _build_conversation(request)
+    
+    async def token_stream() -> AsyncGenerator[bytes, None]:
+        current_key = key_rotator.get_current_key()
+        client = genai.Client(api_key=current_key)
+        try:
+            async with asyncio.timeout(60.0):
+                stream = await client.aio.models.generate_content_stream(
+                    model=MODEL_NAME,
+                    contents=conversation,
+                    config=GENERATION_CONFIG
+                )
+                async for chunk in stream:
+                    if chunk.text:
+                        yield _sse("token", {"text": chunk.text})
+            yield _sse("done", {"run_context": run_context})
+        except TimeoutError:
+            yield _sse("error", {"status": 504, "detail": "The AI model took too long to respond. Please try again."})
+        except Exception as e:
+            error_msg = str(e)
+            if "429" in error_msg or "quota" in error_msg.lower():
+                key_rotator.rotate(current_key)
+                yield _sse("error", {"status": 429, "detail": "I'm a bit overwhelmed right now. Please try again in a moment!"})
+            else:
+                yield _sse("error", {"status": 500, "detail": "I encountered an error processing your message. Please try again."})
+    
+    return StreamingResponse(
+        token_stream(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",
+        }
+    )
+
+
+def _sse(event: str, data: dict) -> bytes:
+    return b"event: %s\ndata: %s\n\n" % (event.encode(), msgspec.json.encode(data))
+
+
 @router.get("/health")
 async def chat_health():
     """Check if chat service is available."""
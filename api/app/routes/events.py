@@ -8,26 +8,52 @@ The "Glass Box" experience - users watch the agent think in real-time.
 This is what makes TALOS stand out from 300+ black-box competitors.
 """
 
-from fastapi import APIRouter, HTTPException
-from fastapi.responses import StreamingResponse
-from typing import AsyncGenerator
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import Response
+from sse_starlette.sse import EventSourceResponse
+from typing import AsyncGenerator, Optional
 import asyncio
+import msgspec
 
-from app.core.event_bus import get_event_bus, HealingEvent, EventType
+from app.core.event_bus import get_event_bus
 
 router = APIRouter(prefix="/events", tags=["Real-Time Events"])
 
+KEEPALIVE_SECONDS = 15
+COMPLETE_FRAME = b'event: complete\ndata: {"message": "Run already completed"}\n\n'
 
-async def event_generator(run_id: str) -> AsyncGenerator[str, None]:
+# Probes read the last result; one background task does the Redis round trip
+HEALTH_REFRESH_SECONDS = 5
+_health: dict = {"ok": False, "error": "Not checked yet"}
+_health_task: Optional[asyncio.Task] = None
+
+
+async def _check_bus_health():
+    try:
+        bus = await get_event_bus()
+        await bus.ping()
+        _health.update(ok=True, error=None)
+    except Exception as e:
+        _health.update(ok=False, error=str(e))
+
+
+async def _health_refresher():
+    while True:
+        await asyncio.sleep(HEALTH_REFRESH_SECONDS)
+        await _check_bus_health()
+
+
+async def event_generator(run_id: str, last_event_id: Optional[int] = None) -> AsyncGenerator[bytes, None]:
     """
     Generates SSE-formatted events for a healing run.
     
-    Uses an asyncio.Queue bridge with a background reader task so we can
-    send SSE keep-alive comments (`: keepalive`) every 15 seconds when
-    no events arrive.  This prevents proxies and browsers from closing
-    idle connections during long-running phases like Visual Cortex capture.
+    Frames are yielded as ready-made bytes; EventSourceResponse passes
+    them through untouched and handles keep-alive pings and client
+    disconnects itself.  On a reconnect, `last_event_id` limits the
+    replay to events the browser has not seen yet.
     
     SSE Format:
+        id: <per-run sequence number>
         event: <event_type>
         data: <json_payload>
         
@@ -35,67 +61,29 @@ async def event_generator(run_id: str) -> AsyncGenerator[str, None]:
     """
     bus = await get_event_bus()
  
-    history = await bus.get_history(run_id)
-    is_already_complete = False
-    
-    for event in history:
-        yield f"event: {event.event_type.value}\ndata: {event.to_json()}\n\n"
-
-        if event.event_type in (EventType.MISSION_END, EventType.SUCCESS, EventType.FAILURE):
-            is_already_complete = True
+    # Whole history in one write; cached in memory once the run has finished
+    replay, is_already_complete = await bus.get_replay(run_id, after=last_event_id)
+    if replay:
+        yield replay
     
   
-    yield f"event: connected\ndata: {{\"run_id\": \"{run_id}\", \"message\": \"Connected to TALOS Neural Stream\"}}\n\n"
+    yield b'event: connected\ndata: {"run_id": "%s", "message": "Connected to TALOS Neural Stream"}\n\n' % run_id.encode()
     
  
     if is_already_complete:
-        yield f"event: complete\ndata: {{\"message\": \"Run already completed\"}}\n\n"
+        yield COMPLETE_FRAME
         return
  
-    queue: asyncio.Queue = asyncio.Queue()
-
-    async def _reader():
-        """Background task that pumps events from Redis into the queue."""
-        try:
-            async for event in bus.subscribe(run_id):
-                await queue.put(event)
-        except asyncio.CancelledError:
-            pass
-        except Exception as e:
-            print(f"SSE reader error for {run_id}: {e}")
-     
-        await queue.put(None)
-
-    reader_task = asyncio.create_task(_reader())
-
+    events = bus.subscribe(run_id)
     try:
-        while True:
-            try:
-                event = await asyncio.wait_for(queue.get(), timeout=15)
-            except asyncio.TimeoutError:
-               
-                yield ": keepalive\n\n"
-                continue
-
-            if event is None:
-          
-                break
-
-            yield f"event: {event.event_type.value}\ndata: {event.to_json()}\n\n"
-
-    except asyncio.CancelledError:
-      
-        yield f"event: disconnected\ndata: {{\"message\": \"Stream ended\"}}\n\n"
+        async for batch in events:
+            yield b"".join(event.to_sse_bytes() for event in batch)
     finally:
-        reader_task.cancel()
-        try:
-            await reader_task
-        except asyncio.CancelledError:
-            pass
+        await events.aclose()
 
 
 @router.get("/stream/{run_id}")
-async def stream_healing_events(run_id: str):
+async def stream_healing_events(run_id: str, request: Request):
     """
     Subscribe to real-time events for a healing run.
     
@@ -115,15 +103,15 @@ async def stream_healing_events(run_id: str):
             eventSource.close();
         });
     """
-    return StreamingResponse(
-        event_generator(run_id),
-        media_type="text/event-stream",
-        headers={
-            "Cache-Control": "no-cache",
-            "Connection": "keep-alive",
-            "X-Accel-Buffering": "no",  
-            "Access-Control-Allow-Origin": "*",
-        }
+    # Ids are per-run sequence numbers; anything else replays the full history
+    last_event_id = request.headers.get("last-event-id", "")
+    after = int(last_event_id) if last_event_id.isdigit() else None
+    
+    # Sets no-cache, keep-alive and X-Accel-Buffering itself
+    return EventSourceResponse(
+        event_generator(run_id, after),
+        ping=KEEPALIVE_SECONDS,
+        headers={"Access-Control-Allow-Origin": "*"},
     )
 
 
@@ -137,19 +125,11 @@ async def get_run_history(run_id: str):
         bus = await get_event_bus()
         history = await bus.get_history(run_id)
         
-        return {
-            "run_id": run_id,
-            "events": [
-                {
-                    "event_type": e.event_type.value,
-                    "title": e.title,
-                    "description": e.description,
-                    "timestamp": e.timestamp,
-                    "metadata": e.metadata
-                }
-                for e in history
-            ]
-        }
+        # Structs encode natively; no per-event dict or validation pass
+        return Response(
+            msgspec.json.encode({"run_id": run_id, "events": history}),
+            media_type="application/json"
+        )
     except Exception as e:
         print(f"Failed to get history for {run_id}: {e}")
        
@@ -162,10 +142,12 @@ async def get_run_history(run_id: str):
 
 @router.get("/health")
 async def events_health():
-    """Check if the event bus is healthy."""
-    try:
-        bus = await get_event_bus()
-        await bus.connect()
-        return {"status": "healthy", "message": "Event bus connected"}
-    except Exception as e:
-        raise HTTPException(status_code=503, detail=f"Event bus unhealthy: {e}")
+    """Check if the event bus is healthy (as of the last background ping)."""
+    global _health_task
+    if _health_task is None or _health_task.done():
+        await _check_bus_health()
+        _health_task = asyncio.create_task(_health_refresher())
+    
+    if not _health["ok"]:
+        raise HTTPException(status_code=503, detail=f"Event bus unhealthy: {_health['error']}")
+    return {"status": "healthy", "message": "Event bus connected"}
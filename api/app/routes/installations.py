@@ -5,13 +5,52 @@ Handles GitHub App installation management.
 Syncs installations from the OAuth flow to Supabase.
 """
 
+import time
+import asyncio
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
-from typing import Optional
-from app.db.supabase import save_installation, get_installation
+from typing import Optional, Dict, Tuple
+from app.db.supabase import save_installation, get_installation, run_query
 
 router = APIRouter(prefix="/installations", tags=["Installations"])
 
+# installation_id -> (stored_at, ETag, repositories); a 304 revalidates the entry
+REPOS_ETAG_TTL_SECONDS = 300
+_repos_etag_cache: Dict[int, Tuple[float, str, list]] = {}
+
+
+async def _fetch_installation_repos(installation_id: int) -> list:
+    """GitHub's repo list for an installation, revalidated with If-None-Match."""
+    from app.core.github_auth import get_installation_access_token, get_http_client
+    
+    token = await get_installation_access_token(installation_id)
+    headers = {
+        "Authorization": f"Bearer {token}",
+        "Accept": "application/vnd.github+json",
+    }
+    cached = _repos_etag_cache.get(installation_id)
+    if cached and time.monotonic() - cached[0] > REPOS_ETAG_TTL_SECONDS:
+        cached = None
+    if cached:
+        headers["If-None-Match"] = cached[1]
+    
+    response = await get_http_client().get(
+        "https://api.github.com/installation/repositories",
+        headers=headers
+    )
+    
+    if response.status_code == 304 and cached:
+        _repos_etag_cache[installation_id] = (time.monotonic(), cached[1], cached[2])
+        return cached[2]
+    if response.status_code != 200:
+        raise HTTPException(status_code=response.status_code, detail="Failed to fetch repos")
+    
+    repos = response.json().get("repositories", [])
+    etag = response.headers.get("ETag")
+    if etag:
+        _repos_etag_cache[installation_id] = (time.monotonic(), etag, repos)
+    return repos
+
 
 class InstallationCreate(BaseModel):
     github_installation_id: int
@@ -57,44 +96,24 @@ async def sync_installation(installation_id: int):
     Sync an installation - fetches repos and updates database.
     Called after app installation to discover accessible repos.
     """
-    from app.core.github_auth import get_installation_access_token
-    import httpx
-    
     try:
+        repos = await _fetch_installation_repos(installation_id)
         
-        token = await get_installation_access_token(installation_id)
+        print(f"Found {len(repos)} accessible repositories for installation {installation_id}")
         
-      
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                "https://api.github.com/installation/repositories",
-                headers={
-                    "Authorization": f"Bearer {token}",
-                    "Accept": "application/vnd.github+json",
+        return {
+            "installation_id": installation_id,
+            "repositories": [
+                {
+                    "full_name": r["full_name"],
+                    "private": r["private"],
+                    "default_branch": r.get("default_branch", "main"),
                 }
-            )
-            
-            if response.status_code != 200:
-                raise HTTPException(status_code=response.status_code, detail="Failed to fetch repos")
-            
-            data = response.json()
-            repos = data.get("repositories", [])
-            
-            print(f"Found {len(repos)} accessible repositories for installation {installation_id}")
-            
-            return {
-                "installation_id": installation_id,
-                "repositories": [
-                    {
-                        "full_name": r["full_name"],
-                        "private": r["private"],
-                        "default_branch": r.get("default_branch", "main"),
-                    }
-                    for r in repos
-                ],
-                "total_count": len(repos),
-            }
-            
+                for r in repos
+            ],
+            "total_count": len(repos),
+        }
+        
     except Exception as e:
         print(f"Sync error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -122,108 +141,40 @@ async def list_installation_repos(installation_id: int):
     """
     List all repositories accessible to an installation.
     """
-    from app.core.github_auth import get_installation_access_token
     from app.db.supabase import get_supabase
-    import httpx
     
     try:
-        token = await get_installation_access_token(installation_id)
-        supabase = get_supabase()
+        # The watched list doesn't need the token; fetch it while GitHub answers
+        github_repos, watched = await asyncio.gather(
+            _fetch_installation_repos(installation_id),
+            run_query(get_supabase().table("watched_repos")
+                .select("repo_full_name, auto_heal_enabled, safe_mode")),
+        )
         
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                "https://api.github.com/installation/repositories",
-                headers={
-                    "Authorization": f"Bearer {token}",
-                    "Accept": "application/vnd.github+json",
-                }
-            )
-            
-            data = response.json()
-            github_repos = data.get("repositories", [])
-            
-           
-            watched = supabase.table("watched_repos")\
-                .select("repo_full_name, auto_heal_enabled, safe_mode")\
-                .execute()
-            
-            watched_map = {r["repo_full_name"]: r for r in (watched.data or [])}
-            
-            repos_with_status = []
-            for repo in github_repos:
-                full_name = repo["full_name"]
-                watch_info = watched_map.get(full_name, {})
-                repos_with_status.append({
-                    "full_name": full_name,
-                    "name": repo["name"],
-                    "private": repo["private"],
-                    "default_branch": repo.get("default_branch", "main"),
-                    "description": repo.get("description"),
-                    "watched": full_name in watched_map,
-                    "auto_heal_enabled": watch_info.get("auto_heal_enabled", False),
-                    "safe_mode": watch_info.get("safe_mode", True),
-                })
-            
-            return {
-                "repositories": repos_with_status,
-                "total_count": len(repos_with_status),
-            }
-            
-    except Exception as e:
-        print(f"REPO LIST ERROR: {e}")  
-        raise HTTPException(status_code=500, detail=str(e))
-    
-    """
-    List all repositories accessible to an installation.
-    """
-    from app.core.github_auth import get_installation_access_token
-    from app.db.supabase import get_supabase
-    import httpx
-    
-    try:
-        token = await get_installation_access_token(installation_id)
-        supabase = get_supabase()
+        watched_map = {r["repo_full_name"]: r for r in (watched.data or [])}
+        
+        repos_with_status = []
+        for repo in github_repos:
+            full_name = repo["full_name"]
+            watch_info = watched_map.get(full_name, {})
+            repos_with_status.append({
+                "full_name": full_name,
+                "name": repo["name"],
+                "private": repo["private"],
+                "default_branch": repo.get("default_branch", "main"),
+                "description": repo.get("description"),
+                "watched": full_name in watched_map,
+                "auto_heal_enabled": watch_info.get("auto_heal_enabled", False),
+                "safe_mode": watch_info.get("safe_mode", True),
+            })
+        
+        return {
+            "repositories": repos_with_status,
+            "total_count": len(repos_with_status),
+        }
         
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                "https://api.github.com/installation/repositories",
-                headers={
-                    "Authorization": f"Bearer {token}",
-                    "Accept": "application/vnd.github+json",
-                }
-            )
-            
-            data = response.json()
-            github_repos = data.get("repositories", [])
-            
-            watched = supabase.table("watched_repos")\
-                .select("repo_full_name, auto_heal_enabled, safe_mode")\
-                .execute()
-            
-            watched_map = {r["repo_full_name"]: r for r in (watched.data or [])}
-            
-
-            repos_with_status = []
-            for repo in github_repos:
-                full_name = repo["full_name"]
-                watch_info = watched_map.get(full_name, {})
-                repos_with_status.append({
-                    "full_name": full_name,
-                    "name": repo["name"],
-                    "private": repo["private"],
-                    "default_branch": repo.get("default_branch", "main"),
-                    "description": repo.get("description"),
-                    "watched": full_name in watched_map,
-                    "auto_heal_enabled": watch_info.get("auto_heal_enabled", False),
-                    "safe_mode": watch_info.get("safe_mode", True),
-                })
-            
-            return {
-                "repositories": repos_with_status,
-                "total_count": len(repos_with_status),
-            }
-            
     except Exception as e:
+        print(f"REPO LIST ERROR: {e}")  
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -238,27 +189,26 @@ async def watch_repo(installation_id: int, data: WatchRepoRequest):
     """
     Start watching a repository for CI failures.
     """
-    from app.db.supabase import get_supabase
+    from app.db.supabase import get_supabase, add_watched_repo, WatchedRepo
     
     try:
         supabase = get_supabase()
    
-        inst = supabase.table("installations")\
-            .select("id")\
-            .eq("github_installation_id", installation_id)\
-            .single()\
-            .execute()
+        inst = await run_query(supabase.table("installations")
+            .select("id")
+            .eq("github_installation_id", installation_id)
+            .single())
         
         if not inst.data:
             raise HTTPException(status_code=404, detail="Installation not found")
         
     
-        result = supabase.table("watched_repos").upsert({
-            "installation_id": inst.data["id"],
-            "repo_full_name": data.repo_full_name,
-            "auto_heal_enabled": data.auto_heal_enabled,
-            "safe_mode": data.safe_mode,
-        }, on_conflict="installation_id,repo_full_name").execute()
+        await add_watched_repo(WatchedRepo(
+            installation_id=inst.data["id"],
+            repo_full_name=data.repo_full_name,
+            auto_heal_enabled=data.auto_heal_enabled,
+            safe_mode=data.safe_mode,
+        ))
         
         print(f"Now watching: {data.repo_full_name}")
         
@@ -283,21 +233,19 @@ async def unwatch_repo(installation_id: int, repo_owner: str, repo_name: str):
     try:
         supabase = get_supabase()
        
-        inst = supabase.table("installations")\
-            .select("id")\
-            .eq("github_installation_id", installation_id)\
-            .single()\
-            .execute()
+        inst = await run_query(supabase.table("installations")
+            .select("id")
+            .eq("github_installation_id", installation_id)
+            .single())
         
         if not inst.data:
             raise HTTPException(status_code=404, detail="Installation not found")
         
         
-        supabase.table("watched_repos")\
-            .delete()\
-            .eq("installation_id", inst.data["id"])\
-            .eq("repo_full_name", repo_full_name)\
-            .execute()
+        await run_query(supabase.table("watched_repos")
+            .delete()
+            .eq("installation_id", inst.data["id"])
+            .eq("repo_full_name", repo_full_name))
         
         print(f"Stopped watching: {repo_full_name}")
         
@@ -5,10 +5,13 @@ REST endpoints for querying and managing healing runs.
 Used by the Neural Dashboard to display run history.
 """
 
+import asyncio
+import base64
 from fastapi import APIRouter, HTTPException, Query
-from typing import Optional, List
+from typing import Optional, List, Tuple
 from pydantic import BaseModel
 from datetime import datetime
+from uuid import UUID
 
 from app.db.supabase import (
     get_recent_runs, 
@@ -17,6 +20,8 @@ from app.db.supabase import (
     delete_healing_run,
     HealingRun as DBHealingRun
 )
+from app.core.responses import MsgspecJSONResponse
+from app.core.event_bus import get_event_bus
 
 router = APIRouter(prefix="/runs", tags=["Healing Runs"])
 
@@ -43,44 +48,71 @@ class RunStatsResponse(BaseModel):
 class RunListResponse(BaseModel):
     runs: List[RunResponse]
     total: int
+    next_cursor: Optional[str] = None
+
+
+def _run_response(run: DBHealingRun) -> dict:
+    """RunResponse-shaped dict. DB rows are already well-formed, so they skip model validation."""
+    return {
+        "id": run.id,
+        "run_id": run.run_id,
+        "repo_full_name": run.repo_full_name,
+        "status": run.status,
+        "error_type": run.error_type,
+        "patient_zero": run.patient_zero,
+        "pr_url": run.pr_url,
+        "started_at": run.started_at,
+        "completed_at": run.completed_at,
+    }
+
+
+def _encode_cursor(run: DBHealingRun) -> Optional[str]:
+    """URL-safe base64 of "<started_at>|<id>" for the last run on a page."""
+    if not run.started_at or not run.id:
+        return None
+    raw = f"{run.started_at}|{run.id}".encode()
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode("ascii")
+
+
+def _parse_cursor(cursor: str) -> Tuple[datetime, UUID]:
+    """Inverse of _encode_cursor; 400 on anything that doesn't round-trip."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        started_at, _, run_pk = raw.partition("|")
+        return datetime.fromisoformat(started_at), UUID(run_pk)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
 
 
 @router.get("/", response_model=RunListResponse)
 async def list_runs(
     repo: Optional[str] = Query(None, description="Filter by repository"),
     status: Optional[str] = Query(None, description="Filter by status"),
-    limit: int = Query(20, ge=1, le=100, description="Number of runs to return")
+    limit: int = Query(20, ge=1, le=100, description="Number of runs to return"),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page")
 ):
     """
     List recent healing runs with optional filters.
     """
+    after = _parse_cursor(cursor) if cursor else None
     try:
         runs = await get_recent_runs(
             repo_full_name=repo,
             status=status,
-            limit=limit
+            limit=limit,
+            after=after
         )
         
-        return RunListResponse(
-            runs=[
-                RunResponse(
-                    id=r.id,
-                    run_id=r.run_id,
-                    repo_full_name=r.repo_full_name,
-                    status=r.status,
-                    error_type=r.error_type,
-                    patient_zero=r.patient_zero,
-                    pr_url=r.pr_url,
-                    started_at=r.started_at,
-                    completed_at=r.completed_at,
-                )
-                for r in runs
-            ],
-            total=len(runs)
-        )
+        next_cursor = _encode_cursor(runs[-1]) if len(runs) == limit else None
+        
+        return MsgspecJSONResponse({
+            "runs": [_run_response(r) for r in runs],
+            "total": len(runs),
+            "next_cursor": next_cursor,
+        })
     except Exception as e:
 
-        return RunListResponse(runs=[], total=0)
+        return MsgspecJSONResponse({"runs": [], "total": 0, "next_cursor": None})
 
 
 @router.get("/stats", response_model=RunStatsResponse)
@@ -91,10 +123,9 @@ async def get_stats(
     Get aggregate statistics for healing runs.
     """
     try:
-        stats = await get_run_stats(installation_id)
-        return RunStatsResponse(**stats)
+        return MsgspecJSONResponse(await get_run_stats(installation_id))
     except Exception:
-        return RunStatsResponse(total=0, success=0, failure=0, running=0, success_rate=0)
+        return MsgspecJSONResponse({"total": 0, "success": 0, "failure": 0, "running": 0, "success_rate": 0})
 
 
 @router.get("/{run_id}", response_model=RunResponse)
@@ -107,17 +138,7 @@ async def get_run(run_id: str):
         if not run:
             raise HTTPException(status_code=404, detail="Run not found")
         
-        return RunResponse(
-            id=run.id,
-            run_id=run.run_id,
-            repo_full_name=run.repo_full_name,
-            status=run.status,
-            error_type=run.error_type,
-            patient_zero=run.patient_zero,
-            pr_url=run.pr_url,
-            started_at=run.started_at,
-            completed_at=run.completed_at,
-        )
+        return MsgspecJSONResponse(_run_response(run))
     except HTTPException:
         raise
     except Exception as e:
@@ -147,19 +168,20 @@ async def get_run_details(run_id: str):
         Look for metadata.visual_capture_log
     """
     try:
-        run = await get_healing_run(run_id)
+        from app.db.supabase import get_supabase, run_query
+        supabase = get_supabase()
+        
+        # Independent lookups; overlap the two round trips
+        run, events_result = await asyncio.gather(
+            get_healing_run(run_id),
+            run_query(supabase.table("healing_events")
+                .select("event_type, title, description, metadata, created_at")
+                .eq("run_id", run_id)
+                .order("created_at"))
+        )
         if not run:
             raise HTTPException(status_code=404, detail="Run not found")
         
-       
-        from app.db.supabase import get_supabase
-        supabase = get_supabase()
-        events_result = supabase.table("healing_events")\
-            .select("event_type, title, description, metadata, created_at")\
-            .eq("run_id", run_id)\
-            .order("created_at")\
-            .execute()
-        
         events = events_result.data or []
         
         return {
@@ -187,19 +209,37 @@ async def get_latest_active():
     Get the most recently started active run.
     Used by dashboard to auto-subscribe to SSE.
     """
+    # Redis holds the answer between run starts and ends; the DB is the fallback
+    bus = None
+    try:
+        bus = await get_event_bus()
+        cached = await bus.get_active_run()
+        if cached is not None:
+            return cached
+    except Exception as e:
+        print(f"Active run cache unavailable: {e}")
+    
     try:
         runs = await get_recent_runs(status="running", limit=1)
         if runs:
             run = runs[0]
-            return {
+            payload = {
                 "run_id": run.run_id,
                 "repo": run.repo_full_name,
                 "started_at": run.started_at,
                 "stream_url": f"/events/stream/{run.run_id}"
             }
-        return {"run_id": None, "message": "No active runs"}
+        else:
+            payload = {"run_id": None, "message": "No active runs"}
     except Exception:
         return {"run_id": None, "message": "Database not configured"}
+    
+    if bus is not None:
+        try:
+            await bus.cache_active_run(payload)
+        except Exception:
+            pass
+    return payload
 
 
 @router.delete("/{run_id}")
@@ -237,8 +277,8 @@ async def allow_retry(run_id: str):
             raise HTTPException(status_code=404, detail="Run not found")
         
     
-        from app.core.agent import RETRY_ALLOWED_REPOS
-        RETRY_ALLOWED_REPOS.add(run.repo_full_name)
+        bus = await get_event_bus()
+        await bus.allow_retry(run.repo_full_name)
         
         return {
             "success": True,
@@ -3,12 +3,83 @@ Stats API for real-time TALOS metrics.
 Returns actual healing statistics from the database.
 """
 
+import asyncio
 from fastapi import APIRouter
-from app.db.supabase import get_supabase
+from app.db.supabase import get_supabase, run_query, get_run_stats
+from app.db.cache import cached, cached_many, cache_stats, STATS_KEY, RECENT_KEY
 
 router = APIRouter(prefix="/stats", tags=["stats"])
 
 
+# Run writes invalidate both; the TTLs only catch changes made outside the app
+STATS_CACHE_SECONDS = 60
+RECENT_CACHE_SECONDS = 30
+
+
+async def _compute_stats() -> dict:
+    supabase = get_supabase()
+    # One aggregate for both counts, overlapped with the boot-time sample
+    run_stats, boot_events = await asyncio.gather(
+        get_run_stats(),
+        run_query(supabase.table("healing_events")
+            .select("metadata")
+            .eq("event_type", "sandbox_ready")
+            .limit(100)),
+        return_exceptions=True
+    )
+    if isinstance(run_stats, Exception):
+        raise run_stats
+    total_count = run_stats["total"]
+    success_count = run_stats["success"]
+
+    fix_rate = round((success_count / total_count * 100) if total_count > 0 else 0, 1)
+    
+    avg_boot_time = 150  
+    try:
+        if isinstance(boot_events, Exception):
+            raise boot_events
+        
+        boot_times = []
+        for event in (boot_events.data or []):
+            meta = event.get("metadata", {})
+            if isinstance(meta, dict) and "boot_time_ms" in meta:
+                boot_times.append(meta["boot_time_ms"])
+        
+        if boot_times:
+            avg_boot_time = round(sum(boot_times) / len(boot_times))
+    except Exception:
+        pass  
+    
+    return {
+        "avg_boot_time_ms": avg_boot_time,
+        "fix_rate_percent": fix_rate,
+        "total_heals": total_count,
+        "successful_heals": success_count,
+        "retry_limit": 3,  
+    }
+
+
+async def _fetch_recent() -> dict:
+    recent_runs = await run_query(get_supabase().table("healing_runs")
+        .select("id, run_id, repo_full_name, status, error_type, started_at, completed_at")
+        .order("started_at", desc=True)
+        .limit(10))
+    return {
+        "recent_runs": recent_runs.data or [],
+    }
+
+
+def _stats_unavailable(e: Exception) -> dict:
+    return {
+        "avg_boot_time_ms": 150,
+        "fix_rate_percent": 0,
+        "total_heals": 0,
+        "successful_heals": 0,
+        "retry_limit": 3,
+        "error": str(e) if str(e) else "Database not configured"
+    }
+
+
 @router.get("/")
 async def get_stats():
     """
@@ -20,55 +91,11 @@ async def get_stats():
     - retry_limit: Max retry attempts (constant)
     """
     try:
-        supabase = get_supabase()
-        total_runs = supabase.table("healing_runs").select("id", count="exact").execute()
-        total_count = total_runs.count or 0
-
-        success_runs = supabase.table("healing_runs")\
-            .select("id", count="exact")\
-            .eq("status", "success")\
-            .execute()
-        success_count = success_runs.count or 0
-
-        fix_rate = round((success_count / total_count * 100) if total_count > 0 else 0, 1)
-        
-        avg_boot_time = 150  
-        try:
-            boot_events = supabase.table("healing_events")\
-                .select("metadata")\
-                .eq("event_type", "sandbox_ready")\
-                .limit(100)\
-                .execute()
-            
-            boot_times = []
-            for event in (boot_events.data or []):
-                meta = event.get("metadata", {})
-                if isinstance(meta, dict) and "boot_time_ms" in meta:
-                    boot_times.append(meta["boot_time_ms"])
-            
-            if boot_times:
-                avg_boot_time = round(sum(boot_times) / len(boot_times))
-        except Exception:
-            pass  
-        
-        return {
-            "avg_boot_time_ms": avg_boot_time,
-            "fix_rate_percent": fix_rate,
-            "total_heals": total_count,
-            "successful_heals": success_count,
-            "retry_limit": 3,  
-        }
+        return await cached(STATS_KEY, STATS_CACHE_SECONDS, _compute_stats)
     
     except Exception as e:
         
-        return {
-            "avg_boot_time_ms": 150,
-            "fix_rate_percent": 0,
-            "total_heals": 0,
-            "successful_heals": 0,
-            "retry_limit": 3,
-            "error": str(e) if str(e) else "Database not configured"
-        }
+        return _stats_unavailable(e)
 
 
 @router.get("/recent")
@@ -77,15 +104,34 @@ async def get_recent_activity():
     Get recent healing activity for live dashboard.
     """
     try:
-        supabase = get_supabase()
-        recent_runs = supabase.table("healing_runs")\
-            .select("id, repo_full_name, status, error_type, created_at, updated_at")\
-            .order("created_at", desc=True)\
-            .limit(10)\
-            .execute()
-        
-        return {
-            "recent_runs": recent_runs.data or [],
-        }
+        return await cached(RECENT_KEY, RECENT_CACHE_SECONDS, _fetch_recent)
     except Exception:
         return {"recent_runs": []}
+
+
+@router.get("/dashboard")
+async def get_dashboard():
+    """
+    Stats and recent activity in one response, so a dashboard refresh
+    is a single request. Both halves come from the same caches as
+    /stats and /stats/recent, read in one Redis round trip.
+    """
+    results = await cached_many({
+        STATS_KEY: (STATS_CACHE_SECONDS, _compute_stats),
+        RECENT_KEY: (RECENT_CACHE_SECONDS, _fetch_recent),
+    })
+    stats, recent = results[STATS_KEY], results[RECENT_KEY]
+    if isinstance(stats, Exception):
+        stats = _stats_unavailable(stats)
+    if isinstance(recent, Exception):
+        recent = {"recent_runs": []}
+    return {"stats": stats, **recent}
+
+
+@router.get("/cache")
+async def get_cache_stats():
+    """
+    Hit/miss counters for the dashboard caches in this worker.
+    Useful for checking the caches absorb polling and for tuning TTLs.
+    """
+    return {"caches": cache_stats()}
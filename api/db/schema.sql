@@ -70,8 +70,13 @@ CREATE TABLE IF NOT EXISTS healing_runs (
 
 CREATE INDEX IF NOT EXISTS idx_runs_status ON healing_runs(status);
 CREATE INDEX IF NOT EXISTS idx_runs_repo ON healing_runs(repo_full_name);
-CREATE INDEX IF NOT EXISTS idx_runs_started ON healing_runs(started_at DESC);
+-- Covers /stats/recent, so the newest runs come from an index-only scan
+CREATE INDEX IF NOT EXISTS idx_runs_started_recent ON healing_runs(started_at DESC)
+    INCLUDE (id, run_id, repo_full_name, status, error_type, completed_at);
+DROP INDEX IF EXISTS idx_runs_started;
 CREATE INDEX IF NOT EXISTS idx_runs_run_id ON healing_runs(run_id);
+CREATE INDEX IF NOT EXISTS idx_runs_installation_started 
+    ON healing_runs(installation_id, started_at DESC);
 
 
 CREATE TABLE IF NOT EXISTS healing_events (
@@ -84,9 +89,26 @@ CREATE TABLE IF NOT EXISTS healing_events (
     created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
 );
 
-CREATE INDEX IF NOT EXISTS idx_events_run_id ON healing_events(run_id);
+-- Serves the per-run timeline (WHERE run_id ORDER BY created_at) without a sort.
+-- description stays out of INCLUDE: it can exceed the btree row size limit.
+-- On a large existing table, run this one on its own with CREATE INDEX CONCURRENTLY.
+CREATE INDEX IF NOT EXISTS idx_events_run_created 
+    ON healing_events(run_id, created_at) INCLUDE (event_type, title);
+DROP INDEX IF EXISTS idx_events_run_id;
 CREATE INDEX IF NOT EXISTS idx_events_type ON healing_events(event_type);
 
+-- Dashboard counters in one round trip: supabase.rpc("get_healing_stats")
+CREATE OR REPLACE FUNCTION get_healing_stats(p_installation_id UUID DEFAULT NULL)
+RETURNS TABLE (total BIGINT, success BIGINT, failure BIGINT, running BIGINT)
+LANGUAGE sql STABLE AS $$
+    SELECT COUNT(*),
+           COUNT(*) FILTER (WHERE status = 'success'),
+           COUNT(*) FILTER (WHERE status = 'failure'),
+           COUNT(*) FILTER (WHERE status = 'running')
+    FROM healing_runs
+    WHERE p_installation_id IS NULL OR installation_id = p_installation_id;
+$$;
+
 CREATE OR REPLACE FUNCTION update_updated_at_column()
 RETURNS TRIGGER AS $$
 BEGIN
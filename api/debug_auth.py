@@ -7,6 +7,8 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
+_BASE_GH_HEADERS = {"Accept": "application/vnd.github.v3+json"}
+
 async def test_auth():
     print("\nTALOS AUTH DEBUGGER")
     print("=======================")
@@ -28,10 +30,11 @@ async def test_auth():
         return
 
     try:
-        with open(key_path, 'r') as f:
+        with open(key_path, 'rb') as f:
             private_key = f.read()
-        print(f"Key Loaded: {len(private_key)} chars")
-        print(f"   Header: {private_key.splitlines()[0]}")
+        print(f"Key Loaded: {len(private_key)} bytes")
+        header = private_key.partition(b"\n")[0]
+        print(f"   Header: {header.decode('ascii', 'replace')}")
     except Exception as e:
         print(f"Error reading key: {e}")
         return
@@ -53,10 +56,7 @@ async def test_auth():
         return
 
     print("\n📡 Connecting to GitHub API...")
-    headers = {
-        "Authorization": f"Bearer {encoded_jwt}",
-        "Accept": "application/vnd.github.v3+json"
-    }
+    headers = {**_BASE_GH_HEADERS, "Authorization": f"Bearer {encoded_jwt}"}
     
     async with httpx.AsyncClient(timeout=30.0) as client:
        
@@ -0,0 +1,70 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+from uuid import UUID, uuid4
+
+import msgspec
+import pytest
+from fastapi import HTTPException
+
+import app.db.supabase as db
+from app.routes import runs
+
+
+class FakePool:
+    """Just enough of asyncpg.Pool.fetch for get_recent_runs' keyset query."""
+
+    def __init__(self, rows):
+        self.rows = sorted(rows, key=lambda r: (r["started_at"], r["id"]), reverse=True)
+
+    async def fetch(self, sql, *args):
+        rows = self.rows
+        if "(started_at, id) <" in sql:
+            started_at, run_pk = args[-3], args[-2]
+            # asyncpg only accepts these types for timestamptz / uuid parameters
+            assert isinstance(started_at, datetime)
+            assert isinstance(run_pk, UUID)
+            rows = [r for r in rows if (r["started_at"], r["id"]) < (started_at, run_pk)]
+        return rows[:args[-1]]
+
+
+def _rows(n):
+    base = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    return [
+        {"id": uuid4(), "run_id": f"run{i}", "repo_full_name": "acme/app", "status": "success",
+         "started_at": base + timedelta(minutes=i)}
+        for i in range(n)
+    ]
+
+
+async def _page(cursor=None):
+    response = await runs.list_runs(repo=None, status=None, limit=2, cursor=cursor)
+    return msgspec.json.decode(response.body)
+
+
+def test_list_runs_walks_pages_by_cursor(monkeypatch):
+    pool = FakePool(_rows(5))
+
+    async def get_pool():
+        return pool
+    monkeypatch.setattr(db, "get_pool", get_pool)
+
+    async def walk():
+        first = await _page()
+        second = await _page(first["next_cursor"])
+        third = await _page(second["next_cursor"])
+        return first, second, third
+
+    first, second, third = asyncio.run(walk())
+
+    assert [r["run_id"] for r in first["runs"]] == ["run4", "run3"]
+    assert [r["run_id"] for r in second["runs"]] == ["run2", "run1"]
+    assert [r["run_id"] for r in third["runs"]] == ["run0"]
+    assert third["next_cursor"] is None
+    # Safe to drop into a query string without percent-encoding
+    assert all(c.isalnum() or c in "-_" for c in first["next_cursor"])
+
+
+def test_invalid_cursor_is_rejected():
+    with pytest.raises(HTTPException) as exc:
+        runs._parse_cursor("not-a-cursor")
+    assert exc.value.status_code == 400
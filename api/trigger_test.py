@@ -1,5 +1,4 @@
 import hmac
-import hashlib
 import json
 import os
 import httpx 
@@ -11,6 +10,12 @@ load_dotenv()
 
 TARGET_URL = "http://localhost:8000/webhook"
 SECRET = os.getenv("GITHUB_WEBHOOK_SECRET")
+_SECRET_BYTES = SECRET.encode("utf-8") if SECRET else None
+
+_BASE_HEADERS = {
+    "Content-Type": "application/json",
+    "X-GitHub-Event": "workflow_run",
+}
 
 payload = {
     "action": "completed",
@@ -30,29 +35,20 @@ payload = {
 }
 
 async def send_trigger():
-    payload_bytes = json.dumps(payload).encode('utf-8')
+    payload_bytes = json.dumps(payload, separators=(',', ':')).encode('utf-8')
 
     if not SECRET:
         print("Error: GITHUB_WEBHOOK_SECRET is missing in .env")
         exit(1)
 
-    hash_object = hmac.new(
-        key=SECRET.encode("utf-8"),
-        msg=payload_bytes,
-        digestmod=hashlib.sha256
-    )
-    signature = f"sha256={hash_object.hexdigest()}"
+    signature = f"sha256={hmac.digest(_SECRET_BYTES, payload_bytes, 'sha256').hex()}"
 
     print(f"Sending Mock Webhook to {TARGET_URL}...")
     try:
         async with httpx.AsyncClient() as client:
             response = await client.post(
                 TARGET_URL,
-                headers={
-                    "Content-Type": "application/json",
-                    "X-GitHub-Event": "workflow_run",
-                    "X-Hub-Signature-256": signature
-                },
+                headers={**_BASE_HEADERS, "X-Hub-Signature-256": signature},
                 content=payload_bytes
             )
             print(f"Response: {response.status_code}")
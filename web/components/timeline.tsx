@@ -174,7 +174,7 @@ function TimelineEventCard({ event, isLatest }: { event: TimelineEvent; isLatest
                 Visual Capture
               </div>
               <img
-                src={`data:image/png;base64,${event.metadata.screenshot_base64}`}
+                src={`data:${event.metadata.screenshot_mime_type ?? "image/png"};base64,${event.metadata.screenshot_base64}`}
                 alt="Screenshot"
                 className="w-full h-auto rounded-lg"
               />